@@ -0,0 +1,437 @@
+"""
+CAPE Recloser Setting Coordination Aide - benchmarks
+
+Times curve parsing, interpolation, single coordination studies and batch
+    sweeps against synthetic curve libraries, so changes to the coordinator
+    can be checked for speed regressions.
+
+Synthetic breaker, fuse and recloser files are written in the same CAPE
+    formats as breakerCurves, fuseCurves and recloserCurves (numbered
+    EX-INV_* style breaker rows, SM-4_* style fuse files in seconds and kyle*
+    style recloser files in multiples of pickup), into a temporary folder.
+    Nothing is read from or written to the real curve folders, and no network
+    access is needed.
+
+usage:
+    python RecloserBenchmark.py --out bench.json
+    python RecloserBenchmark.py --quick --compare bench.json
+
+"""
+
+import sys
+import os
+import argparse
+import importlib.util
+import json
+import math
+import platform
+import random
+import tempfile
+import time
+
+#the coordinator lives in a file with a version number in its name, so it
+#can't be imported the usual way
+coordinatorPath = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'RecloserCoordinator_v0.2.py')
+
+def main():
+    options = parseArgs(sys.argv[1:])
+    rc = loadCoordinator()
+    random.seed(options.seed)
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as libraryDir:
+        for curveCount in options.curves:
+            for pointCount in options.points:
+                makeLibrary(libraryDir, curveCount, pointCount)
+                useLibrary(rc, libraryDir)
+
+                print("== {0} curves x {1} points".format(curveCount, pointCount))
+                results += benchParsing(rc, libraryDir, curveCount, 
+                                        pointCount, options)
+                results += benchInterpolation(rc, libraryDir, curveCount, 
+                                              pointCount, options)
+                results += benchStudies(rc, libraryDir, curveCount, 
+                                        pointCount, options)
+                results += benchBatch(rc, libraryDir, curveCount, 
+                                      pointCount, options)
+
+    report = {'meta': getMeta(rc, options), 'results': results}
+
+    with open(options.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("\nResults written to {0}".format(options.out))
+
+    if options.compare:
+        compareResults(options.compare, results)
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser(description="Benchmark the recloser "
+                                                 "coordinator on synthetic "
+                                                 "curve libraries")
+    parser.add_argument('--curves', default='38,200,1000',
+                        help="recloser curve counts (default: 38,200,1000)")
+    parser.add_argument('--points', default='50,200',
+                        help="points per curve (default: 50,200)")
+    parser.add_argument('--pickups', default='50-700,20-2000',
+                        help="pickup ranges in amps (default: 50-700,20-2000)")
+    parser.add_argument('--steps', default='5,1',
+                        help="pickup steps in amps (default: 5,1)")
+    parser.add_argument('--engines', default='numpy,exact,loop',
+                        help="engines to time (default: numpy,exact,loop)")
+    parser.add_argument('--studies', type=int, default=20,
+                        help="studies per batch sweep (default: 20)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="best of this many runs (default: 3)")
+    parser.add_argument('--max-estimate', type=float, default=20,
+                        help="skip engine runs estimated to take longer than "
+                             "this many seconds (default: 20)")
+    parser.add_argument('--quick', action='store_true',
+                        help="small sizes only, for a fast sanity check")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default='bench_output.json',
+                        help="results file (default: bench_output.json)")
+    parser.add_argument('--compare', metavar='PREVIOUS',
+                        help="earlier results file to compare against")
+    options = parser.parse_args(args)
+
+    if options.quick:
+        options.curves = '38'
+        options.points = '50'
+        options.pickups = '50-700'
+        options.steps = '5'
+        options.studies = 5
+        options.repeat = 1
+
+    options.curves = [int(n) for n in options.curves.split(',')]
+    options.points = [int(n) for n in options.points.split(',')]
+    options.pickups = [tuple(int(a) for a in r.split('-'))
+                       for r in options.pickups.split(',')]
+    options.steps = [int(n) for n in options.steps.split(',')]
+    options.engines = options.engines.split(',')
+    return options
+
+#import the coordinator script as a module
+def loadCoordinator():
+    spec = importlib.util.spec_from_file_location('RecloserCoordinator',
+                                                  coordinatorPath)
+    rc = importlib.util.module_from_spec(spec)
+    #registered so worker processes can find the module's functions
+    sys.modules['RecloserCoordinator'] = rc
+    spec.loader.exec_module(rc)
+    return rc
+
+#settings for benchmarking a synthetic library
+def useLibrary(rc, libraryDir):
+    #timed runs repeat the same studies, so stored results would only hide
+    #the sweeps being measured
+    rc.useResultCache = False
+
+#===========================
+#synthetic curve generation
+#===========================
+
+#write a fresh synthetic library: recloserCount recloser curves, plus a
+#handful of fuses and breakers to coordinate against
+def makeLibrary(libraryDir, recloserCount, pointCount):
+    for folder in ('breakerCurves', 'fuseCurves', 'recloserCurves'):
+        path = os.path.join(libraryDir, folder)
+        os.makedirs(path, exist_ok=True)
+        for fileName in os.listdir(path):
+            os.remove(os.path.join(path, fileName))
+    cachePath = os.path.join(libraryDir, 'curveCache.bin')
+    if os.path.exists(cachePath): os.remove(cachePath)
+
+    for n in range(recloserCount):
+        writeRecloserFile(os.path.join(libraryDir, 'recloserCurves',
+                                       'kyle{0:04}'.format(n)), n, pointCount)
+
+    for rating in (10, 25, 40, 65, 100, 140, 200):
+        for curve in ('MM', 'TC'):
+            writeFuseFile(os.path.join(libraryDir, 'fuseCurves',
+                                       'SYN_{0}E_{1}'.format(rating, curve)),
+                          rating, curve, pointCount)
+
+    for pickup in (360, 528, 720):
+        writeBreakerFile(os.path.join(libraryDir, 'breakerCurves',
+                                      'EX-INV_SYN-{0}'.format(pickup)),
+                         pickup, pointCount)
+
+#inverse time curve, t = a / (M^p - 1) + b, with M in multiples of pickup
+def inverseTime(multiple, a, p, b):
+    return a / (math.pow(multiple, p) - 1) + b
+
+#recloser curves run from just over 1x to 100x pickup, in seconds, like the
+#kyle* files. the first point is nudged off 1x so the curve stays finite
+def writeRecloserFile(path, n, pointCount):
+    a = random.uniform(0.05, 30.0)
+    p = random.uniform(0.5, 2.5)
+    b = random.uniform(0.01, 0.2)
+
+    lines = ["plotrd", "tcc", "seconds",
+             "' DEVICE: Synthetic RECLOSER '",
+             "' CURVE ID: {0}'".format(n), "'  '"]
+    for multiple in logSpace(1.05, 100.0, pointCount):
+        lines.append("{0:10.3f}{1:10.3f}".format(multiple,
+                                                 inverseTime(multiple, a, p, b)))
+    lines += ["X", "return"]
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+#fuse curves are in amps and seconds, like the SM-4_* files. minimum melt
+#is a little faster than total clear
+def writeFuseFile(path, rating, curve, pointCount):
+    meltAmps = rating * 2.0
+    scale = 0.8 if curve == 'MM' else 1.0
+
+    lines = ["PLOTRD", "TCC", "SECONDS",
+             "'Synthetic {0}E_{1}'".format(rating, curve)]
+    for multiple in logSpace(1.02, 60.0, pointCount):
+        seconds = scale * inverseTime(multiple, 8.0, 2.0, 0.01)
+        lines.append(" {0:.4g}  {1:.4g}".format(meltAmps * multiple, seconds))
+    lines += ["X", "RETURN"]
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+#breaker curves are numbered rows in primary amps and cycles, like the
+#EX-INV_* files
+def writeBreakerFile(path, pickup, pointCount):
+    lines = ["No. CURRENT(P.AMPS) TIME   (CYCLES)",
+             "--- --------------- ---------------"]
+    for i, multiple in enumerate(logSpace(1.0, 45.0, pointCount)):
+        cycles = 60 * inverseTime(multiple * 1.02, 28.0, 2.0, 0.5)
+        lines.append("{0:<3}{1:16.3f}{2:16.3f}".format(i + 1, pickup * multiple,
+                                                       cycles))
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+#count log-spaced values from low to high
+def logSpace(low, high, count):
+    step = math.log10(high / low) / (count - 1)
+    return [low * math.pow(10, i * step) for i in range(count)]
+
+#===========================
+#benchmarks
+#===========================
+
+#rough run time of one study, from per-unit costs measured on a desktop.
+#only used to skip sizes that would take forever
+def estimateSeconds(engine, curveCount, pointCount, candidates):
+    if engine == 'loop': return 1.5e-6 * candidates * pointCount
+    if engine == 'numpy': return 5e-7 * candidates * pointCount
+    #the exact engine pairs every point of one curve with every segment of
+    #the other, and doesn't depend on the pickup step
+    return 8e-7 * curveCount * 4 * pointCount**2
+
+#best wall time of a few runs of func()
+def timeBest(func, repeat):
+    best = math.inf
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def record(name, seconds, **params):
+    print("  {0:<28} {1:10.4f} s  {2}".format(name, seconds, params))
+    return {'name': name, 'seconds': seconds, 'params': params}
+
+#raw parsing of every file, and loading the library cold and from the cache
+def benchParsing(rc, libraryDir, curveCount, pointCount, options):
+    results = []
+    size = {'curves': curveCount, 'points': pointCount}
+
+    curvePaths = rc.getCurvePaths(libraryDir)
+    cachePath = os.path.join(libraryDir, rc.curveCacheName)
+    curveFileLists = rc.getCurveLists(curvePaths)
+
+    rawFiles = []
+    for typeCode, curveType in enumerate(rc.curveTypes):
+        for curveName in curveFileLists[typeCode]:
+            with open(os.path.join(curvePaths[curveType], curveName)) as f:
+                rawFiles.append([curveType] + f.readlines())
+
+    def parseAll():
+        for curveFile in rawFiles:
+            rc.parseCurveFile(curveFile)
+    results.append(record('parseCurveFile', timeBest(parseAll, options.repeat),
+                          files=len(rawFiles), **size))
+
+    def processAll():
+        for curveFile in rawFiles:
+            if curveFile[0] != 'breaker': rc.processCurveFile(curveFile, 'r')
+    results.append(record('processCurveFile',
+                          timeBest(processAll, options.repeat), **size))
+
+    def loadCold():
+        if os.path.exists(cachePath): os.remove(cachePath)
+        rc.loadCurveLibrary(curveFileLists, curvePaths, cachePath)
+    results.append(record('loadCurveLibrary cold',
+                          timeBest(loadCold, options.repeat), **size))
+
+    def loadCached():
+        rc.loadCurveLibrary(curveFileLists, curvePaths, cachePath)
+    loadCached()
+    results.append(record('loadCurveLibrary cached',
+                          timeBest(loadCached, options.repeat), **size))
+
+    return results
+
+#interpolateTime() and testCoord() on their own
+def benchInterpolation(rc, libraryDir, curveCount, pointCount, options):
+    results = []
+    size = {'curves': curveCount, 'points': pointCount}
+    downstreamCurve, upstreamCurve, recloserCurves = loadStudyCurves(rc, 
+                                                            libraryDir)
+
+    curve = recloserCurves[0].scaled(100)
+    low, high = curve[0][0], curve[-1][0]
+    queries = [random.uniform(low, high) for i in range(20000)]
+
+    def interpolateAll():
+        for query in queries:
+            rc.interpolateTime(curve, query)
+    seconds = timeBest(interpolateAll, options.repeat)
+    results.append(record('interpolateTime', seconds,
+                          calls=len(queries), **size))
+
+    testCurves = [recloserCurve.scaled(100)
+                  for recloserCurve in recloserCurves[:50]]
+    def testAll():
+        for testCurve in testCurves:
+            rc.testCoord(testCurve, downstreamCurve, 0, 'u', 1e9)
+            rc.testCoord(upstreamCurve, testCurve, 0, 'u', 1e9)
+    results.append(record('testCoord', timeBest(testAll, options.repeat),
+                          calls=2*len(testCurves), **size))
+
+    return results
+
+#a single study for each engine, pickup range and step
+def benchStudies(rc, libraryDir, curveCount, pointCount, options):
+    results = []
+    coordCurves = loadStudyCurves(rc, libraryDir)
+
+    for engine in options.engines:
+        if engine == 'numpy' and rc.np is None: continue
+        for pickupMin, pickupMax in options.pickups:
+            for step in options.steps:
+                #the exact engine doesn't step, so one run per range will do
+                if engine == 'exact' and step != options.steps[0]: continue
+                candidates = curveCount * ((pickupMax - pickupMin) // step + 1)
+                if estimateSeconds(engine, curveCount, pointCount, 
+                                   candidates) > options.max_estimate:
+                    print("  getSolutions {0:<15} skipped, too slow at this "
+                          "size".format(engine))
+                    continue
+
+                rc.coordEngine = engine
+                rc.ampStep = step
+                coordAmps = (pickupMin, pickupMax, 20000)
+
+                #every timed run starts from an empty margin cache
+                def solveCold():
+                    rc.marginCache.clear()
+                    rc.getSolutions(coordCurves, coordAmps, 12)
+                seconds = timeBest(solveCold, options.repeat)
+                results.append(record('getSolutions ' + engine, seconds,
+                                      curves=curveCount, points=pointCount,
+                                      pickupMin=pickupMin, pickupMax=pickupMax,
+                                      step=step if engine != 'exact' else None,
+                                      candidates=candidates))
+
+                #what-if re-runs with a new time and current cap, once a
+                #first re-run has filled the margin cache
+                if engine == 'numpy':
+                    rc.getSolutions(coordCurves, coordAmps, 12, 
+                                    cacheMargins=True)
+                    def requery():
+                        for minCoordTime in (6, 20):
+                            rc.getSolutions(coordCurves, (pickupMin, pickupMax,
+                                                          10000), minCoordTime,
+                                            cacheMargins=True)
+                    seconds = timeBest(requery, options.repeat) / 2
+                    results.append(record('getSolutions numpy requery', seconds,
+                                          curves=curveCount, points=pointCount,
+                                          pickupMin=pickupMin, 
+                                          pickupMax=pickupMax, step=step,
+                                          candidates=candidates))
+
+    return results
+
+#a batch of studies over different fuses and coordination times
+def benchBatch(rc, libraryDir, curveCount, pointCount, options):
+    results = []
+    coordinator = rc.Coordinator(rc.CurveLibrary(libraryDir))
+    curveFileLists = coordinator.library.curveFileLists
+
+    studies = []
+    for n in range(options.studies):
+        studies.append({'name': 'study {0}'.format(n),
+                        'downstream': random.choice(curveFileLists[1]),
+                        'upstream': random.choice(curveFileLists[0]),
+                        'pickupMin': 50, 'pickupMax': 700,
+                        'coordMaxAmps': random.choice([5000, 10000, 20000]),
+                        'minCoordTime': random.choice([6, 12, 20])})
+
+    for engine in options.engines:
+        if engine == 'numpy' and rc.np is None: continue
+        candidates = curveCount * 131
+        if estimateSeconds(engine, curveCount, pointCount, 
+                           candidates) * len(studies) > options.max_estimate:
+            print("  batch {0:<22} skipped, too slow at this "
+                  "size".format(engine))
+            continue
+        rc.coordEngine = engine
+        rc.ampStep = 5
+
+        def runAll():
+            rc.marginCache.clear()
+            for n, study in enumerate(studies):
+                coordinator.runStudy(study, n)
+        results.append(record('batch ' + engine,
+                              timeBest(runAll, options.repeat),
+                              curves=curveCount, points=pointCount,
+                              studies=len(studies)))
+
+    return results
+
+#compiled curves for a typical study: the 100E total clear fuse downstream,
+#the 528 A breaker upstream and the whole recloser library
+def loadStudyCurves(rc, libraryDir):
+    library = rc.CurveLibrary(libraryDir)
+    downstreamCurve = library.getCurve('SYN_100E_TC', 'd')
+    upstreamCurve = library.getCurve('EX-INV_SYN-528', 'u')
+    return downstreamCurve, upstreamCurve, list(library.recloserCurves)
+
+def getMeta(rc, options):
+    return {'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': rc.np.__version__ if rc.np is not None else None,
+            'platform': platform.platform(),
+            'seed': options.seed,
+            'repeat': options.repeat}
+
+#print how every result compares with the same benchmark in an earlier run
+def compareResults(previousPath, results):
+    with open(previousPath) as f:
+        previous = json.load(f)['results']
+
+    def key(result):
+        return (result['name'], json.dumps(result['params'], sort_keys=True))
+    previousTimes = {key(result): result['seconds'] for result in previous}
+
+    print("\n== compared with {0}".format(previousPath))
+    for result in results:
+        before = previousTimes.get(key(result))
+        if before is None: continue
+        ratio = result['seconds'] / before if before else math.inf
+        flag = "  << slower" if ratio > 1.2 else ""
+        print("  {0:<28} {1:8.4f} -> {2:8.4f} s  x{3:.2f}{4}".format(
+                result['name'], before, result['seconds'], ratio, flag))
+
+if __name__ == '__main__':
+    main()
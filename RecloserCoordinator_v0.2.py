@@ -11,6 +11,38 @@ v0.2:
     -now does logarithmic interpolation instead of linear
     -option to write solutions to a file
     -minimal devlogging
+v0.3: 
+    -vectorized numpy coordination engine (see coordEngine)
+    -curves are compiled for binary search log interpolation
+    -'exact' engine solves for feasible pickup intervals directly
+    -optional exact margin check over the whole curve overlap (see marginCheck)
+    -parsed curves are kept in a memory-mapped cache file (see curveCacheName)
+    -batch mode for running a file of studies without prompts (see runBatch)
+    -optional worker process pool for sweeps and batches (see workerCount)
+    -dev log replaced by leveled tracing into a ring buffer (see traceLevel)
+    -envelope index rules out hopeless candidates early (see usePruning)
+    -optional sweep over the new recloser's time adder (see adderStep)
+    -margin cache for quick re-runs with a new time or current (see useMarginCache)
+    -study results are remembered on disk between runs (see resultCacheName)
+    -solution ranges can be streamed as the sweep goes (see iterSolutionRanges)
+    -CurveLibrary/Coordinator API with explicit paths, safe to use from threads
+    -compiled curves are flat double arrays, and scaling one is a cheap view
+    -bulk CAPE exports are split into curves in one pass (see exportFolder)
+    -curve files are parsed in a single pass
+    -built-in counters and phase timing for every study (see useProfile)
+    -server mode answers studies over localhost HTTP (see runServer)
+    -margin heat-map reports for every accepted setting (see getMarginReport)
+    -tolerance reports give each setting's chance of miscoordinating when the
+     curves are off by their tolerances (see getToleranceReport)
+    -feeder studies set every open recloser on a feeder at once (see runFeeder)
+    -precomputed coordination table for every fuse and breaker pair, looked
+     up instead of sweeping for studies on its grid (see buildCoordTable)
+    -multi-shot reclose sequences with fuse heating, to check fuse saving
+     (see runSequence)
+    -ranked mode lists only the best settings by margin or pickup headroom,
+     kept in a bounded heap as the sweep goes (see getRankedSolutions)
+    -a curve's pickup ranges are split at gaps instead of merged across them
+    -fixed time constant always being 0 for downstream/upstream reclosers
     
 -NOTE: Curves which coordinate according to curve data may appear not to 
         coordinate in CAPE. Reason being that CAPE always plots the first TCC 
@@ -21,38 +53,293 @@ v0.2:
 
 import sys
 import traceback
+import argparse
+import csv
+import json
 import os
 import glob
 import re
-import copy
 import math
+import bisect
+import hashlib
+import sqlite3
+import time
+import mmap
+import struct
+import zlib
+import array
+import contextlib
+import heapq
+import collections
+import threading
+import multiprocessing
+import http.server
+import urllib.parse
+from multiprocessing import shared_memory
 
+#numpy is optional. without it, only the 'loop' coordination engine is available
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#folder the interactive program and batch mode load their curves from.
+#a CurveLibrary can be pointed anywhere else
 startDir = os.getcwd()
 
-#possible folder paths for curves are below.
-#when adding folder paths, make sure to modify getCurveLists() accordingly
+#curve folders, relative to a library's root folder.
+#when adding folders, make sure to modify curveTypes accordingly
 #processCurveFile() may also need editing, depending on the file format
-fusePath = os.path.join(startDir, 'fuseCurves\\')
-recloserPath = os.path.join(startDir, 'recloserCurves\\')
-breakerPath = os.path.join(startDir, 'breakerCurves\\')
+curveFolders = {'breaker': 'breakerCurves', 'fuse': 'fuseCurves', 
+                'recloser': 'recloserCurves'}
+
+#whole CAPE library exports, each holding any number of PLOTRD curve blocks
+#and breaker point tables, can be dropped in exportFolder instead. their
+#curves join the curve lists under the names in the export (see
+#iterExportCurves). exports are split every time the library is loaded
+exportFolder = 'curveExports'
+
+#parsed curves from all three folders are cached in curveCacheName, in the
+#library's root folder. entries are checked against the size and modification
+#time of their curve file on every load. set useCurveCache to False to parse
+#every curve file from scratch instead
+curveCacheName = 'curveCache.bin'
+useCurveCache = True
+
+#getSolutions() results are kept in an sqlite database, resultCacheName in the
+#library's root folder, keyed by a hash of the corrected curves and every
+#setting that changes the answer. editing a curve file changes its hash, so
+#stale results are never found. the least recently used results are dropped
+#past resultCacheSize. several processes can share the file, and so can
+#several threads. set useResultCache to False to always run the sweep
+resultCacheName = 'resultCache.db'
+resultCacheSize = 10000
+resultCacheVersion = 1
+useResultCache = True
+
+#coordination table (see buildCoordTable). --precompute works out, for every
+#fuse curve downstream of every breaker curve, which recloser curves and
+#pickups coordinate at each of coordTableTimes and coordTableAmps, over the
+#coordTablePickups range at ampStep. a study on that grid, with no time
+#adder, is then looked up in the table (coordTableName in the library's root
+#folder) before the result cache. entries are keyed by the corrected curves,
+#and the whole table by the recloser curves, so a changed curve file just
+#misses. set useCoordTable to False to never read it
+coordTableName = 'coordTable.bin'
+coordTableTimes = (3, 5, 7, 10, 12, 15, 20, 25, 30)
+coordTableAmps = (2000, 3000, 4000, 5000, 6000, 8000, 10000, 12000, 15000,
+                  20000)
+coordTablePickups = (5, 3000)
+useCoordTable = True
+
+#tracing, for debugging. set traceLevel above 0 to record:
+#   1 -> curve data after corrections
+#   2 -> pass/fail and margin of every dvr/rvd/uvr/rvu check
+#   3 -> every point margin and interpolation as well
+#records are (event, curve number, pickup, direction, current, value) tuples
+#kept in a ring buffer of the last traceBufferSize records. they're only
+#formatted when writeTrace() writes them to traceFile. traceFilter can be set
+#to a (curve number, pickup) pair to record nothing but that candidate.
+#with traceLevel at 0, the coordination loops skip tracing entirely
+traceLevel = 0
+traceFilter = None
+traceBufferSize = 100000
+traceFile = 'logFile'
+traceBuffer = collections.deque(maxlen=traceBufferSize)
+
+#coordination engine used by getSolutions():
+#   'loop'  -> tests one recloser curve and pickup current at a time (devlogged)
+#   'numpy' -> tests the whole curve x pickup grid at once (requires numpy)
+#   'exact' -> solves for the exact feasible pickup intervals of every curve,
+#              with no ampStep. solutions come back as [curve, min, max]
+coordEngine = 'numpy'
+
+#how the 'loop' engine checks coordination between two curves:
+#   'points' -> at the data points of each curve, like testCoord() always has
+#   'exact'  -> true minimum of the log-interpolated margin over the whole
+#               overlap, including the worst case between data points.
+#               the 'numpy' engine falls back to the loop engine for this
+marginCheck = 'points'
+
+#step between tested pickup currents, in amps
+ampStep = 5
+
+#step between tested time adders for the new recloser, in cycles. an adder
+#only moves a curve up the time axis, so margins for a curve and pickup are
+#worked out once and every adder is checked against them
+adderStep = 1
+
+#envelope index pruning. every recloser curve gets an envelope of its min and
+#max time over bands of envelopeBandWidth decades of current. candidates the
+#envelope proves can't coordinate are never tested: first the whole curve,
+#then blocks of pruneBlockSize stepped pickups
+usePruning = True
+envelopeBandWidth = 0.05
+pruneBlockSize = 16
+
+#margin cache. the numpy engine keeps the worst margin of every recloser curve
+#and pickup as a step function of the current cap, so re-running a study with
+#only minCoordTime or coordMaxAmps changed is a lookup instead of a sweep.
+#entries are keyed by the contents of the curves, and the least recently used
+#one is dropped after marginCacheSize. filling an entry means sweeping every
+#candidate, with no pruning, since pruning depends on minCoordTime. so the
+#interactive program only uses it for what-if re-runs, and everything else
+#only while useMarginCache is on (say, for batches of studies that share
+#curves and differ in minCoordTime or coordMaxAmps)
+useMarginCache = False
+marginCacheSize = 8
+
+#recloser curves in each piece of a streamed sweep. the ranges of a piece are
+#handed out as soon as it's swept, before the next piece starts
+streamChunkSize = 32
+
+#ranked mode (see getRankedSolutions). instead of every solution, only the
+#rankCount best candidates are kept, by rankScore:
+#   'margin'   -> how far the worse of its downstream and upstream margins is
+#                 over minCoordTime, in cycles
+#   'headroom' -> how far its pickup can move either way, in amps, and still
+#                 coordinate on the same curve, inside the studied range
+#with an adder sweep, each candidate takes the adder with the most margin.
+#rankCount 0 lists every solution
+rankCount = 0
+rankScore = 'margin'
+
+#margin reports (see getMarginReport) check every accepted setting at
+#marginReportPoints fault currents, evenly log spaced from the lowest current
+#of the downstream and upstream curves up to coordMaxAmps
+marginReportPoints = 200
+
+#tolerance reports (see getToleranceReport). in each of toleranceSamples
+#samples, the currents and times of the downstream, upstream and recloser
+#curves are scaled by their own factors of 1 + x, with x drawn from:
+#   ('normal', sd)     -> a normal distribution with that standard deviation
+#   ('uniform', width) -> evenly between -width and +width
+#   None               -> no tolerance
+#every setting is checked against the same samples, and toleranceSeed keeps
+#reports repeatable (None draws new samples every time). samples are split
+#into toleranceBuckets by how far they shift the curves, so the ones that
+#can't fail are skipped a bucket at a time (see foldSampleMargins)
+toleranceSamples = 2000
+toleranceSeed = 0
+toleranceBuckets = 64
+curveTolerances = {'downstream': {'current': ('normal', 0.03),
+                                  'time': ('normal', 0.03)},
+                   'upstream': {'current': ('normal', 0.02),
+                                'time': ('normal', 0.03)},
+                   'recloser': {'current': ('normal', 0.02),
+                                'time': ('normal', 0.03)}}
+
+#feeder studies (see runFeeder and FeederSearch). margins under a parent
+#setting are worked out for feederProbeCount candidates at a time.
+#feederBoundPoints of each candidate's points are used to skip hopeless ones.
+#the search gives up after trying feederSearchLimit candidate settings
+feederProbeCount = 64
+feederBoundPoints = 8
+feederSearchLimit = 200000
+
+#reclose sequence simulation (see runSequence and getSequenceOutcomes). the
+#downstream fuse heats up over each shot by the shot's time over its minimum
+#melt time, and cools over each reclose interval with a time constant of
+#fuseCoolingTime cycles (None keeps all of its heat, the safe side). it's
+#damaged once its heat reaches fuseDamageFactor of melting, the usual 75%
+#rule. every setting is checked at sequencePoints fault currents, evenly log
+#spaced from where the fuse curves start up to coordMaxAmps
+sequencePoints = 100
+fuseDamageFactor = 0.75
+fuseCoolingTime = 1800
+
+#number of worker processes for getSolutions() and batch runs. 1 keeps all
+#the work in this process, 0 means one worker per CPU core
+workerCount = 1
+
+#instrumentation. while useProfile is on, every sweep counts the candidates it
+#tests, the ones that coordinate, and the ones rejected by each check. the
+#check is dvr, rvd, uvr or rvu (the first to fail), or just down or up where
+#an engine only keeps the worse margin of each pair. margin checks and
+#interpolations are counted too, plus wall time per phase and per recloser
+#curve. counts are added once per check, grid or curve, so it's cheap enough
+#to leave on. see getProfileReport() and printProfileDigest()
+useProfile = True
+
+#server mode (see runServer). the server only listens on localhost. curve
+#folders are checked for changed files every reloadInterval seconds, and a
+#changed library is reloaded in the background, then swapped in for the
+#requests that follow. latency stats cover the last latencyWindow requests
+serverPort = 8631
+reloadInterval = 2.0
+latencyWindow = 1000
+
+#everything above is configuration, read but never changed while coordinating.
+#the working state below is shared by every thread but guarded by a lock (the
+#margin cache), or kept per thread (stats, trace candidate, sqlite connection),
+#so coordinations can run in a thread pool against one CurveLibrary
+
+#dict-like counters with a separate set of values in every thread
+class ThreadCounters(threading.local):
+    def __init__(self, **counters):
+        self.counters = dict(counters)
+    
+    def __getitem__(self, name):
+        return self.counters[name]
+    
+    def __setitem__(self, name, value):
+        self.counters[name] = value
+    
+    def __iter__(self):
+        return iter(self.counters)
+    
+    def keys(self):
+        return self.counters.keys()
+    
+    def values(self):
+        return self.counters.values()
+    
+    def update(self, counters):
+        self.counters.update(counters)
+    
+    def items(self):
+        return self.counters.items()
+    
+    def add(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+    
+    def clear(self):
+        self.counters.clear()
 
-#set writeLog to True when debugging 
-devLog = []
-writeLog = True
+pruneStats = ThreadCounters(curves=0, curvesPruned=0, 
+                            candidates=0, candidatesPruned=0)
+marginCache = collections.OrderedDict()
+marginCacheLock = threading.Lock()
+marginCacheStats = ThreadCounters(hits=0, misses=0)
+resultCacheStats = ThreadCounters(hits=0, misses=0, secondsSaved=0.0)
+resultCacheConnection = threading.local()
+coordTableState = {}
+coordTableLock = threading.Lock()
+coordTableStats = ThreadCounters(hits=0, misses=0)
+profileCounters = ThreadCounters(candidates=0, coordinated=0, 
+                                 rejectedDvr=0, rejectedRvd=0, 
+                                 rejectedUvr=0, rejectedRvu=0,
+                                 rejectedDown=0, rejectedUp=0,
+                                 marginChecks=0, interpolations=0)
+profileTimes = ThreadCounters()
+profileCurveTimes = ThreadCounters()
+traceState = threading.local()
 
 def main():    
     #print introduction
     printIntro()
     
-    #get a list of curve files
-    #curveFileLists is a tuple of lists of curve filenames
-    curveFileLists = getCurveLists()
+    #load every curve, from the curve cache where possible
+    resetProfile()
+    library = CurveLibrary(startDir)
+    coordinator = Coordinator(library)
+    curveFileLists = library.curveFileLists
     
     #print the lists of curve filenames
     printCurveList(curveFileLists)
     
-    #ask the user which curves to coordinate with. pull in those files
-    downstreamCurveFile, upstreamCurveFile = getUserCurves(curveFileLists)
+    #ask the user which curves to coordinate with
+    downstreamSel, upstreamSel = getUserCurves(curveFileLists)
     
     #ask user for amperage extents of recloser pickup current
     pickupMin, pickupMax, coordMaxAmps = getUserExtents()
@@ -60,48 +347,93 @@ def main():
     #ask user for minimum coordination time
     minCoordTime = getUserTime()
     
-    #process relevant curve files to make them usable by the program
-    downstreamCurve = processCurveFile(downstreamCurveFile, "d")
-    upstreamCurve = processCurveFile(upstreamCurveFile, "u")
-    recloserCurveFiles = readAllReclosers()
-    recloserCurves = []
-    for curveFile in recloserCurveFiles:
-        recloserCurves.append(processCurveFile(curveFile, "r"))   
+    #ask user how far to sweep the new recloser's time adder
+    adderRange = getUserAdders()
     
-    #do the actual coordination
-    coordCurves = downstreamCurve, upstreamCurve, recloserCurves
+    #apply corrections to the relevant curves to make them usable.
+    #normalizeCurve() asks for anything else a curve needs
+    downstreamCurve = normalizeCurve(*library.getCurveData(downstreamSel), "d")
+    upstreamCurve = normalizeCurve(*library.getCurveData(upstreamSel), "u")
+    
+    #do the actual coordination. ranked mode only keeps the best candidates,
+    #and they're all the reports below look at
     coordAmps = pickupMin, pickupMax, coordMaxAmps
-    solutionSet = getSolutions(coordCurves, coordAmps, minCoordTime)
+    if rankCount:
+        ranked = coordinator.getRankedSolutions(downstreamCurve, upstreamCurve,
+                                                coordAmps, minCoordTime, 
+                                                adderRange)
+        solutionSet = getRankedSet(ranked)
+    else:
+        solutionSet = coordinator.getSolutions(downstreamCurve, upstreamCurve,
+                                               coordAmps, minCoordTime, 
+                                               adderRange)
+    
+    printPruneStats()
+    if rankCount: printRankedSolutions(ranked, curveFileLists[2])
+    else: printSolutions(solutionSet, curveFileLists[2])
+    if useProfile: printProfileDigest(getProfileReport(curveFileLists[2]))
+    
+    #margins of every solution over the whole fault current range
+    reportPath = getUserMarginReport() if solutionSet else None
+    if reportPath:
+        report = coordinator.getMarginReport(downstreamCurve, upstreamCurve,
+                                             solutionSet, coordMaxAmps)
+        writeMarginReport(reportPath, report, curveFileLists[2])
+        print("Margin report written to {0}".format(reportPath))
     
-    printSolutions(solutionSet, curveFileLists[2])
+    #chance of miscoordination of every solution, with curve tolerances
+    reportPath = None
+    if solutionSet and np is not None: reportPath = getUserToleranceReport()
+    if reportPath:
+        report = coordinator.getToleranceReport(downstreamCurve, upstreamCurve,
+                                                solutionSet, coordMaxAmps, 
+                                                minCoordTime)
+        writeToleranceReport(reportPath, report, curveFileLists[2])
+        print("Tolerance report written to {0}. {1} of {2} settings "
+              "coordinated in all {3} samples".format(
+                reportPath, report['probability'].count(0), 
+                len(report['settings']), report['samples']))
     
-    #print out the dev log
-    if writeLog: printDevLog()
+    #what-if re-runs with the same curves come out of the margin cache, once
+    #the first re-run has filled it
+    whatIf = getUserWhatIf(coordMaxAmps)
+    while whatIf is not None:
+        minCoordTime, coordMaxAmps = whatIf
+        coordAmps = pickupMin, pickupMax, coordMaxAmps
+        if rankCount:
+            printRankedSolutions(coordinator.getRankedSolutions(
+                    downstreamCurve, upstreamCurve, coordAmps, minCoordTime,
+                    adderRange), curveFileLists[2])
+        else:
+            solutionSet = coordinator.getSolutions(downstreamCurve, 
+                                                   upstreamCurve, coordAmps,
+                                                   minCoordTime, adderRange,
+                                                   cacheMargins=True)
+            printSolutions(solutionSet, curveFileLists[2])
+        whatIf = getUserWhatIf(coordMaxAmps)
+    
+    #write out the trace
+    if traceLevel: writeTrace(traceFile)
     
-#get lists of curves to eventually present to the user
-#when adding types, make sure to modify the folder path variables accordingly
+#get lists of curves to eventually present to the user, from a dict of
+#{curve type: folder path}
+#when adding types, make sure to modify curveFolders accordingly
 #processCurveFile() may also need editing, depending on the file format
-def getCurveLists():
-    breakerList = []
-    fuseList = []
-    recloserList = []
+def getCurveLists(curvePaths):
+    curveLists = []
     
     #find all filenames in each path and add them to a list
-    os.chdir(fusePath)
-    for curveFile in glob.glob("*"):
-        fuseList.append(curveFile)
-    
-    os.chdir(recloserPath)
-    for curveFile in glob.glob("*"):
-        recloserList.append(curveFile)
-        
-    os.chdir(breakerPath)
-    for curveFile in glob.glob("*"):
-        breakerList.append(curveFile)
+    for curveType in curveTypes:
+        pattern = os.path.join(glob.escape(curvePaths[curveType]), '*')
+        curveLists.append([os.path.basename(curveFile) 
+                           for curveFile in glob.glob(pattern)])
         
-    os.chdir(startDir)
-        
-    return (breakerList,fuseList,recloserList)
+    return tuple(curveLists)
+
+#folder paths of every curve type under a library's root folder
+def getCurvePaths(rootDir):
+    return {curveType: os.path.join(rootDir, curveFolder)
+            for curveType, curveFolder in curveFolders.items()}
 
 #print an introduction to the program    
 def printIntro():
@@ -180,38 +512,22 @@ def getUserCurves(curveFileLists):
             print("\n!! Please enter a valid curve name, such as f14 or r02\n")
     
     print("")
-    
-    #read the selected curves
-    downstreamFile = readCurveFile(downstreamSel, curveFileLists)
-    upstreamFile = readCurveFile(upstreamSel, curveFileLists)        
                             
-    return (downstreamFile, upstreamFile)
+    return (downstreamSel, upstreamSel)
     
 #read a raw curve file. append curve type at beginning of the data
-def readCurveFile(userSel, curveFileLists):
+def readCurveFile(userSel, curveFileLists, curvePaths):
     #pull in the list of available files to read from
-    breakerList, fuseList, recloserList = curveFileLists
-    chosenList = []
-    listIndex = int(userSel[1:])
-    
-    curveFile = []
-
-    #switch to the chosen directory and start the data with an indicator
-    if userSel[0] == 'b':
-        os.chdir(breakerPath)
-        chosenList = breakerList
-        curveFile.append('breaker')
-    elif userSel[0] == 'f':
-        os.chdir(fusePath)
-        chosenList = fuseList
-        curveFile.append('fuse')
-    elif userSel[0] == 'r':
-        os.chdir(recloserPath)
-        chosenList = recloserList
-        curveFile.append('recloser')
+    typeCode = 'bfr'.index(userSel[0])
+    curveType = curveTypes[typeCode]
+    curveName = curveFileLists[typeCode][int(userSel[1:])]
+    
+    #start the data with an indicator
+    curveFile = [curveType]
         
     #read the chosen file
-    for currentLine in open(chosenList[listIndex]):
+    with open(os.path.join(curvePaths[curveType], curveName)) as f:
+        for currentLine in f:
             curveFile.append(currentLine)
             
     return curveFile
@@ -252,13 +568,14 @@ def getUserExtents():
     pickupMax = 0
     coordMaxAmps = 0
     
-    #accepts user input only if it's an integer, then converts it to an integer
+    #accepts user input only if it's an integer of at least 1, then converts
+    #it to an integer. a pickup of 0 can't be scaled in log current
     inputOK = False
     while inputOK == False:
         pickupMinIn = input("Enter minimum pickup current for new recloser in Amps\n" +
         "Note: This script only accepts whole numbers\n>>")
         
-        inputOK = pickupMinIn.isdecimal()
+        inputOK = pickupMinIn.isdecimal() and int(pickupMinIn) >= 1
         
         if inputOK == False:
             print("\n!! Please enter a valid amperage\n")
@@ -337,7 +654,7 @@ def getRecInfo(curveOrder):
         if inputOK == False:
             print("\n!! Please enter a valid number of cycles\n")
         else:
-            pickupCurrent = int(pickupCurrIn)
+            timeConstant = int(timeConstIn)
             print("")
     
     return pickupCurrent, timeConstant
@@ -363,269 +680,4648 @@ def getUserTime():
     
     return minCoordTime
 
-#read all the recloser files
-def readAllReclosers():
-    recloserCurveFiles = []
+#ask whether to re-run the study with a new minimum coordination time and
+#maximum coordination current. returns them, or None to stop
+def getUserWhatIf(coordMaxAmps):
+    rerun = input("\nRe-run with a different coordination time or "
+                  "maximum current? [y/n]\n")
+    if rerun.lower() != 'y': return None
+    print("")
+    
+    minCoordTime = getUserTime()
+    
+    #accepts user input only if an integer of at least 1, blank keeps the
+    #current value
+    inputOK = False
+    while inputOK == False:
+        coordMaxIn = input("Enter maximum coordination current in Amps\n" +
+                            "Leave blank to keep {0}A\n>>".format(coordMaxAmps))
+        
+        inputOK = ((coordMaxIn.isdecimal() and int(coordMaxIn) >= 1) or 
+                   coordMaxIn == '')
+        
+        if inputOK == False:
+            print("\n!! Please enter a valid amperage\n")
+        else:
+            if coordMaxIn: coordMaxAmps = int(coordMaxIn)
+            print("")
+    
+    return minCoordTime, coordMaxAmps
+
+#ask whether to write a margin report for the solutions. returns the report
+#path, or None
+def getUserMarginReport():
+    writeReport = input("\nWrite a margin report for every solution? [y/n]\n")
+    if writeReport.lower() != 'y': return None
+    print("")
+    
+    extensions = ('.csv', '.npz') if np is not None else ('.csv',)
+    return getUserReportPath('marginReport.csv', extensions)
+
+#ask whether to write a tolerance report for the solutions. returns the report
+#path, or None
+def getUserToleranceReport():
+    writeReport = input("\nWrite a tolerance report for every solution? "
+                        "[y/n]\n")
+    if writeReport.lower() != 'y': return None
+    print("")
+    
+    return getUserReportPath('toleranceReport.csv', ('.csv',))
+
+#get the path to write a report to. blank keeps defaultPath. an existing file
+#is only overwritten if the user says so
+def getUserReportPath(defaultPath, extensions):
+    #accepts user input only if it has one of extensions
+    inputOK = False
+    while inputOK == False:
+        reportPath = input("Enter report path ({0})\n".format(
+                                ", ".join(extensions)) +
+                           "Leave blank for {0}\n>>".format(defaultPath))
+        reportPath = reportPath.strip() or defaultPath
+        
+        inputOK = reportPath.lower().endswith(extensions)
+        
+        if inputOK == False:
+            print("\n!! Please enter a path ending in {0}\n".format(
+                    " or ".join(extensions)))
+        elif os.path.exists(reportPath):
+            overwrite = input("\n{0} already exists. Overwrite it? "
+                              "[y/n]\n".format(reportPath))
+            inputOK = overwrite.lower() == 'y'
+            print("")
+        else:
+            print("")
+    
+    return reportPath
+
+#get the range of time adders to sweep for the new recloser. returns
+#(0, max adder) in cycles, or None to only search curves and pickups
+def getUserAdders():
+    adderMax = 0
+    
+    #accepts user input only if an integer, then converts input to an integer
+    inputOK = False
+    while inputOK == False:
+        adderMaxIn = input("Enter maximum time adder for new recloser in cycles\n" +
+        "Enter 0 to leave the time adder out of the search\n>>")
+        
+        inputOK = adderMaxIn.isdecimal()
+        
+        if inputOK == False:
+            print("\n!! Please enter a valid number of cycles\n")
+        else:
+            adderMax = int(adderMaxIn)
+            print("")
+    
+    if adderMax == 0: return None
+    return 0, adderMax
+
+#load parsed curve data for every curve in curveFileLists. returns
+#{'breaker': {name: curveData}, 'fuse': {...}, 'recloser': {...}}
+#only files that are new or changed since the cache was written get parsed.
+#with no cachePath, every file is parsed and nothing is cached
+def loadCurveLibrary(curveFileLists, curvePaths, cachePath=None):
+    curveCache = {}
+    if cachePath: curveCache = readCurveCache(cachePath)
+    
+    curveLibrary = {}
+    cacheChanged = False
+    
+    for typeCode, curveType in enumerate(curveTypes):
+        curveLibrary[curveType] = {}
+        for i, curveName in enumerate(curveFileLists[typeCode]):
+            fileStat = os.stat(os.path.join(curvePaths[curveType], curveName))
+            stamp = (fileStat.st_mtime_ns, fileStat.st_size)
+            
+            cached = curveCache.get((curveType, curveName))
+            if cached and cached[0] == stamp:
+                curveLibrary[curveType][curveName] = cached[1]
+            else:
+                #the selection code is what readCurveFile() understands
+                curveSel = "{0}{1:02}".format(curveType[0], i)
+                curveFile = readCurveFile(curveSel, curveFileLists, 
+                                          curvePaths)
+                curveLibrary[curveType][curveName] = parseCurveFile(curveFile)
+                curveCache[(curveType, curveName)] = (stamp, 
+                                        curveLibrary[curveType][curveName])
+                cacheChanged = True
+    
+    #drop curves whose files are gone, so the cache doesn't grow forever
+    for key in list(curveCache):
+        if key[1] not in curveLibrary[key[0]]:
+            del curveCache[key]
+            cacheChanged = True
+    
+    if cachePath and cacheChanged:
+        writeCurveCache(cachePath, curveCache)
+    
+    return curveLibrary
+
+#get (curve type, curve data) for a user selection such as f14 or r02.
+#the data is a copy, since normalizeCurve() corrects curve data in place
+def getLibraryCurve(userSel, curveFileLists, curveLibrary):
+    typeCode = 'bfr'.index(userSel[0])
+    curveType = curveTypes[typeCode]
+    curveName = curveFileLists[typeCode][int(userSel[1:])]
+    return curveType, [list(point) for point in curveLibrary[curveType][curveName]]
+
+#curve types in the same order as curveFileLists
+curveTypes = ('breaker', 'fuse', 'recloser')
+
+#every curve under one root folder, loaded once. nothing is changed after
+#loading, so one library can be shared by any number of threads.
+#rootDir holds the curve folders, the export folder, the curve cache, the
+#result cache and the coordination table. curvePaths, exportPath, cachePath,
+#resultCachePath and coordTablePath override them. a library with no rootDir
+#and no resultCachePath or coordTablePath goes without. loaded is a
+#library's getState(), for rebuilding it elsewhere
+class CurveLibrary:
+    def __init__(self, rootDir=None, curvePaths=None, cachePath=None, 
+                 exportPath=None, resultCachePath=None, coordTablePath=None,
+                 loaded=None):
+        if loaded is not None:
+            (self.curvePaths, self.curveFileLists, self.curveData, 
+                recloserCurves, self.resultCachePath, 
+                self.coordTablePath) = loaded
+            self.recloserCurves = tuple(recloserCurves)
+            return
+        
+        if curvePaths is None: curvePaths = getCurvePaths(rootDir)
+        if cachePath is None and rootDir is not None and useCurveCache:
+            cachePath = os.path.join(rootDir, curveCacheName)
+        if exportPath is None and rootDir is not None:
+            exportPath = os.path.join(rootDir, exportFolder)
+        if resultCachePath is None and rootDir is not None:
+            resultCachePath = os.path.join(rootDir, resultCacheName)
+        if coordTablePath is None and rootDir is not None:
+            coordTablePath = os.path.join(rootDir, coordTableName)
+        
+        self.resultCachePath = resultCachePath
+        self.coordTablePath = coordTablePath
+        self.curvePaths = dict(curvePaths)
+        self.curveFileLists = getCurveLists(self.curvePaths)
+        with profilePhase('parse'):
+            self.curveData = loadCurveLibrary(self.curveFileLists, 
+                                              self.curvePaths, cachePath)
+            if exportPath:
+                addExportCurves(exportPath, self.curveFileLists, 
+                                self.curveData)
+        
+        recloserCurves = []
+        for i in range(len(self.curveFileLists[2])):
+            recloserCurves.append(normalizeCurve(
+                    *self.getCurveData("r{0:02}".format(i)), "r"))
+        buildEnvelopeIndex(recloserCurves)
+        self.recloserCurves = tuple(recloserCurves)
+    
+    #everything needed to rebuild the library, without reading any files
+    def getState(self, recloserCurves=True):
+        return (self.curvePaths, self.curveFileLists, self.curveData,
+                self.recloserCurves if recloserCurves else (),
+                self.resultCachePath, self.coordTablePath)
+    
+    #(curve type, curve data) for a selection such as f14 or r02
+    def getCurveData(self, curveSel):
+        return getLibraryCurve(curveSel, self.curveFileLists, self.curveData)
+    
+    #selection code for a curve file name, or None if there's no such curve
+    def getSelection(self, curveName):
+        for typeCode, curveList in enumerate(self.curveFileLists):
+            if curveName in curveList:
+                return "{0}{1:02}".format('bfr'[typeCode], 
+                                          curveList.index(curveName))
+        return None
+    
+    def getCurveType(self, curveName):
+        curveSel = self.getSelection(curveName)
+        if curveSel is None: return None
+        return curveTypes['bfr'.index(curveSel[0])]
+    
+    #compiled downstream ('d') or upstream ('u') curve, by file name. unlike
+    #normalizeCurve(), this never prompts: a recloser needs recInfo (pickup,
+    #time adder) and a breaker with an unusually low pickup needs ctRatios
+    #(old, new), or a ValueError is raised
+    def getCurve(self, curveName, curveOrder, recInfo=None, ctRatios=None):
+        curveSel = self.getSelection(curveName)
+        if curveSel is None:
+            raise ValueError("unknown curve '{0}'".format(curveName))
+        
+        curveType, curveData = self.getCurveData(curveSel)
+        if curveType == 'recloser' and recInfo is None:
+            raise ValueError("a pickup and time adder are needed for "
+                             "recloser curve '{0}'".format(curveName))
+        if curveType == 'breaker' and curveData[0][0] < 100 and not ctRatios:
+            raise ValueError("breaker pickup current is unusually low, "
+                             "a CT ratio is needed for '{0}'".format(curveName))
+        
+        return normalizeCurve(curveType, curveData, curveOrder, recInfo, 
+                              ctRatios)
+
+#runs coordinations against a CurveLibrary without prompting for anything.
+#a Coordinator keeps nothing between calls, so one can be used from several
+#threads at once. downstream and upstream curves are CompiledCurves from
+#getCurve(), or file names of curves that need no recInfo or ctRatios
+class Coordinator:
+    def __init__(self, library):
+        self.library = library
+    
+    def getCurve(self, curveName, curveOrder, recInfo=None, ctRatios=None):
+        return self.library.getCurve(curveName, curveOrder, recInfo, ctRatios)
+    
+    def getCoordCurves(self, downstream, upstream):
+        if isinstance(downstream, str):
+            downstream = self.getCurve(downstream, 'd')
+        if isinstance(upstream, str):
+            upstream = self.getCurve(upstream, 'u')
+        return downstream, upstream, self.library.recloserCurves
+    
+    #the solution set, as getSolutions() returns it. cacheMargins=True goes
+    #through the margin cache, for re-runs of a study with a new time or
+    #current cap (see sweepSolutions())
+    def getSolutions(self, downstream, upstream, coordAmps, minCoordTime,
+                     adderRange=None, cacheMargins=None):
+        return getSolutions(self.getCoordCurves(downstream, upstream),
+                            coordAmps, minCoordTime, adderRange, cacheMargins,
+                            self.library)
+    
+    #solution ranges as rows naming their recloser curve, like batch results
+    def getSolutionRanges(self, downstream, upstream, coordAmps, minCoordTime,
+                          adderRange=None):
+        solutionSet = self.getSolutions(downstream, upstream, coordAmps, 
+                                        minCoordTime, adderRange)
+        return [getRangeRow(solutionRange, self.library.curveFileLists[2])
+                for solutionRange in getSolutionRanges(solutionSet)]
+    
+    #the best candidates, best first (see getRankedSolutions())
+    def getRankedSolutions(self, downstream, upstream, coordAmps, minCoordTime,
+                           adderRange=None, count=None, score=None):
+        return getRankedSolutions(self.getCoordCurves(downstream, upstream),
+                                  coordAmps, minCoordTime, adderRange, count,
+                                  score)
+    
+    #getSolutionRanges() rows, handed out as the sweep finds them
+    def iterSolutionRanges(self, downstream, upstream, coordAmps, 
+                           minCoordTime, adderRange=None):
+        coordCurves = self.getCoordCurves(downstream, upstream)
+        for solutionRange in iterSolutionRanges(coordCurves, coordAmps, 
+                                                minCoordTime, adderRange,
+                                                self.library):
+            yield getRangeRow(solutionRange, self.library.curveFileLists[2])
+    
+    #margins of every setting in a solution set (see getMarginReport())
+    def getMarginReport(self, downstream, upstream, solutionSet, 
+                        coordMaxAmps):
+        return getMarginReport(self.getCoordCurves(downstream, upstream),
+                               solutionSet, coordMaxAmps)
+    
+    #chance of miscoordination of every setting in a solution set, with
+    #curve tolerances (see getToleranceReport())
+    def getToleranceReport(self, downstream, upstream, solutionSet, 
+                           coordMaxAmps, minCoordTime):
+        return getToleranceReport(self.getCoordCurves(downstream, upstream),
+                                  solutionSet, coordMaxAmps, minCoordTime)
+    
+    #run one batch study dict (see runStudy()). its reports are only written
+    #with allowFiles=True
+    def runStudy(self, study, n=0, stream=None, allowFiles=False):
+        return runStudy(study, n, self.library, stream, allowFiles)
+    
+    #search settings for every open recloser on a feeder (see runFeeder())
+    def runFeeder(self, feeder):
+        return runFeeder(feeder, self.library)
+    
+    #simulate a reclose sequence at every setting (see runSequence())
+    def runSequence(self, sequence):
+        return runSequence(sequence, self.library)
+
+#curve cache file layout, all little endian:
+#   header:  magic, curve count
+#   index:   one entry per curve -> type code, name length, mtime (ns),
+#            file size, data offset, point count, then the utf-8 name
+#   data:    float64 [current, cycles] pairs, 8 byte aligned
+curveCacheMagic = b'RCCURVE1'
+curveCacheHeader = struct.Struct('<8sI')
+curveCacheEntry = struct.Struct('<BHqqQI')
+
+#read the curve cache. returns {(curve type, name): ((mtime, size), curveData)}
+#a missing or unreadable cache is just an empty one
+def readCurveCache(cachePath):
+    curveCache = {}
+    try:
+        with open(cachePath, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as cacheMap:
+                magic, count = curveCacheHeader.unpack_from(cacheMap, 0)
+                if magic != curveCacheMagic: return {}
+                
+                #point data is read straight out of the mapped file
+                with memoryview(cacheMap) as cacheView:
+                    with cacheView.cast('d') as values:
+                        offset = curveCacheHeader.size
+                        for n in range(count):
+                            (typeCode, nameLength, mtime, size, 
+                                dataOffset, pointCount) = \
+                                curveCacheEntry.unpack_from(cacheMap, offset)
+                            offset += curveCacheEntry.size
+                            curveName = bytes(cacheMap[offset:offset+nameLength])
+                            offset += nameLength
+                            
+                            first = dataOffset // 8
+                            points = values[first:first + 2*pointCount].tolist()
+                            if sys.byteorder == 'big':
+                                points = array.array('d', points)
+                                points.byteswap()
+                            curveData = [[points[i], points[i+1]] 
+                                         for i in range(0, len(points), 2)]
+                            
+                            key = (curveTypes[typeCode], curveName.decode('utf-8'))
+                            curveCache[key] = ((mtime, size), curveData)
+    except (OSError, ValueError, TypeError, IndexError, struct.error):
+        return {}
+    
+    return curveCache
+
+#write the whole curve cache to a temporary file, then swap it in, so a
+#half-written cache is never read. the cache only saves parsing next time,
+#so one that can't be written (say, in a read-only folder) is left out
+def writeCurveCache(cachePath, curveCache):
+    index = []
+    data = array.array('d')
+    
+    entries = sorted(curveCache.items())
+    indexSize = curveCacheHeader.size
+    for (curveType, curveName), (stamp, curveData) in entries:
+        indexSize += curveCacheEntry.size + len(curveName.encode('utf-8'))
+    dataStart = (indexSize + 7) // 8 * 8
     
-    os.chdir(recloserPath)
-    for file in glob.glob("*"):
-        currentCurve = ['recloser']
-        for line in open(file):
-            currentCurve.append(line)
-        recloserCurveFiles.append(currentCurve)
+    for (curveType, curveName), ((mtime, size), curveData) in entries:
+        nameBytes = curveName.encode('utf-8')
+        dataOffset = dataStart + 8*len(data)
+        index.append(curveCacheEntry.pack(curveTypes.index(curveType),
+                                          len(nameBytes), mtime, size, 
+                                          dataOffset, len(curveData)))
+        index.append(nameBytes)
+        for point in curveData:
+            data.extend(point)
     
-    os.chdir(startDir)
+    if sys.byteorder == 'big': data.byteswap()
     
-    return recloserCurveFiles
+    #two threads or processes loading at once each write their own file
+    tempPath = "{0}.{1}.{2}.tmp".format(cachePath, os.getpid(), 
+                                        threading.get_ident())
+    try:
+        with open(tempPath, 'wb') as f:
+            f.write(curveCacheHeader.pack(curveCacheMagic, len(entries)))
+            f.write(b''.join(index))
+            f.write(bytes(dataStart - indexSize))
+            f.write(data.tobytes())
+        os.replace(tempPath, cachePath)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(tempPath)
     
 #make curve files into usable, uniform data
 def processCurveFile(curveFile, curveOrder):
+    return normalizeCurve(curveFile[0], parseCurveFile(curveFile), curveOrder)
+
+#parse a raw curve file into [current, time] points, with time in cycles.
+#nothing here depends on the study, so this is what the curve cache stores.
+#one pass: the first line that mentions cycles or seconds sets the units
+def parseCurveFile(curveFile):
     curveData = []
-    pickupAmps = 1
-    ctRatio = 1
-    dataInSeconds = False #Otherwise it's in seconds 
-    
-    #determine format of time data
-    for line in curveFile:
-        if 'cycle' in line.lower():
-            dataInSeconds = False
-            break
-        elif 'second' in line.lower():
-            dataInSeconds = True
-            break
-    
-    #breaker curves have a special format because CAPE is weird :-|
-    if (curveFile[0] == 'breaker'):
-        for line in curveFile:
-            #breaker data points are numbered
-            if line.split()[0].isdecimal():
-                currentData = line.split()[1:]
-                for i, val in enumerate(currentData):
-                    currentData[i] = float(currentData[i])
-                curveData.append(currentData)
-        #CT ratios are often wrong.
-        if (curveData[0][0] < 100):
-            oldRatio, newRatio = getNewCTRatio(curveData[0][0])
-            #correct data with new CT ratio
-            for i in range(len(curveData)):
-                curveData[i][0] = curveData[i][0] / oldRatio
-                curveData[i][0] = curveData[i][0] * newRatio
-                
-    else:
-        for line in curveFile:
-            #data lines readable by CAPE start with whitespace
-            if (len(line) != len(line.lstrip())):
-                #store data as a 2-d array in format [current][time]
-                currentData = line.split()
-                for i, val in enumerate(currentData):
-                    currentData[i] = float(currentData[i])
-                curveData.append(currentData)
+    dataInSeconds = None
+    isBreaker = curveFile[0] == 'breaker'
+    
+    for line in curveFile[1:]:
+        if dataInSeconds is None:
+            lowerLine = line.lower()
+            if 'cycle' in lowerLine: dataInSeconds = False
+            elif 'second' in lowerLine: dataInSeconds = True
+        
+        fields = line.split()
+        if not fields: continue
+        #breaker curves have a special format because CAPE is weird :-|
+        #breaker data points are numbered
+        if isBreaker:
+            if fields[0].isdecimal():
+                curveData.append([float(field) for field in fields[1:]])
+        #data lines readable by CAPE start with whitespace
+        elif line[0].isspace():
+            #store data as a 2-d array in format [current][time]
+            curveData.append([float(field) for field in fields])
     
     #convert time data to cycles if it's in seconds
-    if dataInSeconds:         
+    if dataInSeconds:
         for currentData in curveData:
             currentData[1] *= 60
+    
+    return curveData
+
+#split a bulk CAPE export into curves, in one pass over the memory-mapped
+#file. yields (curve type, curve name, curve data) as each block ends, with
+#the data parsed the same way parseCurveFile() would parse the block on its
+#own. two kinds of block are found:
+#   PLOTRD ... RETURN        -> a fuse curve, or a recloser curve if its
+#                               quoted title mentions RECLOSER. the title
+#                               is the curve name
+#   No. CURRENT(P.AMPS) ...  -> a breaker curve, running as long as its rows
+#                               are numbered. the last line of text before the
+#                               header is the curve name
+#anything between blocks is skipped. blocks with no name are named after
+#the file, and repeated names get a number added
+def iterExportCurves(exportPath):
+    exportName = os.path.basename(exportPath)
+    usedNames = collections.Counter()
+    
+    #the block being read: its type, title lines, units and rows
+    blockType = None
+    titles = []
+    dataInSeconds = None
+    curveData = []
+    lastText = None
+    
+    def finishBlock():
+        if dataInSeconds:
+            for currentData in curveData:
+                currentData[1] *= 60
+        
+        curveName = " ".join(" ".join(titles).split())
+        curveType = blockType
+        if curveType == 'plot':
+            curveType = 'recloser' if 'RECLOSER' in curveName.upper() else 'fuse'
+        if not curveName:
+            curveName = "{0} {1}".format(exportName, curveType)
+        usedNames[curveName] += 1
+        if usedNames[curveName] > 1:
+            curveName = "{0} ({1})".format(curveName, usedNames[curveName])
+        return curveType, curveName, curveData
+    
+    with open(exportPath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0: return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as exportMap:
+            for line in iter(exportMap.readline, b''):
+                fields = line.split()
+                keyword = fields[0].upper() if fields else b''
+                
+                #a breaker table ends at its first unnumbered row
+                if (blockType == 'breaker' and curveData and
+                    not keyword.isdigit()):
+                    yield finishBlock()
+                    blockType = None
+                
+                if keyword == b'PLOTRD' or (keyword == b'NO.' and 
+                                            b'CURRENT' in line.upper()):
+                    if blockType is not None: yield finishBlock()
+                    blockType = 'plot' if keyword == b'PLOTRD' else 'breaker'
+                    titles = []
+                    dataInSeconds = None
+                    curveData = []
+                    if blockType == 'breaker' and lastText: titles = [lastText]
+                    lastText = None
+                
+                if blockType is None:
+                    if fields: lastText = line.decode('utf-8', 'replace'
+                                                      ).strip().strip("'\"")
+                    continue
+                
+                if keyword == b'RETURN' and blockType == 'plot':
+                    yield finishBlock()
+                    blockType = None
+                    continue
+                
+                if dataInSeconds is None:
+                    upperLine = line.upper()
+                    if b'CYCLE' in upperLine: dataInSeconds = False
+                    elif b'SECOND' in upperLine: dataInSeconds = True
+                
+                if not fields: continue
+                try:
+                    if blockType == 'breaker':
+                        if keyword.isdigit():
+                            curveData.append([float(field) 
+                                              for field in fields[1:]])
+                    elif line[:1].isspace():
+                        curveData.append([float(field) for field in fields])
+                    elif line[:1] in b"'\"":
+                        titles.append(line.decode('utf-8', 'replace'
+                                                  ).strip().strip("'\""))
+                except ValueError:
+                    #indented text that isn't a data row
+                    continue
+            
+            if blockType is not None and curveData: yield finishBlock()
+
+#add the curves of every export file in exportPath to a loaded library.
+#a curve whose name is already taken by a curve file, or an earlier export,
+#is left out
+def addExportCurves(exportPath, curveFileLists, curveLibrary):
+    for exportFile in sorted(glob.glob(os.path.join(glob.escape(exportPath), 
+                                                    '*'))):
+        if not os.path.isfile(exportFile): continue
+        for curveType, curveName, curveData in iterExportCurves(exportFile):
+            if len(curveData) < 2: continue
+            curveList = curveFileLists[curveTypes.index(curveType)]
+            if curveName in curveList: continue
+            curveList.append(curveName)
+            curveLibrary[curveType][curveName] = curveData
+
+#apply study-specific corrections to parsed curve data and compile it.
+#curveType is 'breaker', 'fuse' or 'recloser'. curveData is modified in place.
+#recInfo is (pickup current, time constant) for upstream/downstream reclosers
+#and ctRatios is (old ratio, new ratio) for breakers. either one is asked for
+#at the prompt if it's needed and not given
+def normalizeCurve(curveType, curveData, curveOrder, recInfo=None, ctRatios=None):
+    #CT ratios are often wrong.
+    if (curveType == 'breaker') and (curveData[0][0] < 100):
+        if ctRatios is None: ctRatios = getNewCTRatio(curveData[0][0])
+        oldRatio, newRatio = ctRatios
+        #correct data with new CT ratio
+        for i in range(len(curveData)):
+            curveData[i][0] = curveData[i][0] / oldRatio
+            curveData[i][0] = curveData[i][0] * newRatio
         
     #handle upstream or downstream reclosers
-    if (curveFile[0] == 'recloser'):
+    if (curveType == 'recloser'):
         if (curveOrder == 'u') or (curveOrder == 'd'):
-            pickupCurrent, timeConstant = getRecInfo(curveOrder)
+            if recInfo is None: recInfo = getRecInfo(curveOrder)
+            pickupCurrent, timeConstant = recInfo
             for currentData in curveData:
                 currentData[0] *= pickupCurrent
                 currentData[1] += timeConstant
                 
-    #comment out to disable curve data in dev log
-    
-    global devLog
-    if writeLog: 
-        devLog.append("==BEGIN CURVE DATA")
-        devLog.append(curveOrder)
+    if traceLevel >= 1:
+        setTraceCandidate(None, None, curveOrder)
         for datum in curveData:
-            devLog.append(','.join(map(str,datum)))
-        devLog.append("==END CURVE DATA\n")
+            trace('curve', datum[0], datum[1])
     
-    return curveData
+    with profilePhase('compile'):
+        return CompiledCurve(curveData)
 
-#things start to get mildly interesting here:
-def getSolutions(coordCurves, coordAmps, minCoordTime):
-    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
-    pickupMin, pickupMax, coordMaxAmps = coordAmps
-    ampStep = 5
-    coordination = True
+#a curve ready for fast log interpolation. log currents, log times and the
+#slope/intercept of every segment in log-log space are worked out once here.
+#every column is a flat array of doubles, and there's no instance dict.
+#indexing and iterating still give [current, time] points, like the raw data
+class CompiledCurve:
+    __slots__ = ('currents', 'times', 'logCurrents', 'logTimes', 'slopes',
+                 'intercepts', 'envelope', 'contentHash')
     
-    global devLog
+    #curveData is any iterable of [current, time] points
+    def __init__(self, curveData=()):
+        self.envelope = None
+        self.contentHash = None
+        self.currents = array.array('d')
+        self.times = array.array('d')
+        for current, time in curveData:
+            self.currents.append(current)
+            self.times.append(time)
+        self.logCurrents = array.array('d', map(math.log10, self.currents))
+        self.logTimes = array.array('d', map(math.log10, self.times))
+        
+        #segment i runs from point i to point i+1, log(time) = b + m*log(current)
+        self.slopes = array.array('d')
+        self.intercepts = array.array('d')
+        for i in range(len(self.currents) - 1):
+            run = self.logCurrents[i+1] - self.logCurrents[i]
+            #vertical segments are never interpolated across, since the first
+            #of the duplicated points is returned on an exact match
+            if run > 0: m = (self.logTimes[i+1] - self.logTimes[i]) / run
+            else: m = 0.0
+            self.slopes.append(m)
+            self.intercepts.append(self.logTimes[i] - m * self.logCurrents[i])
     
-    solutionSet = []
+    def __len__(self):
+        return len(self.currents)
     
-    #test every available recloser curve
-    for n, recloserCurve in enumerate(recloserCurves): 
-        if writeLog: devLog.append("[r{0:02}]".format(n))
-        #test at every pickup current
-        for pickupCurrent in range(pickupMin, pickupMax+1, ampStep):
-            if writeLog: devLog.append("PU = {0}".format(pickupCurrent))
-        
-            testCurve = copy.deepcopy(recloserCurve) 
-            for m in range(len(testCurve)):
-                testCurve[m][0] *= pickupCurrent
-            #test recloser against downstream and vice versa
-            if writeLog: devLog.append("dvr")
-            coordination = testCoord(downstreamCurve, testCurve,
-                                     minCoordTime, 'd',
-                                     coordMaxAmps)
-            if writeLog: devLog.append("rvd")
-            coordination = coordination and testCoord(testCurve, downstreamCurve,
-                                                      minCoordTime, 'u',
-                                                      coordMaxAmps)
-            #test recloser against upstream and vice versa
-            if writeLog: devLog.append("uvr")
-            coordination = coordination and testCoord(upstreamCurve, testCurve,
-                                                      minCoordTime, 'u',
-                                                      coordMaxAmps)
-            if writeLog: devLog.append("rvu")
-            coordination = coordination and testCoord(testCurve, upstreamCurve,
-                                                      minCoordTime, 'd',
-                                                      coordMaxAmps)                                         
-            if coordination:
-                solutionSet.append([n,pickupCurrent])
-            #print(testCurve)
-            #print(downstreamCurve)
-            #print(upstreamCurve)
-            if writeLog: devLog.append('--')
-        if writeLog: devLog.append('\n')
-                
-    return solutionSet
+    def __getitem__(self, i):
+        return [self.currents[i], self.times[i]]
     
-#test coordination time between two curves
-def testCoord(curve1, curve2, minCoordTime, direction, maxAmps):
-    #test every point in the recloser curve against a test curve
-    #a data point in a curve is [amperage, time]
-    #curves are always sorted low to high on amperage
-    for point in curve1:
-        #check if point overlaps with curve2 at this current
-        if ((point[0] >= curve2[0][0]) and 
-            (point[0] <= curve2[-1][0]) and 
-            (point[0] <= maxAmps)):
-            #perform a linear interpolation to get time difference at specific current
-            coordTime = point[1] - interpolateTime(curve2, point[0])
-            if direction == 'd': coordTime = -coordTime
-            if writeLog: devLog.append("coord time: {0}".format(coordTime))
-            if coordTime < minCoordTime: return False
+    def __iter__(self):
+        for current, time in zip(self.currents, self.times):
+            yield [current, time]
+    
+    #log interpolation at a current. binary search for the segment, then a
+    #single log10/pow on the query itself
+    def interpolate(self, current):
+        i = bisect.bisect_left(self.currents, current)
+        if i < len(self.currents) and self.currents[i] == current:
+            return self.times[i]
+        i = min(max(i, 1), len(self.currents) - 1) - 1
+        return math.pow(10, self.intercepts[i] + 
+                            self.slopes[i] * math.log10(current))
     
-    return True
+    #the curve with currents multiplied by a pickup current, as a view
+    def scaled(self, pickupCurrent):
+        return ScaledCurve(self, pickupCurrent)
+    
+    #hash of the curve's points, for keying anything worked out from them
+    def getHash(self):
+        if self.contentHash is None:
+            digest = hashlib.sha1(self.currents.tobytes())
+            digest.update(self.times.tobytes())
+            self.contentHash = digest.hexdigest()
+        return self.contentHash
+    
+    #envelope of the curve for pruning, built the first time it's needed
+    def getEnvelope(self):
+        if self.envelope is None: self.envelope = CurveEnvelope(self)
+        return self.envelope
 
-#helper function for linear interpolation
-def interpolateTime(interCurve, interCurrent):
-    interPoint0 = [] #nearest point with current < interCurrent
-    interPoint1 = [] #nearest point with current > interCurrent
+#a compiled curve scaled by a pickup current, without copying it. scaling is
+#a shift in log current, so times and slopes are the curve's own, and points
+#and interpolation are worked out from the curve as they're asked for. the
+#shifted columns getMinMargin() walks are only built if it asks for them.
+#the numbers match a scaled copy exactly
+class ScaledCurve:
+    __slots__ = ('curve', 'pickupCurrent', 'logPickup', 'columns')
     
-    global devLog
+    def __init__(self, curve, pickupCurrent):
+        self.curve = curve
+        self.pickupCurrent = pickupCurrent
+        self.logPickup = math.log10(pickupCurrent)
+        self.columns = None
     
-    for point in interCurve:
-        if point[0] == interCurrent: return point[1]
-        if point[0] < interCurrent: interPoint0 = point
-        else:
-            interPoint1 = point
-            break
-    
-    """#linear interpolation. we want to do logarithmic interpolation instead
-    interTime = (interPoint0[1] + (interCurrent - interPoint0[0]) * 
-                (interPoint1[1] - interPoint0[1]) / 
-                (interPoint1[0] - interPoint0[0]))
-    """
-    
-    #logarithmic interpolation
-    m = (math.log10(interPoint1[1]/interPoint0[1]) /
-        math.log10(interPoint1[0]/interPoint0[0]))
-            
-    b = interPoint0[1] / math.pow(interPoint0[0],m)
-    interTime = b * math.pow(interCurrent,m)
+    def __len__(self):
+        return len(self.curve.currents)
     
-    if writeLog: 
-        devLog.append(', '.join(map(str,interPoint0)))
-        devLog.append(', '.join(map(str,interPoint1)))
-        devLog.append("inter. curr: {0}".format(interCurrent))
-        devLog.append("inter. time: {0}".format(interTime))
+    def __getitem__(self, i):
+        return [self.curve.currents[i] * self.pickupCurrent, self.curve.times[i]]
     
-    return interTime
+    def __iter__(self):
+        pickupCurrent = self.pickupCurrent
+        for current, time in zip(self.curve.currents, self.curve.times):
+            yield [current * pickupCurrent, time]
     
-def getNewCTRatio(pickupCurrent):
-    oldRatio = 0
-    newRatio = 0
+    #the search is done on the unscaled currents, then nudged to where a
+    #search of the scaled currents would land, in case dividing rounded
+    def interpolate(self, current):
+        curve = self.curve
+        currents = curve.currents
+        pickupCurrent = self.pickupCurrent
+        i = bisect.bisect_left(currents, current / pickupCurrent)
+        while i > 0 and currents[i-1] * pickupCurrent >= current: i -= 1
+        while i < len(currents) and currents[i] * pickupCurrent < current: i += 1
+        if i < len(currents) and currents[i] * pickupCurrent == current:
+            return curve.times[i]
+        i = min(max(i, 1), len(currents) - 1) - 1
+        m = curve.slopes[i]
+        return math.pow(10, (curve.intercepts[i] - m * self.logPickup) + 
+                            m * math.log10(current))
     
-    #accepts user input only if an integer, then converts input to an integer
-    inputOK = False
-    while inputOK == False:
-        oldRatioIn = input("!! Breaker pickup current is unusually low\n" +
-                            "CT ratio setting in CAPE is likely wrong\n"
-                            "Please enter current CT setting from CAPE (usually 1)\n>>")
-        
-        inputOK = oldRatioIn.isdecimal()
-        
-        if inputOK == False:
-            print("\n!! Please enter a valid CT ratio setting\n")
-        else:
-            oldRatio = int(oldRatioIn)
-            print("")
-            
-    inputOK = False
-    while inputOK == False:
-        newRatioIn = input("Please enter new CT ratio (usually 160)\n>>")
-        
-        inputOK = newRatioIn.isdecimal()
-        
-        if inputOK == False:
-            print("\n!! Please enter a valid CT ratio setting\n")
-        else:
-            newRatio = int(newRatioIn)
-            print("")
+    #(currents, log currents, intercepts) of the scaled curve
+    def getColumns(self):
+        if self.columns is None:
+            curve = self.curve
+            logPickup = self.logPickup
+            self.columns = (
+                array.array('d', [current * self.pickupCurrent 
+                                  for current in curve.currents]),
+                array.array('d', [logCurrent + logPickup 
+                                  for logCurrent in curve.logCurrents]),
+                array.array('d', [b - m * logPickup 
+                                  for m, b in zip(curve.slopes, curve.intercepts)]))
+        return self.columns
     
-    return oldRatio, newRatio
-  
-def printSolutions(solutionSet, recloserList):
-    lastPrintedNumber = -1
-    rangeMin = 0
-    rangeMax = 0
+    @property
+    def currents(self):
+        return self.getColumns()[0]
     
-    solutionOut = []
+    @property
+    def logCurrents(self):
+        return self.getColumns()[1]
     
-    solutionOut.append("========================")
-    solutionOut.append("Possible Curve Settings:")
-    solutionOut.append("========================\n")
+    @property
+    def intercepts(self):
+        return self.getColumns()[2]
     
-    if not solutionSet:
-        solutionOut.append("[no solutions found]")
+    @property
+    def times(self):
+        return self.curve.times
     
-    for i, solution in enumerate(solutionSet):
-        if(lastPrintedNumber != solution[0]):
-            lastPrintedNumber = solution[0]
-            if(i != 0):
-                solutionOut.append("Pickup Max (A): {0}\n".format(rangeMax))
-            solutionOut.append("Curve: {0}".format(recloserList[solution[0]]))
-            solutionOut.append("Pickup Min (A): {0}".format(solution[1]))
-            
-        if(i == (len(solutionSet) - 1)):
-            solutionOut.append("Pickup Max (A): {0}\n".format(solution[1]))
-        
-        rangeMax = solution[1]
+    @property
+    def logTimes(self):
+        return self.curve.logTimes
+    
+    @property
+    def slopes(self):
+        return self.curve.slopes
+
+#min and max time of a curve over bands of log current, plus the current and
+#time range it covers. lets a candidate be rejected without interpolating
+class CurveEnvelope:
+    def __init__(self, curve):
+        self.lowLog = curve.logCurrents[0]
+        self.highLog = curve.logCurrents[-1]
+        self.minTime = min(curve.times)
+        self.maxTime = max(curve.times)
         
-    for line in solutionOut:
-        print(line)
+        self.firstBand = math.floor(self.lowLog / envelopeBandWidth)
+        bandCount = (math.floor(self.highLog / envelopeBandWidth) - 
+                     self.firstBand + 1)
+        self.bandMin = [math.inf] * bandCount
+        self.bandMax = [-math.inf] * bandCount
         
-    writeSol = input("\nWrite solutions to file? [y/n]\n")
+        #log-log segments are monotonic, so the extremes in a band are at its
+        #data points or where the curve crosses the band edges
+        for logCurrent, time in zip(curve.logCurrents, curve.times):
+            self.addTime(self.getBand(logCurrent), time)
+        for band in range(1, bandCount):
+            edge = (self.firstBand + band) * envelopeBandWidth
+            if self.lowLog < edge < self.highLog:
+                time = curve.interpolate(math.pow(10, edge))
+                self.addTime(band - 1, time)
+                self.addTime(band, time)
+    
+    def getBand(self, logCurrent):
+        band = math.floor(logCurrent / envelopeBandWidth) - self.firstBand
+        return min(max(band, 0), len(self.bandMin) - 1)
+    
+    def addTime(self, band, time):
+        self.bandMin[band] = min(self.bandMin[band], time)
+        self.bandMax[band] = max(self.bandMax[band], time)
+    
+    #(min time, max time) of the curve between two log currents
+    def timeRange(self, lowLog, highLog):
+        first = self.getBand(max(lowLog, self.lowLog))
+        last = self.getBand(min(highLog, self.highLog))
+        return (min(self.bandMin[first:last+1]), 
+                max(self.bandMax[first:last+1]))
+
+#build the envelope of every recloser curve up front, so all the studies
+#run against the library can share them
+def buildEnvelopeIndex(recloserCurves):
+    for recloserCurve in recloserCurves:
+        recloserCurve.getEnvelope()
+
+#downstream and upstream points the envelope checks use, as (log current,
+#time). points above maxAmps are never checked, same as in testCoord()
+def getPrunePoints(downstreamCurve, upstreamCurve, maxAmps):
+    logMaxAmps = math.log10(maxAmps)
+    downPoints = [(logCurrent, time) for logCurrent, time 
+                  in zip(downstreamCurve.logCurrents, downstreamCurve.times)
+                  if logCurrent <= logMaxAmps]
+    upPoints = [(logCurrent, time) for logCurrent, time 
+                in zip(upstreamCurve.logCurrents, upstreamCurve.times)
+                if logCurrent <= logMaxAmps]
+    return downPoints, upPoints
+
+#True if the envelope proves that no pickup with a log between logLow and
+#logHigh can coordinate. that's the case when a downstream point is inside the
+#scaled curve at every one of those pickups and the recloser is never slow
+#enough there (dvr), or the same for an upstream point and never fast enough
+#(uvr). a little slack keeps rounding from ever rejecting a good candidate
+def blockRejected(envelope, prunePoints, logLow, logHigh, minCoordTime):
+    downPoints, upPoints = prunePoints
+    slack = 1e-9
+    
+    for logCurrent, time in downPoints:
+        if (envelope.lowLog + logHigh + slack <= logCurrent <= 
+            envelope.highLog + logLow - slack):
+            limit = time + minCoordTime
+            maxTime = envelope.timeRange(logCurrent - logHigh, 
+                                         logCurrent - logLow)[1]
+            if maxTime < limit - slack * abs(limit): return True
+    
+    for logCurrent, time in upPoints:
+        if (envelope.lowLog + logHigh + slack <= logCurrent <= 
+            envelope.highLog + logLow - slack):
+            limit = time - minCoordTime
+            minTime = envelope.timeRange(logCurrent - logHigh, 
+                                         logCurrent - logLow)[0]
+            if minTime > limit + slack * abs(limit): return True
+    
+    return False
+
+#which of the stepped pickups of a recloser curve the envelope rules out.
+#returns a list of True (rejected) or False, one for each pickup. with
+#blocks=False only the whole curve is checked
+def pruneCandidates(recloserCurve, prunePoints, pickups, minCoordTime, 
+                    blocks=True):
+    pruneStats['curves'] += 1
+    pruneStats['candidates'] += len(pickups)
+    
+    rejected = [False] * len(pickups)
+    if not usePruning or not pickups or pickups[0] <= 0: return rejected
+    
+    envelope = recloserCurve.getEnvelope()
+    logPickups = [math.log10(pickup) for pickup in pickups]
+    
+    #the whole curve first, then block by block
+    if blockRejected(envelope, prunePoints, logPickups[0], logPickups[-1],
+                     minCoordTime):
+        pruneStats['curvesPruned'] += 1
+        pruneStats['candidatesPruned'] += len(pickups)
+        return [True] * len(pickups)
+    if not blocks or len(pickups) <= pruneBlockSize: return rejected
+    
+    for start in range(0, len(pickups), pruneBlockSize):
+        stop = min(start + pruneBlockSize, len(pickups))
+        if blockRejected(envelope, prunePoints, logPickups[start], 
+                         logPickups[stop-1], minCoordTime):
+            rejected[start:stop] = [True] * (stop - start)
+            pruneStats['candidatesPruned'] += stop - start
+    
+    return rejected
+
+#True if the envelope rules out a recloser curve at every pickup between
+#pickupMin and pickupMax, not just the stepped ones, for the exact engine.
+#only curves are counted, since the exact engine has no stepped candidates
+def curveRejected(recloserCurve, prunePoints, pickupMin, pickupMax, 
+                  minCoordTime):
+    pruneStats['curves'] += 1
+    if not usePruning or pickupMin <= 0: return False
+    
+    if blockRejected(recloserCurve.getEnvelope(), prunePoints, 
+                     math.log10(pickupMin), math.log10(pickupMax), 
+                     minCoordTime):
+        pruneStats['curvesPruned'] += 1
+        return True
+    return False
+
+def resetPruneStats():
+    for key in pruneStats: pruneStats[key] = 0
+
+def printPruneStats():
+    if not usePruning or not pruneStats['curves']: return
+    if not pruneStats['candidates']:
+        print("Envelope index ruled out {0} of {1} curves without testing "
+              "them\n".format(pruneStats['curvesPruned'], pruneStats['curves']))
+        return
+    print("Envelope index ruled out {0} of {1} curves and {2} of {3} "
+          "candidates without testing them\n".format(
+            pruneStats['curvesPruned'], pruneStats['curves'],
+            pruneStats['candidatesPruned'], pruneStats['candidates']))
+
+#add wall time to a phase of the current study
+@contextlib.contextmanager
+def profilePhase(phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if useProfile: profileTimes.add(phase, time.perf_counter() - start)
+
+#add a sweep's candidate counts. rejectedBy maps each check to the number of
+#candidates it was the first to fail
+def countCandidates(tested, coordinated, rejectedBy=None):
+    profileCounters['candidates'] += tested
+    profileCounters['coordinated'] += coordinated
+    for check, count in (rejectedBy or {}).items():
+        profileCounters['rejected' + check.capitalize()] += count
+
+def resetProfile():
+    for key in profileCounters: profileCounters[key] = 0
+    profileTimes.clear()
+    profileCurveTimes.clear()
+
+#everything a worker counted, to be added to the parent's with addProfile()
+def getProfileState():
+    return dict(profileCounters), dict(profileCurveTimes)
+
+#add a worker's counts. its curve numbers start at firstCurve
+def addProfile(profileState, firstCurve=0):
+    counters, curveTimes = profileState
+    for key in counters:
+        profileCounters[key] += counters[key]
+    for n, seconds in curveTimes.items():
+        profileCurveTimes.add(n + firstCurve, seconds)
+
+#the current study's counters, pruning, phase times and recloser curve times
+#as a dict. curves are named from recloserList if it's given
+def getProfileReport(recloserList=None):
+    curveSeconds = {}
+    for n, seconds in profileCurveTimes.items():
+        curveName = recloserList[n] if recloserList else str(n)
+        curveSeconds[curveName] = seconds
+    return {'counters': dict(profileCounters),
+            'candidatesPruned': pruneStats['candidatesPruned'],
+            'phases': dict(profileTimes),
+            'curveSeconds': curveSeconds}
+
+#several reports summed into one, such as every study of a batch
+def mergeProfileReports(reports):
+    merged = {'counters': dict.fromkeys(profileCounters, 0), 
+              'candidatesPruned': 0, 'phases': {}, 'curveSeconds': {}}
+    for report in reports:
+        for key, value in report['counters'].items():
+            merged['counters'][key] += value
+        merged['candidatesPruned'] += report['candidatesPruned']
+        for field in ('phases', 'curveSeconds'):
+            for key, value in report[field].items():
+                merged[field][key] = merged[field].get(key, 0) + value
+    return merged
+
+#one line summary of a profile report, on stderr
+def printProfileDigest(report, out=None):
+    counters = report['counters']
+    rejected = " ".join("{0} {1}".format(check, counters['rejected' + check])
+                        for check in ('Dvr', 'Rvd', 'Uvr', 'Rvu', 'Down', 'Up')
+                        if counters['rejected' + check]) or "none"
+    phases = " ".join("{0} {1:.3f}s".format(phase, seconds) 
+                      for phase, seconds in sorted(report['phases'].items()))
+    slowest = ""
+    if report['curveSeconds']:
+        curveName = max(report['curveSeconds'], key=report['curveSeconds'].get)
+        slowest = " | slowest curve {0} {1:.3f}s".format(
+                    curveName, report['curveSeconds'][curveName])
+    print("profile: {0} candidates, {1} pruned, {2} coordinated, rejected "
+          "[{3}] | {4} margin checks, {5} interpolations | {6}{7}".format(
+            counters['candidates'], report['candidatesPruned'],
+            counters['coordinated'], rejected, counters['marginChecks'],
+            counters['interpolations'], phases, slowest), 
+          file=out or sys.stderr)
+
+#things start to get mildly interesting here:
+#the coordination table and result cache used are library's. with no
+#library, every study is swept
+def getSolutions(coordCurves, coordAmps, minCoordTime, adderRange=None,
+                 cacheMargins=None, library=None):
+    #a trace needs the sweep to actually run
+    if traceLevel >= 2 or library is None:
+        return sweepSolutions(coordCurves, coordAmps, minCoordTime, adderRange,
+                              cacheMargins)
+    
+    solutionSet = getTableSolutions(coordCurves, coordAmps, minCoordTime,
+                                    adderRange, library.coordTablePath)
+    if solutionSet is not None:
+        resetPruneStats()
+        return solutionSet
+    
+    cachePath = library.resultCachePath
+    if not useResultCache or cachePath is None:
+        return sweepSolutions(coordCurves, coordAmps, minCoordTime, adderRange,
+                              cacheMargins)
+    
+    with profilePhase('resultCache'):
+        key = getResultKey(coordCurves, coordAmps, minCoordTime, adderRange)
+        solutionSet = readCachedResult(cachePath, key)
+    if solutionSet is not None:
+        resetPruneStats()
+        return solutionSet
+    
+    start = time.perf_counter()
+    solutionSet = sweepSolutions(coordCurves, coordAmps, minCoordTime, 
+                                 adderRange, cacheMargins)
+    with profilePhase('resultCache'):
+        writeCachedResult(cachePath, key, solutionSet, 
+                          time.perf_counter() - start)
+    return solutionSet
+
+#getSolutions() without the result cache. cacheMargins=True sweeps through
+#the margin cache, and False keeps the sweep out of it (say, for pieces of a
+#sweep that won't come again). None leaves it to useMarginCache
+def sweepSolutions(coordCurves, coordAmps, minCoordTime, adderRange=None,
+                   cacheMargins=None):
+    with profilePhase('sweep'):
+        if getWorkerCount() > 1 and len(coordCurves[2]) > 1:
+            return getSolutionsParallel(coordCurves, coordAmps, minCoordTime,
+                                        adderRange, cacheMargins)
+        resetPruneStats()
+        if adderRange is not None:
+            return getAdderSolutions(coordCurves, coordAmps, minCoordTime, 
+                                     adderRange, cacheMargins)
+        if coordEngine == 'numpy' and np is not None and marginCheck == 'points':
+            return getSolutionsNumpy(coordCurves, coordAmps, minCoordTime,
+                                     cacheMargins)
+        if coordEngine == 'exact':
+            return getPickupIntervals(coordCurves, coordAmps, minCoordTime)
+        return getSolutionsLoop(coordCurves, coordAmps, minCoordTime)
+
+#the original engine: every recloser curve at every pickup current, one
+#candidate at a time
+def getSolutionsLoop(coordCurves, coordAmps, minCoordTime):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    pickupMin, pickupMax, coordMaxAmps = coordAmps
+    
+    pickups = list(range(pickupMin, pickupMax+1, ampStep))
+    prunePoints = getPrunePoints(downstreamCurve, upstreamCurve, coordMaxAmps)
+    
+    solutionSet = []
+    rejectedBy = dict.fromkeys(('dvr', 'rvd', 'uvr', 'rvu', 'down', 'up'), 0)
+    tested = 0
+    
+    #test every available recloser curve
+    for n, recloserCurve in enumerate(recloserCurves): 
+        curveStart = time.perf_counter()
+        rejected = pruneCandidates(recloserCurve, prunePoints, pickups,
+                                   minCoordTime)
+        #test at every pickup current
+        for pickupCurrent, skip in zip(pickups, rejected):
+            if skip: continue
+            tested += 1
+            testCurve = recloserCurve.scaled(pickupCurrent)
+            
+            if marginCheck == 'exact':
+                #dvr and rvd both check recloser time - downstream time, and
+                #uvr and rvu both check upstream time - recloser time, so
+                #each pair is a single pass over both curves
+                checks = (('down', 'd<r', testCurve, downstreamCurve),
+                          ('up', 'r<u', upstreamCurve, testCurve))
+                failed = None
+                for check, direction, slowCurve, fastCurve in checks:
+                    if traceLevel: setTraceCandidate(n, pickupCurrent, direction)
+                    if not testCoordExact(slowCurve, fastCurve, minCoordTime, 
+                                          coordMaxAmps):
+                        failed = check
+                        break
+            else:
+                #test recloser against downstream and vice versa, then
+                #recloser against upstream and vice versa
+                checks = (('dvr', downstreamCurve, testCurve, 'd'),
+                          ('rvd', testCurve, downstreamCurve, 'u'),
+                          ('uvr', upstreamCurve, testCurve, 'u'),
+                          ('rvu', testCurve, upstreamCurve, 'd'))
+                failed = None
+                for check, curve1, curve2, direction in checks:
+                    if traceLevel: setTraceCandidate(n, pickupCurrent, check)
+                    if not testCoord(curve1, curve2, minCoordTime, direction,
+                                     coordMaxAmps):
+                        failed = check
+                        break
+            
+            if failed is None:
+                solutionSet.append([n,pickupCurrent])
+            else:
+                rejectedBy[failed] += 1
+        
+        if useProfile:
+            profileCurveTimes.add(n, time.perf_counter() - curveStart)
+    
+    if useProfile:
+        countCandidates(tested, len(solutionSet), rejectedBy)
+    
+    return solutionSet
+
+#same as getSolutions(), but every recloser curve is packed into one array and
+#the whole curve x pickup grid is tested at once in log-log space
+def getSolutionsNumpy(coordCurves, coordAmps, minCoordTime, cacheMargins=None):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    pickupMin, pickupMax, coordMaxAmps = coordAmps
+    
+    pickups = np.arange(pickupMin, pickupMax+1, ampStep, dtype=float)
+    if cacheMargins is None: cacheMargins = useMarginCache
+    
+    #cached margins cover every candidate, so there's nothing to prune
+    if cacheMargins:
+        downMargin, upMargin = getCachedMargins(coordCurves, pickups, 
+                                                coordMaxAmps)
+        rejected = np.zeros(downMargin.shape, dtype=bool)
+    else:
+        #only curves with something left after pruning go in the grid.
+        #margins of pruned curves are left as nan
+        prunePoints = getPrunePoints(downstreamCurve, upstreamCurve, 
+                                     coordMaxAmps)
+        rejected = np.array([pruneCandidates(recloserCurve, prunePoints, 
+                                             list(range(pickupMin, pickupMax+1,
+                                                        ampStep)),
+                                             minCoordTime)
+                             for recloserCurve in recloserCurves], dtype=bool)
+        rejected = rejected.reshape(len(recloserCurves), len(pickups))
+        kept = np.nonzero(~rejected.all(axis=1))[0]
+        
+        downMargin = np.full(rejected.shape, np.nan)
+        upMargin = np.full(rejected.shape, np.nan)
+        if len(kept):
+            keptCurves = [recloserCurves[n] for n in kept]
+            downMargin[kept], upMargin[kept] = getMarginGrid((downstreamCurve,
+                                                              upstreamCurve,
+                                                              keptCurves),
+                                                             pickups, 
+                                                             coordMaxAmps)
+    
+    #a margin of inf means the curves never overlapped, same as testCoord()
+    downPass = (downMargin >= minCoordTime) & ~rejected
+    coordination = downPass & (upMargin >= minCoordTime)
+    
+    #the grid only keeps the worse margin of each pair, so rejections are
+    #counted as down or up. every candidate in it had all four checks
+    if useProfile:
+        tested = int(rejected.size - np.count_nonzero(rejected))
+        coordinated = int(np.count_nonzero(coordination))
+        passedDown = int(np.count_nonzero(downPass))
+        countCandidates(tested, coordinated, 
+                        {'down': tested - passedDown, 
+                         'up': passedDown - coordinated})
+        profileCounters['marginChecks'] += 4 * tested
+    
+    if traceLevel >= 2:
+        traceMarginGrid(downMargin, upMargin, pickups, minCoordTime)
+    
+    #nonzero() walks the grid row by row, so solutions come out in the same
+    #order as the loop engine: by curve, then by pickup current
+    solutionSet = []
+    for n, k in zip(*np.nonzero(coordination)):
+        solutionSet.append([int(n), int(pickups[k])])
+    
+    return solutionSet
+
+#get the worst coordination margin of every recloser curve at every pickup.
+#returns two (curves x pickups) arrays:
+#   downMargin -> min of the dvr and rvd coordination times
+#   upMargin   -> min of the uvr and rvu coordination times
+#margins are only checked at curve data points, exactly like testCoord()
+def getMarginGrid(coordCurves, pickups, maxAmps):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    recCurves = packCurves(recloserCurves)
+    downCurve = packCurves([downstreamCurve])
+    upCurve = packCurves([upstreamCurve])
+    
+    downMargin = np.empty((len(recloserCurves), len(pickups)))
+    upMargin = np.empty((len(recloserCurves), len(pickups)))
+    
+    #keep the (curves x pickups x points) temporaries to a sane size
+    maxPoints = max(recCurves['currents'].shape[1],
+                    downCurve['currents'].shape[1],
+                    upCurve['currents'].shape[1])
+    chunk = max(1, marginGridCells // (len(recloserCurves) * maxPoints))
+    
+    for start in range(0, len(pickups), chunk):
+        pickupChunk = pickups[start:start+chunk]
+        
+        #recloser against downstream and vice versa
+        dvr = fixedVsRecloserMargins(downCurve, recCurves, pickupChunk,
+                                     maxAmps, 'd')
+        rvd = recloserVsFixedMargins(recCurves, downCurve, pickupChunk,
+                                     maxAmps, 'd')
+        downMargin[:, start:start+chunk] = np.minimum(dvr, rvd)
+        
+        #recloser against upstream and vice versa
+        uvr = fixedVsRecloserMargins(upCurve, recCurves, pickupChunk,
+                                     maxAmps, 'u')
+        rvu = recloserVsFixedMargins(recCurves, upCurve, pickupChunk,
+                                     maxAmps, 'u')
+        upMargin[:, start:start+chunk] = np.minimum(uvr, rvu)
+    
+    return downMargin, upMargin
+
+#getSolutions() with the new recloser's time adder as a third dimension.
+#an adder raises every recloser time by the same amount, so it adds straight
+#onto the downstream margin and comes straight off the upstream margin. the
+#margins of each curve and pickup are found once, and the adders that pass are
+#    minCoordTime - downMargin <= adder <= upMargin - minCoordTime
+#the 'exact' engine has no pickup steps, so adder sweeps use the stepped
+#pickups. returns [curve number, pickup, adder min, adder max] for every curve
+#and pickup that coordinates with at least one adder in adderRange
+def getAdderSolutions(coordCurves, coordAmps, minCoordTime, adderRange,
+                      cacheMargins=None):
+    recloserCurves = coordCurves[2]
+    pickupMin, pickupMax, coordMaxAmps = coordAmps
+    
+    pickups = list(range(pickupMin, pickupMax+1, ampStep))
+    tested = len(recloserCurves) * len(pickups)
+    if cacheMargins is None: cacheMargins = useMarginCache
+    if coordEngine != 'loop' and np is not None and marginCheck == 'points':
+        if cacheMargins: marginSource = getCachedMargins
+        else: marginSource = getMarginGrid
+        downMargin, upMargin = marginSource(coordCurves, 
+                                            np.array(pickups, dtype=float),
+                                            coordMaxAmps)
+        downMargin, upMargin = downMargin.tolist(), upMargin.tolist()
+        if useProfile: profileCounters['marginChecks'] += 4 * tested
+    else:
+        downMargin, upMargin = getMarginLists(coordCurves, pickups, 
+                                              coordMaxAmps)
+    
+    solutionSet = []
+    for n in range(len(recloserCurves)):
+        for k, pickupCurrent in enumerate(pickups):
+            adders = getAdderRange(downMargin[n][k], upMargin[n][k],
+                                   minCoordTime, adderRange)
+            if adders is not None:
+                solutionSet.append([n, pickupCurrent] + adders)
+    
+    #an adder sweep has no single failing check, only coordinating candidates
+    if useProfile: countCandidates(tested, len(solutionSet))
+    
+    return solutionSet
+
+#margins of every curve at every pickup, one candidate at a time. same as
+#getMarginGrid(), but as lists and without numpy. follows marginCheck
+def getMarginLists(coordCurves, pickups, maxAmps):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    downMargin = []
+    upMargin = []
+    
+    for n, recloserCurve in enumerate(recloserCurves):
+        curveStart = time.perf_counter()
+        downRow = []
+        upRow = []
+        for pickupCurrent in pickups:
+            testCurve = recloserCurve.scaled(pickupCurrent)
+            if marginCheck == 'exact':
+                down = getMinMargin(testCurve, downstreamCurve, maxAmps)[0]
+                up = getMinMargin(upstreamCurve, testCurve, maxAmps)[0]
+            else:
+                down = min(getPointMargin(downstreamCurve, testCurve, 'd', 
+                                          maxAmps),
+                           getPointMargin(testCurve, downstreamCurve, 'u', 
+                                          maxAmps))
+                up = min(getPointMargin(upstreamCurve, testCurve, 'u', 
+                                        maxAmps),
+                         getPointMargin(testCurve, upstreamCurve, 'd', 
+                                        maxAmps))
+            downRow.append(down)
+            upRow.append(up)
+        downMargin.append(downRow)
+        upMargin.append(upRow)
+        if useProfile:
+            profileCurveTimes.add(n, time.perf_counter() - curveStart)
+    
+    return downMargin, upMargin
+
+#the adders in adderRange, on the adderStep grid, that coordinate with a
+#candidate's margins. returns [lowest, highest], or None if there are none
+def getAdderRange(downMargin, upMargin, minCoordTime, adderRange):
+    adderMin, adderMax = adderRange
+    low = max(minCoordTime - downMargin, adderMin)
+    high = min(upMargin - minCoordTime, adderMax)
+    if low > high: return None
+    
+    first = math.ceil((low - adderMin) / adderStep)
+    last = math.floor((high - adderMin) / adderStep)
+    if first > last: return None
+    return [adderMin + first * adderStep, adderMin + last * adderStep]
+
+#the best candidates of a study, best first, by score ('margin' or 
+#'headroom', see rankScore). returns up to count [curve number, pickup,
+#score] rows, or [curve number, pickup, adder, score] with an adderRange.
+#curves are swept one at a time and only the best count so far are kept, in
+#a heap, so memory doesn't grow with the library or the pickup range. once
+#the heap is full, the envelope (see pruneCandidates) skips what can't beat
+#the worst one kept: pickups that can't reach minCoordTime plus its margin,
+#or for headroom, runs of pickups too short to give more headroom than it has
+def getRankedSolutions(coordCurves, coordAmps, minCoordTime, adderRange=None,
+                       count=None, score=None):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    pickupMin, pickupMax, coordMaxAmps = coordAmps
+    if count is None: count = rankCount
+    if score is None: score = rankScore
+    if score not in ('margin', 'headroom'):
+        raise ValueError("unknown rank score '{0}'".format(score))
+    if count < 1: raise ValueError("a ranking needs at least 1 place")
+    
+    pickups = list(range(pickupMin, pickupMax+1, ampStep))
+    prunePoints = getPrunePoints(downstreamCurve, upstreamCurve, coordMaxAmps)
+    
+    #an adder moves both margins, so the envelope checks allow for the 
+    #biggest move either way
+    shift = 0
+    if adderRange is not None: shift = max(adderRange[1], -adderRange[0])
+    
+    #entries are (score, -curve number, -pickup, adder), so the worst kept is
+    #on top and ties go to the lower curve and pickup
+    heap = []
+    resetPruneStats()
+    with profilePhase('sweep'):
+        for n, recloserCurve in enumerate(recloserCurves):
+            curveStart = time.perf_counter()
+            floor = heap[0][0] if len(heap) == count else None
+            
+            threshold = minCoordTime - shift
+            if score == 'margin' and floor is not None: threshold += floor
+            rejected = pruneCandidates(recloserCurve, prunePoints, pickups, 
+                                       threshold)
+            kept = [k for k in range(len(pickups)) if not rejected[k]]
+            if score == 'headroom' and floor is not None:
+                runs = getIndexRuns(kept)
+                kept = [k for run in runs 
+                        if (len(run) - 1) // 2 * ampStep > floor for k in run]
+                pruneStats['candidatesPruned'] += (sum(map(len, runs)) - 
+                                                   len(kept))
+            
+            downMargin, upMargin = getCurveMargins(coordCurves, n, 
+                                                   [pickups[k] for k in kept],
+                                                   coordMaxAmps)
+            
+            #candidates that coordinate, with their adder and margin score
+            candidates = []
+            for k, down, up in zip(kept, downMargin, upMargin):
+                adder = None
+                if adderRange is not None:
+                    adders = getAdderRange(down, up, minCoordTime, adderRange)
+                    if adders is None: continue
+                    adder = getBestAdder(down, up, adders, adderRange)
+                    down += adder
+                    up -= adder
+                if min(down, up) >= minCoordTime:
+                    candidates.append((k, adder, min(down, up) - minCoordTime))
+            
+            if score == 'headroom':
+                headroom = {}
+                for run in getIndexRuns([k for k, adder, margin 
+                                         in candidates]):
+                    for k in run:
+                        headroom[k] = min(k - run[0], run[-1] - k) * ampStep
+                candidates = [(k, adder, headroom[k]) 
+                              for k, adder, margin in candidates]
+            
+            for k, adder, candidateScore in candidates:
+                entry = (candidateScore, -n, -pickups[k], adder)
+                if len(heap) < count:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+            
+            if useProfile:
+                countCandidates(len(kept), len(candidates))
+                profileCurveTimes.add(n, time.perf_counter() - curveStart)
+    
+    ranked = []
+    for candidateScore, n, pickupCurrent, adder in sorted(heap, reverse=True):
+        if adder is None: ranked.append([-n, -pickupCurrent, candidateScore])
+        else: ranked.append([-n, -pickupCurrent, adder, candidateScore])
+    return ranked
+
+#(downstream margins, upstream margins) of one recloser curve at some of the
+#pickups, the same margins the sweep checks
+def getCurveMargins(coordCurves, n, pickups, maxAmps):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    if not pickups: return [], []
+    
+    if usesMarginGrid():
+        downMargin, upMargin = getMarginGrid((downstreamCurve, upstreamCurve,
+                                              recloserCurves[n:n+1]), 
+                                             np.array(pickups, dtype=float),
+                                             maxAmps)
+        if useProfile: profileCounters['marginChecks'] += 4 * len(pickups)
+        return downMargin[0].tolist(), upMargin[0].tolist()
+    
+    downMargin = []
+    upMargin = []
+    for pickupCurrent in pickups:
+        testCurve = recloserCurves[n].scaled(pickupCurrent)
+        downMargin.append(getPairMargin(testCurve, downstreamCurve, maxAmps))
+        upMargin.append(getPairMargin(upstreamCurve, testCurve, maxAmps))
+    return downMargin, upMargin
+
+#split sorted indexes into runs of consecutive ones
+def getIndexRuns(indexes):
+    runs = []
+    for index in indexes:
+        if runs and runs[-1][-1] + 1 == index: runs[-1].append(index)
+        else: runs.append([index])
+    return runs
+
+#the adder on the adderStep grid, from the lowest to the highest that
+#coordinate (see getAdderRange), leaving the most margin on its worse side
+def getBestAdder(downMargin, upMargin, adders, adderRange):
+    low, high = adders
+    if math.isinf(downMargin) and math.isinf(upMargin): return low
+    
+    #margins balance at the middle, so it's one of the grid adders either
+    #side of that
+    middle = min(max((upMargin - downMargin) / 2, low), high)
+    below = adderRange[0] + math.floor((middle - adderRange[0]) / 
+                                       adderStep) * adderStep
+    options = [min(max(below, low), high), min(below + adderStep, high)]
+    return max(options, key=lambda adder: (min(downMargin + adder, 
+                                                upMargin - adder), -adder))
+
+#a ranked solution as the solution getSolutions() would give for it, for
+#reports: [curve, pickup] or [curve, pickup, adder, adder]
+def getRankedSet(ranked):
+    return [solution[:2] if len(solution) == 3 else 
+            solution[:2] + [solution[2], solution[2]]
+            for solution in ranked]
+
+#margins from the margin cache, the same as getMarginGrid() would give.
+#a study that isn't in the cache yet gets its margin profile built first
+def getCachedMargins(coordCurves, pickups, maxAmps):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    key = (downstreamCurve.getHash(), upstreamCurve.getHash(), 
+           getLibraryHash(recloserCurves), pickups.tobytes())
+    
+    with marginCacheLock:
+        profile = marginCache.get(key)
+        if profile is not None: marginCache.move_to_end(key)
+    
+    #profiles are built outside the lock. two threads missing on the same
+    #study both build it, and the second one stored wins
+    if profile is None:
+        marginCacheStats['misses'] += 1
+        profile = MarginProfile(coordCurves, pickups)
+        with marginCacheLock:
+            marginCache[key] = profile
+            while len(marginCache) > marginCacheSize:
+                marginCache.popitem(last=False)
+    else:
+        marginCacheStats['hits'] += 1
+    
+    return profile.getMargins(maxAmps)
+
+#worst downstream and upstream margin of every recloser curve and pickup, for
+#any maximum coordination current. raising the current cap can only bring in
+#more check points, so the worst margin is a running minimum over the check
+#points sorted by current. only the points where that minimum steps down are
+#kept, flattened curve by curve, pickup by pickup
+class MarginProfile:
+    def __init__(self, coordCurves, pickups):
+        downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+        downCurve = packCurves([downstreamCurve])
+        upCurve = packCurves([upstreamCurve])
+        self.shape = (len(recloserCurves), len(pickups))
+        
+        #same size limit as getMarginGrid(), but in chunks of curves so the
+        #steps come out in order
+        maxPoints = (max(len(curve) for curve in recloserCurves) +
+                     max(len(downstreamCurve), len(upstreamCurve)))
+        chunk = max(1, marginGridCells // (len(pickups) * maxPoints))
+        
+        downSteps = []
+        upSteps = []
+        for start in range(0, len(recloserCurves), chunk):
+            recCurves = packCurves(recloserCurves[start:start+chunk])
+            downSteps.append(getMarginSteps(
+                fixedVsRecloserPoints(downCurve, recCurves, pickups, 'd'),
+                recloserVsFixedPoints(recCurves, downCurve, pickups, 'd')))
+            upSteps.append(getMarginSteps(
+                fixedVsRecloserPoints(upCurve, recCurves, pickups, 'u'),
+                recloserVsFixedPoints(recCurves, upCurve, pickups, 'u')))
+        
+        self.down = [np.concatenate(part) for part in zip(*downSteps)]
+        self.up = [np.concatenate(part) for part in zip(*upSteps)]
+    
+    #(curves x pickups) downstream and upstream margins, up to maxAmps
+    def getMargins(self, maxAmps):
+        return (self.stepMargins(self.down, maxAmps),
+                self.stepMargins(self.up, maxAmps))
+    
+    #the last step at or under maxAmps is the worst margin for each candidate
+    def stepMargins(self, steps, maxAmps):
+        currents, margins, counts = steps
+        rows = np.repeat(np.arange(counts.size), counts)
+        below = np.bincount(rows[currents <= maxAmps], minlength=counts.size)
+        
+        stepMargin = np.full(counts.size, np.inf)
+        found = below > 0
+        last = np.cumsum(counts) - counts + below - 1
+        stepMargin[found] = margins[last[found]]
+        return stepMargin.reshape(self.shape)
+
+#merge the check points of a fixed vs recloser and recloser vs fixed pair,
+#each a (currents, margins) pair, into the steps of a MarginProfile.
+#returns the step currents, step margins and steps per candidate
+def getMarginSteps(fixedPoints, recloserPoints):
+    margins = np.concatenate([fixedPoints[1], recloserPoints[1]], axis=2)
+    currents = np.concatenate([np.broadcast_to(fixedPoints[0], 
+                                               fixedPoints[1].shape),
+                               recloserPoints[0]], axis=2)
+    
+    #a margin that can't be worked out fails, same as in the grid
+    margins = np.where(np.isnan(margins), -np.inf, margins)
+    
+    order = np.argsort(currents, axis=2, kind='stable')
+    currents = np.take_along_axis(currents, order, axis=2)
+    margins = np.minimum.accumulate(np.take_along_axis(margins, order, axis=2),
+                                    axis=2)
+    
+    previous = np.concatenate([np.full(margins.shape[:2] + (1,), np.inf),
+                               margins[:, :, :-1]], axis=2)
+    step = margins < previous
+    return currents[step], margins[step], step.sum(axis=2).ravel()
+
+#exact version of getSolutions(). scaling a recloser curve by a pickup is only
+#a shift of log(pickup) along the log current axis, so every data point and
+#curve segment gives a range of log(pickup) where coordination breaks.
+#whatever is left over is feasible. cost depends on how many pairs of data
+#points and segments can meet over the pickup range, not on ampStep.
+#returns [curve number, pickup min, pickup max] for every feasible interval
+def getPickupIntervals(coordCurves, coordAmps, minCoordTime):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    pickupMin, pickupMax, coordMaxAmps = coordAmps
+    
+    logMin = math.log10(pickupMin) if pickupMin > 0 else -math.inf
+    logMax = math.log10(pickupMax)
+    logMaxAmps = math.log10(coordMaxAmps)
+    
+    prunePoints = getPrunePoints(downstreamCurve, upstreamCurve, coordMaxAmps)
+    
+    solutionSet = []
+    
+    for n, recloserCurve in enumerate(recloserCurves):
+        curveStart = time.perf_counter()
+        #skip curves the envelope rules out over the whole pickup range
+        if curveRejected(recloserCurve, prunePoints, pickupMin, pickupMax,
+                         minCoordTime):
+            if useProfile:
+                profileCurveTimes.add(n, time.perf_counter() - curveStart)
+            continue
+        
+        #same four checks as getSolutions(): dvr, rvd, uvr, rvu
+        badRanges = []
+        badRanges += fixedPointRanges(downstreamCurve, recloserCurve,
+                                      minCoordTime, 'd', logMaxAmps, 
+                                      logMin, logMax)
+        badRanges += recloserPointRanges(recloserCurve, downstreamCurve,
+                                         minCoordTime, 'd', logMaxAmps,
+                                         logMin, logMax)
+        badRanges += fixedPointRanges(upstreamCurve, recloserCurve,
+                                      minCoordTime, 'u', logMaxAmps, 
+                                      logMin, logMax)
+        badRanges += recloserPointRanges(recloserCurve, upstreamCurve,
+                                         minCoordTime, 'u', logMaxAmps,
+                                         logMin, logMax)
+        
+        for low, high in complementRanges(badRanges, logMin, logMax):
+            solutionSet.append([n, math.pow(10, low), math.pow(10, high)])
+        
+        #each curve is solved whole, as four checks over its pickup range
+        if useProfile:
+            profileCounters['marginChecks'] += 4
+            profileCurveTimes.add(n, time.perf_counter() - curveStart)
+    
+    return solutionSet
+
+#ranges of log(pickup) where a data point of a fixed curve breaks coordination
+#with the scaled recloser curve. direction is where the fixed curve sits:
+#'d' for downstream (dvr) or 'u' for upstream (uvr). only shifts between
+#logMin and logMax matter, so each point is only checked against the
+#recloser segments it can land on in that range
+def fixedPointRanges(fixedCurve, recloserCurve, minCoordTime, direction, 
+                     logMaxAmps, logMin=-math.inf, logMax=math.inf):
+    badRanges = []
+    recLogCurrents = recloserCurve.logCurrents
+    lastSegment = len(recLogCurrents) - 2
+    
+    for logCurrent, time in zip(fixedCurve.logCurrents, fixedCurve.times):
+        if logCurrent > logMaxAmps: continue
+        
+        #recloser has to be slower than a downstream device and faster than
+        #an upstream one, by at least minCoordTime
+        if direction == 'd': limit = time + minCoordTime
+        else: limit = time - minCoordTime
+        atLeast = (direction == 'd')
+        
+        #the point only counts while it's inside the scaled recloser curve
+        if limit <= 0:
+            if not atLeast:
+                badRanges.append((logCurrent - recLogCurrents[-1],
+                                  logCurrent - recLogCurrents[0]))
+            continue
+        logLimit = math.log10(limit)
+        
+        #at a shift s, the point lands on log current (logCurrent - s) of the
+        #unscaled recloser curve, where log(time) = b + m*(logCurrent - s).
+        #segment i covers shifts logCurrent - recLogCurrents[i+1] to 
+        #logCurrent - recLogCurrents[i]
+        first = max(0, bisect.bisect_left(recLogCurrents, 
+                                          logCurrent - logMax) - 1)
+        last = min(lastSegment, bisect.bisect_right(recLogCurrents, 
+                                                    logCurrent - logMin) - 1)
+        for i in range(first, last + 1):
+            if recLogCurrents[i+1] == recLogCurrents[i]: continue
+            m = recloserCurve.slopes[i]
+            b = recloserCurve.intercepts[i]
+            badRange = badShiftRange(logCurrent - recLogCurrents[i+1],
+                                     logCurrent - recLogCurrents[i],
+                                     b + m*logCurrent, -m, logLimit, atLeast)
+            if badRange: badRanges.append(badRange)
+    
+    return badRanges
+
+#ranges of log(pickup) where a data point of the scaled recloser curve breaks
+#coordination with a fixed curve. direction is where the fixed curve sits:
+#'d' for downstream (rvd) or 'u' for upstream (rvu). like fixedPointRanges(),
+#each point is only checked against the fixed segments it can reach at
+#shifts between logMin and logMax
+def recloserPointRanges(recloserCurve, fixedCurve, minCoordTime, direction,
+                        logMaxAmps, logMin=-math.inf, logMax=math.inf):
+    badRanges = []
+    fixedLogCurrents = fixedCurve.logCurrents
+    highLogCurrent = min(fixedLogCurrents[-1], logMaxAmps)
+    lastSegment = len(fixedLogCurrents) - 2
+    
+    for logCurrent, time in zip(recloserCurve.logCurrents, recloserCurve.times):
+        #fixed device has to be faster than the recloser if it's downstream
+        #and slower if it's upstream, by at least minCoordTime
+        if direction == 'd': limit = time - minCoordTime
+        else: limit = time + minCoordTime
+        atLeast = (direction == 'u')
+        
+        if limit <= 0:
+            if not atLeast and fixedLogCurrents[0] <= highLogCurrent:
+                badRanges.append((fixedLogCurrents[0] - logCurrent,
+                                  highLogCurrent - logCurrent))
+            continue
+        logLimit = math.log10(limit)
+        
+        #at a shift s, the point sits at log current (logCurrent + s) of the
+        #fixed curve, where log(time) = b + m*(logCurrent + s)
+        first = max(0, bisect.bisect_left(fixedLogCurrents, 
+                                          logCurrent + logMin) - 1)
+        last = min(lastSegment, bisect.bisect_right(fixedLogCurrents, 
+                                                    logCurrent + logMax) - 1)
+        for j in range(first, last + 1):
+            if fixedLogCurrents[j+1] == fixedLogCurrents[j]: continue
+            if fixedLogCurrents[j] > highLogCurrent: break
+            m = fixedCurve.slopes[j]
+            b = fixedCurve.intercepts[j]
+            badRange = badShiftRange(fixedLogCurrents[j] - logCurrent,
+                                     min(fixedLogCurrents[j+1], highLogCurrent)
+                                        - logCurrent,
+                                     b + m*logCurrent, m, logLimit, atLeast)
+            if badRange: badRanges.append(badRange)
+    
+    return badRanges
+
+#part of the shift range [low, high] where log(time) = offset + slope*shift
+#breaks the limit. atLeast means log(time) has to stay >= logLimit,
+#otherwise it has to stay <= logLimit. returns None if nothing breaks
+def badShiftRange(low, high, offset, slope, logLimit, atLeast):
+    if low > high: return None
+    
+    #single shift, or a flat segment. either all of it breaks or none of it
+    if low == high or slope == 0:
+        logTime = offset + slope*low
+        if atLeast: broken = logTime < logLimit
+        else: broken = logTime > logLimit
+        if broken: return (low, high)
+        return None
+    
+    #log(time) crosses the limit at exactly one shift
+    cross = (logLimit - offset) / slope
+    if atLeast == (slope > 0): high = min(high, cross)
+    else: low = max(low, cross)
+    
+    if low >= high: return None
+    return (low, high)
+
+#whatever is left of [low, high] after taking out every bad range
+def complementRanges(badRanges, low, high):
+    goodRanges = []
+    start = low
+    
+    for badLow, badHigh in sorted(badRanges):
+        if start >= high: break
+        if badLow > start: goodRanges.append((start, min(badLow, high)))
+        start = max(start, badHigh)
+    
+    if start < high: goodRanges.append((start, high))
+    
+    return goodRanges
+
+#upper bound on the number of cells in one (curves x pickups x points) array
+marginGridCells = 2000000
+
+#one hash for a whole list of curves, in order
+def getLibraryHash(curves):
+    libraryHash = hashlib.sha1()
+    for curve in curves:
+        libraryHash.update(curve.getHash().encode())
+    return libraryHash.hexdigest()
+
+#key of a study in the result cache. the curves go in as they are after CT
+#ratio and recloser corrections, so those are covered too
+def getResultKey(coordCurves, coordAmps, minCoordTime, adderRange):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    engine = coordEngine if np is not None else 'loop'
+    study = [resultCacheVersion, downstreamCurve.getHash(), 
+             upstreamCurve.getHash(), getLibraryHash(recloserCurves),
+             list(coordAmps), minCoordTime, 
+             list(adderRange) if adderRange is not None else None,
+             engine, marginCheck, ampStep, adderStep]
+    return hashlib.sha1(json.dumps(study).encode()).hexdigest()
+
+#connection to the result cache at cachePath for this thread. sqlite
+#connections can't be shared between threads, and a forked worker can't use
+#its parent's connection, so each thread of each process opens its own, one
+#for each cache file it uses
+def getResultCache(cachePath):
+    if getattr(resultCacheConnection, 'pid', None) != os.getpid():
+        resultCacheConnection.pid = os.getpid()
+        resultCacheConnection.connections = {}
+    connections = resultCacheConnection.connections
+    if cachePath not in connections:
+        connection = sqlite3.connect(cachePath, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS results "
+                               "(key TEXT PRIMARY KEY, solutions TEXT, "
+                               "seconds REAL, lastUsed REAL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS stats "
+                               "(name TEXT PRIMARY KEY, value REAL)")
+        connections[cachePath] = connection
+    return connections[cachePath]
+
+#solution set stored for a key, or None. a hit marks the result as used
+def readCachedResult(cachePath, key):
+    try:
+        connection = getResultCache(cachePath)
+        row = connection.execute("SELECT solutions, seconds FROM results "
+                                 "WHERE key = ?", (key,)).fetchone()
+        with connection:
+            if row is None:
+                addResultStats(connection, misses=1)
+                return None
+            connection.execute("UPDATE results SET lastUsed = ? WHERE key = ?",
+                               (time.time(), key))
+            addResultStats(connection, hits=1, secondsSaved=row[1])
+    except sqlite3.Error:
+        return None
+    
+    return json.loads(row[0])
+
+#store a solution set and how long it took, then drop the least recently used
+#results past resultCacheSize
+def writeCachedResult(cachePath, key, solutionSet, seconds):
+    try:
+        connection = getResultCache(cachePath)
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO results "
+                               "VALUES (?, ?, ?, ?)",
+                               (key, json.dumps(solutionSet), seconds, 
+                                time.time()))
+            connection.execute("DELETE FROM results WHERE key IN "
+                               "(SELECT key FROM results ORDER BY lastUsed DESC "
+                               "LIMIT -1 OFFSET ?)", (resultCacheSize,))
+    except sqlite3.Error:
+        pass
+
+#count hits, misses and time saved, for this run and in the cache file
+def addResultStats(connection, **counts):
+    for name, value in counts.items():
+        resultCacheStats[name] += value
+        connection.execute("INSERT INTO stats VALUES (?, ?) ON CONFLICT(name) "
+                           "DO UPDATE SET value = value + ?", 
+                           (name, value, value))
+
+#stats for every run that has used the cache file, plus how full it is
+def readResultCacheStats(cachePath):
+    connection = getResultCache(cachePath)
+    stats = dict(connection.execute("SELECT name, value FROM stats"))
+    stats['results'] = connection.execute("SELECT COUNT(*) FROM results"
+                                          ).fetchone()[0]
+    stats['limit'] = resultCacheSize
+    return stats
+
+def printResultCacheStats(stats):
+    print("Result cache: {0:g} hits, {1:g} misses, {2:.1f}s of sweeps "
+          "saved".format(stats.get('hits', 0), stats.get('misses', 0),
+                         stats.get('secondsSaved', 0)))
+
+#coordination table file layout, all little endian:
+#   header:   magic, settings length, entry count
+#   settings: utf-8 JSON of the table's grid and the recloser curves it was
+#             built against
+#   index:    one entry per fuse, breaker and current -> downstream curve
+#             hash, upstream curve hash, current index, data offset, length
+#   data:     zlib compressed uint8 (recloser curves x pickups) levels. a
+#             candidate's level is how many of the table's times it
+#             coordinates at, so it coordinates at times[k] if it's over k
+coordTableMagic = b'RCTABLE1'
+coordTableHeader = struct.Struct('<8sII')
+coordTableEntry = struct.Struct('<20s20sHQI')
+coordTableVersion = 1
+
+#work out the coordination table for every fuse curve downstream of every
+#breaker curve in a library, and write it to tablePath (the library's own
+#table if it's None). a breaker that needs a CT ratio can't be corrected
+#without asking, so it's left out. returns the (fuse, breaker) pairs in the
+#table
+def buildCoordTable(library, tablePath=None):
+    if np is None:
+        raise ValueError("numpy is needed for the coordination table")
+    if tablePath is None: tablePath = library.coordTablePath
+    if tablePath is None:
+        raise ValueError("the library has no coordination table path")
+    recloserCurves = library.recloserCurves
+    
+    #fuse or breaker files with the same contents share their entries
+    pairs = {}
+    for breakerName in library.curveFileLists[0]:
+        try:
+            upstreamCurve = library.getCurve(breakerName, 'u')
+        except ValueError as e:
+            print("!! {0}, left out of the table".format(e))
+            continue
+        for fuseName in library.curveFileLists[1]:
+            downstreamCurve = library.getCurve(fuseName, 'd')
+            key = (downstreamCurve.getHash(), upstreamCurve.getHash())
+            pairs.setdefault(key, (downstreamCurve, upstreamCurve, []))
+            pairs[key][2].append((fuseName, breakerName))
+    
+    tasks = [(downstreamCurve, upstreamCurve) 
+             for downstreamCurve, upstreamCurve, names in pairs.values()]
+    workers = min(getWorkerCount(), len(tasks))
+    if workers > 1:
+        with startWorkerPool(recloserCurves, workers) as pool:
+            levels = pool.map(tableChunk, tasks)
+    else:
+        levels = [getTableLevels((downstreamCurve, upstreamCurve, 
+                                  recloserCurves))
+                  for downstreamCurve, upstreamCurve in tasks]
+    
+    settings = {'version': coordTableVersion, 'ampStep': ampStep,
+                'pickups': list(coordTablePickups),
+                'times': sorted(coordTableTimes),
+                'amps': sorted(coordTableAmps),
+                'curves': len(recloserCurves),
+                'recloserHash': getLibraryHash(recloserCurves)}
+    entries = []
+    for (downHash, upHash), pairLevels in zip(pairs, levels):
+        for ampsIndex, data in enumerate(pairLevels):
+            entries.append((downHash, upHash, ampsIndex, data))
+    writeCoordTable(tablePath, settings, entries)
+    
+    return [name for pair in pairs.values() for name in pair[2]]
+
+#worker task: coordination table levels of a pair of fixed curves against
+#the shared recloser curves
+def tableChunk(task):
+    downstreamCurve, upstreamCurve = task
+    return getTableLevels((downstreamCurve, upstreamCurve, 
+                           workerState['recloserCurves']))
+
+#coordination table levels of every recloser curve and pickup in the table,
+#under one pair of fixed curves. returns one compressed array per entry of
+#coordTableAmps, in order. the margins come from a MarginProfile, the same
+#as a numpy engine sweep, so a lookup gives exactly what a sweep would
+def getTableLevels(coordCurves):
+    pickups = np.arange(coordTablePickups[0], coordTablePickups[1]+1, 
+                        ampStep, dtype=float)
+    times = np.array(sorted(coordTableTimes), dtype=float)
+    profile = MarginProfile(coordCurves, pickups)
+    
+    levels = []
+    for maxAmps in sorted(coordTableAmps):
+        downMargin, upMargin = profile.getMargins(maxAmps)
+        worstMargin = np.minimum(downMargin, upMargin)
+        worstMargin[np.isnan(worstMargin)] = -np.inf
+        level = np.searchsorted(times, worstMargin, side='right')
+        levels.append(zlib.compress(level.astype(np.uint8).tobytes()))
+    return levels
+
+#write a coordination table of (downstream hash, upstream hash, current
+#index, compressed levels) entries to a temporary file, then swap it in
+def writeCoordTable(tablePath, settings, entries):
+    settingsBytes = json.dumps(settings).encode('utf-8')
+    dataOffset = (coordTableHeader.size + len(settingsBytes) + 
+                  coordTableEntry.size * len(entries))
+    
+    index = []
+    for downHash, upHash, ampsIndex, data in entries:
+        index.append(coordTableEntry.pack(bytes.fromhex(downHash),
+                                          bytes.fromhex(upHash), ampsIndex,
+                                          dataOffset, len(data)))
+        dataOffset += len(data)
+    
+    tempPath = "{0}.{1}.{2}.tmp".format(tablePath, os.getpid(), 
+                                        threading.get_ident())
+    with open(tempPath, 'wb') as f:
+        f.write(coordTableHeader.pack(coordTableMagic, len(settingsBytes), 
+                                      len(entries)))
+        f.write(settingsBytes)
+        f.write(b''.join(index))
+        for entry in entries:
+            f.write(entry[3])
+    os.replace(tempPath, tablePath)
+
+#the coordination table at tablePath as a dict of its settings, index and
+#mapped file, or None if there's no readable table. each file is mapped once,
+#and again only after it changes, so a lookup never reads the file
+def getCoordTable(tablePath):
+    try:
+        stat = os.stat(tablePath)
+    except OSError:
+        return None
+    
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with coordTableLock:
+        if coordTableState.get(tablePath, (None,))[0] != stamp:
+            coordTableState[tablePath] = (stamp, readCoordTable(tablePath))
+        return coordTableState[tablePath][1]
+
+#map a coordination table file and read its settings and index
+def readCoordTable(tablePath):
+    try:
+        with open(tablePath, 'rb') as f:
+            tableMap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, settingsLength, count = coordTableHeader.unpack_from(tableMap, 
+                                                                     0)
+        if magic != coordTableMagic: return None
+        
+        offset = coordTableHeader.size
+        settings = json.loads(tableMap[offset:offset+settingsLength])
+        offset += settingsLength
+        
+        index = {}
+        indexBytes = tableMap[offset:offset + count*coordTableEntry.size]
+        for (downHash, upHash, ampsIndex, dataOffset, 
+                length) in coordTableEntry.iter_unpack(indexBytes):
+            index[(downHash.hex(), upHash.hex(), ampsIndex)] = (dataOffset, 
+                                                                length)
+    except (OSError, ValueError, TypeError, struct.error):
+        return None
+    
+    return {'settings': settings, 'index': index, 'map': tableMap}
+
+#solution set of a study from the coordination table at tablePath, or None
+#if there's no table or it can't answer the study. only numpy engine studies
+#with no time adder, on the table's grid of times, currents and pickups, are
+#in it
+def getTableSolutions(coordCurves, coordAmps, minCoordTime, adderRange=None,
+                      tablePath=None):
+    if (not useCoordTable or np is None or adderRange is not None or
+            coordEngine != 'numpy' or marginCheck != 'points' or 
+            tablePath is None):
+        return None
+    table = getCoordTable(tablePath)
+    if table is None: return None
+    
+    with profilePhase('coordTable'):
+        return readTableSolutions(table, coordCurves, coordAmps, minCoordTime)
+
+#getTableSolutions() from a table that's been read, if the study is in it
+def readTableSolutions(table, coordCurves, coordAmps, minCoordTime):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    pickupMin, pickupMax, coordMaxAmps = coordAmps
+    settings = table['settings']
+    tableMin, tableMax = settings['pickups']
+    pickupCount = len(range(pickupMin, pickupMax+1, ampStep))
+    
+    entry = None
+    if (settings['version'] == coordTableVersion and 
+            settings['ampStep'] == ampStep and 
+            minCoordTime in settings['times'] and
+            coordMaxAmps in settings['amps'] and
+            pickupMin >= tableMin and (pickupMin - tableMin) % ampStep == 0 and
+            pickupMin + (pickupCount-1)*ampStep <= tableMax and
+            settings['curves'] == len(recloserCurves) and
+            settings['recloserHash'] == getLibraryHash(recloserCurves)):
+        entry = table['index'].get((downstreamCurve.getHash(), 
+                                    upstreamCurve.getHash(),
+                                    settings['amps'].index(coordMaxAmps)))
+    if entry is None:
+        coordTableStats['misses'] += 1
+        return None
+    coordTableStats['hits'] += 1
+    
+    dataOffset, length = entry
+    levels = np.frombuffer(zlib.decompress(
+                table['map'][dataOffset:dataOffset+length]), dtype=np.uint8)
+    first = (pickupMin - tableMin) // ampStep
+    levels = levels.reshape(len(recloserCurves), -1)
+    levels = levels[:, first:first+pickupCount]
+    coordination = levels > settings['times'].index(minCoordTime)
+    
+    #same order as a sweep: by curve, then by pickup current
+    curveNumbers, columns = np.nonzero(coordination)
+    pickups = pickupMin + columns*ampStep
+    return [list(solution) for solution in zip(curveNumbers.tolist(), 
+                                               pickups.tolist())]
+
+#pack a list of curves into padded arrays, one row per curve.
+#rows are padded with their last point so every row stays sorted on current
+def packCurves(curves):
+    lengths = np.array([len(curve) for curve in curves])
+    currents = np.empty((len(curves), lengths.max()))
+    times = np.empty((len(curves), lengths.max()))
+    
+    for n, curve in enumerate(curves):
+        currents[n, :len(curve)] = curve.currents
+        currents[n, len(curve):] = curve.currents[-1]
+        times[n, :len(curve)] = curve.times
+        times[n, len(curve):] = curve.times[-1]
+    
+    with np.errstate(divide='ignore'):
+        return {'currents': currents,
+                'times': times,
+                'logCurrents': np.log10(currents),
+                'logTimes': np.log10(times),
+                'lengths': lengths}
+
+#worst coordination time of the points in a fixed curve against every scaled
+#recloser curve, as a (curves x pickups) array. direction is where the fixed
+#curve sits: 'd' for downstream (dvr) or 'u' for upstream (uvr)
+def fixedVsRecloserMargins(fixedCurve, recCurves, pickups, maxAmps, direction):
+    currents, margins = fixedVsRecloserPoints(fixedCurve, recCurves, pickups,
+                                              direction)
+    return np.where(currents <= maxAmps, margins, np.inf).min(axis=2)
+
+#coordination time of every point in a fixed curve against every scaled
+#recloser curve, with no current cap. returns the point currents and a
+#(curves x pickups x points) array of margins, inf outside the overlap
+def fixedVsRecloserPoints(fixedCurve, recCurves, pickups, direction):
+    length = fixedCurve['lengths'][0]
+    fixedCurrents = fixedCurve['currents'][0, :length]
+    fixedTimes = fixedCurve['times'][0, :length]
+    recCurrents = recCurves['currents']
+    lastIndex = recCurves['lengths'] - 1
+    rows = np.arange(len(recCurrents))
+    
+    #overlap check is done on scaled currents, the same way testCoord() does
+    lowAmps = recCurrents[:, 0, None] * pickups
+    highAmps = recCurrents[rows, lastIndex, None] * pickups
+    overlap = ((fixedCurrents >= lowAmps[:, :, None]) &
+               (fixedCurrents <= highAmps[:, :, None]))
+    
+    #scaling a curve by the pickup is a shift in log current, so the fixed
+    #points are shifted back onto the unscaled curves instead
+    queries = np.log10(fixedCurrents) - np.log10(pickups)[:, None]
+    queries = np.broadcast_to(queries, overlap.shape)
+    recTimes = interpolateRows(recCurves, queries)
+    if useProfile: profileCounters['interpolations'] += queries.size
+    
+    coordTimes = recTimes - fixedTimes
+    if direction == 'u': coordTimes = -coordTimes
+    
+    #points outside of the overlap can't fail, same as in testCoord()
+    return fixedCurrents, np.where(overlap, coordTimes, np.inf)
+
+#worst coordination time of the points in every scaled recloser curve against
+#a fixed curve, as a (curves x pickups) array. direction is where the fixed
+#curve sits: 'd' for downstream (rvd) or 'u' for upstream (rvu)
+def recloserVsFixedMargins(recCurves, fixedCurve, pickups, maxAmps, direction):
+    currents, margins = recloserVsFixedPoints(recCurves, fixedCurve, pickups,
+                                              direction)
+    return np.where(currents <= maxAmps, margins, np.inf).min(axis=2)
+
+#coordination time of every point in every scaled recloser curve against a
+#fixed curve, with no current cap. returns the scaled point currents and the
+#margins, both (curves x pickups x points), inf outside the overlap
+def recloserVsFixedPoints(recCurves, fixedCurve, pickups, direction):
+    length = fixedCurve['lengths'][0]
+    fixedCurrents = fixedCurve['currents'][0, :length]
+    recCurrents = recCurves['currents'][:, None, :] * pickups[:, None]
+    recTimes = recCurves['times'][:, None, :]
+    padding = (np.arange(recCurrents.shape[2]) >= 
+                recCurves['lengths'][:, None])[:, None, :]
+    
+    overlap = ((recCurrents >= fixedCurrents[0]) &
+               (recCurrents <= fixedCurrents[-1]) & ~padding)
+    
+    fixedTimes = interpolateFixed(fixedCurve, recCurrents)
+    if useProfile: profileCounters['interpolations'] += recCurrents.size
+    
+    coordTimes = recTimes - fixedTimes
+    if direction == 'u': coordTimes = -coordTimes
+    
+    return recCurrents, np.where(overlap, coordTimes, np.inf)
+
+#log interpolation of one curve at any array of currents.
+#matches interpolateTime() for currents inside the curve
+def interpolateFixed(packedCurve, queryCurrents):
+    length = packedCurve['lengths'][0]
+    currents = packedCurve['currents'][0, :length]
+    logCurrents = packedCurve['logCurrents'][0, :length]
+    logTimes = packedCurve['logTimes'][0, :length]
+    
+    #first point with current >= query. interpolate between it and the
+    #point before it, just like the linear scan in interpolateTime()
+    index = np.searchsorted(currents, queryCurrents, side='left')
+    index = np.clip(index, 1, length - 1)
+    
+    #far outside the curve the extrapolation can overflow, but those currents
+    #are outside the overlap and masked off by the callers
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        return interpolateSegments(logCurrents[index-1], logCurrents[index],
+                                   logTimes[index-1], logTimes[index],
+                                   np.log10(queryCurrents))
+
+#log interpolation of each row of packed curves at log currents.
+#queries is (curves x ...) and row n of queries is looked up on curve n
+def interpolateRows(packedCurves, queries):
+    logCurrents = packedCurves['logCurrents']
+    logTimes = packedCurves['logTimes']
+    rowCount, rowLength = logCurrents.shape
+    rows = np.arange(rowCount)
+    
+    #offset every row into its own band so one sorted searchsorted call can
+    #look up all of the rows at once
+    finite = logCurrents[np.isfinite(logCurrents)]
+    band = (finite.max() - finite.min()) + 1.0
+    offsets = rows * band
+    flatCurrents = (logCurrents + offsets[:, None]).ravel()
+    
+    shape = queries.shape
+    flatQueries = queries.reshape(rowCount, -1)
+    rowOffsets = offsets[:, None]
+    index = np.searchsorted(flatCurrents, 
+                            np.clip(flatQueries, finite.min() - 0.5, 
+                                    finite.max() + 0.5) + rowOffsets,
+                            side='left')
+    index = index - (rows * rowLength)[:, None]
+    index = np.clip(index, 1, (packedCurves['lengths'] - 1)[:, None])
+    
+    rowIndex = rows[:, None]
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        logTime = interpolateSegments(logCurrents[rowIndex, index-1], 
+                                      logCurrents[rowIndex, index],
+                                      logTimes[rowIndex, index-1],
+                                      logTimes[rowIndex, index],
+                                      flatQueries)
+    return logTime.reshape(shape)
+
+#straight line interpolation in log-log space, returned as a time
+def interpolateSegments(logCurrent0, logCurrent1, logTime0, logTime1, logQuery):
+    span = logCurrent1 - logCurrent0
+    #vertical segments only happen at duplicated currents. the first of the
+    #duplicated points wins, same as in interpolateTime()
+    fraction = np.where(span > 0, (logQuery - logCurrent0) / span, 0.0)
+    return np.power(10.0, logTime0 + fraction * (logTime1 - logTime0))
+    
+#number of worker processes to actually use
+def getWorkerCount():
+    if workerCount == 0: return os.cpu_count() or 1
+    return workerCount
+
+#getSolutions() spread over a pool of worker processes, one chunk of recloser
+#curves per task. solutions come back in the same order as a serial run
+def getSolutionsParallel(coordCurves, coordAmps, minCoordTime, 
+                         adderRange=None, cacheMargins=None):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    workers = min(getWorkerCount(), len(recloserCurves))
+    
+    #a few chunks per worker keeps them all busy if some curves are slower
+    chunkSize = max(1, len(recloserCurves) // (workers * 4))
+    starts = range(0, len(recloserCurves), chunkSize)
+    tasks = [(downstreamCurve, upstreamCurve, start, start + chunkSize,
+              coordAmps, minCoordTime, adderRange, cacheMargins) 
+             for start in starts]
+    
+    resetPruneStats()
+    solutionSet = []
+    with startWorkerPool(recloserCurves, workers) as pool:
+        for start, (chunkSolutions, chunkStats, 
+                    chunkProfile) in zip(starts, pool.map(sweepChunk, tasks)):
+            for solution in chunkSolutions:
+                solution[0] += start
+                solutionSet.append(solution)
+            for key in pruneStats:
+                pruneStats[key] += chunkStats[key]
+            addProfile(chunkProfile, start)
+    
+    return solutionSet
+
+#worker task: run the sweep on a slice of the shared recloser curves.
+#curve numbers in the result are relative to the start of the slice.
+#the worker's pruning stats and profile come back along with the solutions
+def sweepChunk(task):
+    (downstreamCurve, upstreamCurve, start, stop, coordAmps, minCoordTime,
+     adderRange, cacheMargins) = task
+    coordCurves = (downstreamCurve, upstreamCurve, 
+                   workerState['recloserCurves'][start:stop])
+    resetProfile()
+    solutionSet = sweepSolutions(coordCurves, coordAmps, minCoordTime, 
+                                 adderRange, cacheMargins)
+    return solutionSet, dict(pruneStats), getProfileState()
+
+#getSolutions() as a stream of the ranges getSolutionRanges() would give. the
+#recloser curves are swept streamChunkSize at a time and each piece's ranges
+#are yielded as soon as it's done, so nothing waits on the whole sweep.
+#with workers, pieces are swept in parallel but still come out in order.
+#a result in library's coordination table or result cache is streamed from
+#there. otherwise, with the result cache on, the solutions are kept as they
+#go by and the finished sweep is stored, with the time spent sweeping (not
+#the time the caller spent on the ranges). with no library, it's all swept
+def iterSolutionRanges(coordCurves, coordAmps, minCoordTime, adderRange=None,
+                       library=None):
+    key = None
+    if traceLevel < 2 and library is not None:
+        solutionSet = getTableSolutions(coordCurves, coordAmps, minCoordTime,
+                                        adderRange, library.coordTablePath)
+        if (solutionSet is None and useResultCache and 
+                library.resultCachePath is not None):
+            key = getResultKey(coordCurves, coordAmps, minCoordTime, 
+                               adderRange)
+            solutionSet = readCachedResult(library.resultCachePath, key)
+        if solutionSet is not None:
+            resetPruneStats()
+            yield from encodeRanges(solutionSet)
+            return
+    
+    #with a key, the result cache missed and the sweep goes in it when it's done
+    solutionSet = [] if key is not None else None
+    totals = dict.fromkeys(pruneStats, 0)
+    chunks = iterSweepChunks(coordCurves, coordAmps, minCoordTime, adderRange)
+    seconds = 0.0
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        seconds += time.perf_counter() - start
+        if chunk is None: break
+        
+        start, chunkSolutions, chunkStats = chunk
+        for solution in chunkSolutions:
+            solution[0] += start
+        for name in totals:
+            totals[name] += chunkStats[name]
+        if solutionSet is not None: solutionSet += chunkSolutions
+        yield from encodeRanges(chunkSolutions)
+    
+    pruneStats.update(totals)
+    if key is not None:
+        with profilePhase('resultCache'):
+            writeCachedResult(library.resultCachePath, key, solutionSet, 
+                              seconds)
+
+#sweep the recloser curves a piece at a time, yielding (first curve number,
+#solutions, pruning stats) for each piece in order
+def iterSweepChunks(coordCurves, coordAmps, minCoordTime, adderRange):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    starts = range(0, len(recloserCurves), streamChunkSize)
+    workers = min(getWorkerCount(), len(starts))
+    
+    if workers > 1:
+        tasks = [(downstreamCurve, upstreamCurve, start, 
+                  start + streamChunkSize, coordAmps, minCoordTime, adderRange,
+                  False) for start in starts]
+        with startWorkerPool(recloserCurves, workers) as pool:
+            for start, (chunkSolutions, chunkStats, 
+                        chunkProfile) in zip(starts, pool.imap(sweepChunk, 
+                                                               tasks)):
+                addProfile(chunkProfile, start)
+                yield start, chunkSolutions, chunkStats
+    else:
+        for start in starts:
+            chunkCurves = (downstreamCurve, upstreamCurve,
+                           recloserCurves[start:start+streamChunkSize])
+            #curve times are counted from 0 in each piece, so they're
+            #moved up to the piece's first curve
+            curveTimes = dict(profileCurveTimes)
+            profileCurveTimes.clear()
+            chunkSolutions = sweepSolutions(chunkCurves, coordAmps, 
+                                            minCoordTime, adderRange, False)
+            chunkProfile = ({}, dict(profileCurveTimes))
+            profileCurveTimes.clear()
+            profileCurveTimes.update(curveTimes)
+            addProfile(chunkProfile, start)
+            yield start, chunkSolutions, dict(pruneStats)
+
+#start a pool of worker processes that can all see the recloser curves.
+#curve data is put in one shared memory block that every worker reads when it
+#starts, so no curve is ever pickled for a task. extra is handed to every
+#worker as is, for anything else it needs
+@contextlib.contextmanager
+def startWorkerPool(recloserCurves, workers, extra=None):
+    block = shareCurves(recloserCurves)
+    
+    #settings may have been changed since import, and spawned workers start
+    #from a fresh import, so pass them along
+    settings = {'coordEngine': coordEngine,
+                'marginCheck': marginCheck,
+                'ampStep': ampStep,
+                'adderStep': adderStep,
+                'useMarginCache': useMarginCache,
+                'marginCacheSize': marginCacheSize,
+                'useResultCache': useResultCache,
+                'resultCacheSize': resultCacheSize,
+                'rankCount': rankCount,
+                'rankScore': rankScore,
+                'useCoordTable': useCoordTable,
+                'coordTableTimes': coordTableTimes,
+                'coordTableAmps': coordTableAmps,
+                'coordTablePickups': coordTablePickups,
+                'usePruning': usePruning,
+                'envelopeBandWidth': envelopeBandWidth,
+                'pruneBlockSize': pruneBlockSize,
+                'useProfile': useProfile}
+    
+    pool = multiprocessing.Pool(workers, initializer=initWorker,
+                                initargs=(block.name, settings, extra))
+    try:
+        yield pool
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        block.close()
+        block.unlink()
+
+#copy curves into a new shared memory block as float64s:
+#   curve count, every curve's length, then all currents, then all times
+def shareCurves(curves):
+    lengths = [len(curve) for curve in curves]
+    valueCount = 1 + len(curves) + 2*sum(lengths)
+    block = shared_memory.SharedMemory(create=True, size=8*valueCount)
+    
+    values = array.array('d', [len(curves)])
+    values.extend(lengths)
+    for curve in curves:
+        values.extend(curve.currents)
+    for curve in curves:
+        values.extend(curve.times)
+    
+    block.buf[:8*valueCount] = values.tobytes()
+    return block
+
+#read curves back out of a shared memory block written by shareCurves()
+def readSharedCurves(block):
+    with block.buf.cast('d') as values:
+        curveCount = int(values[0])
+        lengths = [int(length) for length in values[1:1+curveCount]]
+        
+        curves = []
+        currentStart = 1 + curveCount
+        timeStart = currentStart + sum(lengths)
+        for length in lengths:
+            currents = values[currentStart:currentStart+length].tolist()
+            times = values[timeStart:timeStart+length].tolist()
+            curves.append(CompiledCurve(zip(currents, times)))
+            currentStart += length
+            timeStart += length
+    
+    return curves
+
+#whatever a worker process needs between tasks, set up by initWorker()
+workerState = {}
+
+#worker process setup: copy the settings and compile the shared curves.
+#workers never start pools of their own and never trace
+def initWorker(blockName, settings, extra):
+    global workerCount, traceLevel
+    globals().update(settings)
+    workerCount = 1
+    traceLevel = 0
+    
+    block = shared_memory.SharedMemory(name=blockName)
+    workerState['recloserCurves'] = readSharedCurves(block)
+    block.close()
+    buildEnvelopeIndex(workerState['recloserCurves'])
+    workerState['extra'] = extra
+
+#test coordination time between two curves
+def testCoord(curve1, curve2, minCoordTime, direction, maxAmps):
+    #test every point in the recloser curve against a test curve
+    #a data point in a curve is [amperage, time]
+    #curves are always sorted low to high on amperage
+    low = curve2[0][0]
+    high = min(curve2[-1][0], maxAmps)
+    interpolations = 0
+    coordination = True
+    for point in curve1:
+        #check if point overlaps with curve2 at this current
+        if (point[0] >= low) and (point[0] <= high):
+            #perform a linear interpolation to get time difference at specific current
+            coordTime = point[1] - interpolateTime(curve2, point[0])
+            interpolations += 1
+            if direction == 'd': coordTime = -coordTime
+            if traceLevel >= 3: trace('margin', point[0], coordTime)
+            if coordTime < minCoordTime:
+                if traceLevel >= 2: trace('fail', point[0], coordTime)
+                coordination = False
+                break
+    
+    if useProfile:
+        profileCounters['marginChecks'] += 1
+        profileCounters['interpolations'] += interpolations
+    if coordination and traceLevel >= 2: trace('pass', None, None)
+    return coordination
+
+#worst coordination time of curve1's points against curve2, the same margins
+#testCoord() checks. inf if no point of curve1 overlaps curve2
+def getPointMargin(curve1, curve2, direction, maxAmps):
+    minMargin = math.inf
+    low = curve2[0][0]
+    high = min(curve2[-1][0], maxAmps)
+    interpolations = 0
+    for point in curve1:
+        if (point[0] >= low) and (point[0] <= high):
+            coordTime = point[1] - interpolateTime(curve2, point[0])
+            interpolations += 1
+            if direction == 'd': coordTime = -coordTime
+            minMargin = min(minMargin, coordTime)
+    
+    if useProfile:
+        profileCounters['marginChecks'] += 1
+        profileCounters['interpolations'] += interpolations
+    return minMargin
+
+#test coordination between a slower curve and a faster curve using the true
+#minimum margin between them, not just the margin at the data points
+def testCoordExact(slowCurve, fastCurve, minCoordTime, maxAmps):
+    coordTime, coordAmps = getMinMargin(slowCurve, fastCurve, maxAmps)
+    if traceLevel >= 2:
+        trace('pass' if coordTime >= minCoordTime else 'fail', 
+              coordAmps, coordTime)
+    return coordTime >= minCoordTime
+
+#minimum of (slowCurve time - fastCurve time) over the current range both
+#curves cover, capped at maxAmps. both curves' breakpoints are walked together
+#in one merge, and between breakpoints each curve is a single straight line in
+#log-log space, so the minimum is at a breakpoint or where the slopes balance.
+#returns the minimum margin and the current it happens at. a margin of inf
+#means the curves never overlap
+def getMinMargin(slowCurve, fastCurve, maxAmps):
+    slowLogs = slowCurve.logCurrents
+    fastLogs = fastCurve.logCurrents
+    slowSlopes, slowIntercepts = slowCurve.slopes, slowCurve.intercepts
+    fastSlopes, fastIntercepts = fastCurve.slopes, fastCurve.intercepts
+    
+    low = max(slowLogs[0], fastLogs[0])
+    high = min(slowLogs[-1], fastLogs[-1], math.log10(maxAmps))
+    if low > high: return math.inf, None
+    
+    #segments the overlap starts in. vertical segments are skipped, since
+    #nothing can be interpolated across them
+    i = max(bisect.bisect_right(slowLogs, low) - 1, 0)
+    j = max(bisect.bisect_right(fastLogs, low) - 1, 0)
+    i = min(i, len(slowLogs) - 2)
+    j = min(j, len(fastLogs) - 2)
+    
+    minMargin = math.inf
+    minLogCurrent = low
+    start = low
+    interpolations = 0
+    
+    while True:
+        end = min(slowLogs[i+1], fastLogs[j+1], high)
+        
+        m1, b1 = slowSlopes[i], slowIntercepts[i]
+        m2, b2 = fastSlopes[j], fastIntercepts[j]
+        
+        #margin at both ends of this piece, plus where its derivative is zero
+        #if that's inside. d/dx(10^(b1+m1x) - 10^(b2+m2x)) = 0 at m1*t1 = m2*t2
+        candidates = [start, end]
+        if m1 != m2 and m1 * m2 > 0:
+            turn = (math.log10(m2 / m1) - (b1 - b2)) / (m1 - m2)
+            if start < turn < end: candidates.append(turn)
+        
+        interpolations += 2 * len(candidates)
+        for logCurrent in candidates:
+            margin = (math.pow(10, b1 + m1*logCurrent) - 
+                      math.pow(10, b2 + m2*logCurrent))
+            if margin < minMargin:
+                minMargin = margin
+                minLogCurrent = logCurrent
+        
+        if end >= high: break
+        
+        #step past whichever breakpoint(s) ended this piece
+        start = end
+        while i < len(slowLogs) - 2 and slowLogs[i+1] <= start: i += 1
+        while j < len(fastLogs) - 2 and fastLogs[j+1] <= start: j += 1
+    
+    if useProfile:
+        profileCounters['marginChecks'] += 1
+        profileCounters['interpolations'] += interpolations
+    return minMargin, math.pow(10, minLogCurrent)
+
+#helper function for logarithmic interpolation. the math itself is done by
+#the compiled curve, this just keeps the trace up to date
+def interpolateTime(interCurve, interCurrent):
+    interTime = interCurve.interpolate(interCurrent)
+    if traceLevel >= 3: trace('interp', interCurrent, interTime)
+    return interTime
+    
+def getNewCTRatio(pickupCurrent):
+    oldRatio = 0
+    newRatio = 0
+    
+    #accepts user input only if an integer, then converts input to an integer
+    inputOK = False
+    while inputOK == False:
+        oldRatioIn = input("!! Breaker pickup current is unusually low\n" +
+                            "CT ratio setting in CAPE is likely wrong\n"
+                            "Please enter current CT setting from CAPE (usually 1)\n>>")
+        
+        inputOK = oldRatioIn.isdecimal()
+        
+        if inputOK == False:
+            print("\n!! Please enter a valid CT ratio setting\n")
+        else:
+            oldRatio = int(oldRatioIn)
+            print("")
+            
+    inputOK = False
+    while inputOK == False:
+        newRatioIn = input("Please enter new CT ratio (usually 160)\n>>")
+        
+        inputOK = newRatioIn.isdecimal()
+        
+        if inputOK == False:
+            print("\n!! Please enter a valid CT ratio setting\n")
+        else:
+            newRatio = int(newRatioIn)
+            print("")
+    
+    return oldRatio, newRatio
+  
+#coordination margins of every accepted setting over a grid of fault
+#currents, for plotting or checking without going back to CAPE. a setting is
+#a curve number, pickup and time adder:
+#   [curve, pickup]             -> that pickup, no adder
+#   [curve, min, max]           -> both ends of an 'exact' engine interval
+#   [curve, pickup, min, max]   -> that pickup at its lowest adder
+#margins are the recloser time minus the downstream time ('down') and the
+#upstream time minus the recloser time ('up'), interpolated on all three
+#curves at each current. where either curve of a pair doesn't reach a
+#current, the margin is nan. returns a dict of:
+#   currents   -> the fault current grid
+#   settings   -> (curve, pickup, adder) rows
+#   down, up   -> (settings x currents) margins
+#   worstDown, worstDownAmps, worstUp, worstUpAmps
+#              -> each setting's worst margin and the current it's at, nan
+#                 if the curves never overlap
+#with numpy, the grid is worked out for a whole chunk of settings at once
+def getMarginReport(coordCurves, solutionSet, coordMaxAmps):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    
+    settings = []
+    for solution in solutionSet:
+        if len(solution) == 2:
+            settings.append((solution[0], solution[1], 0))
+        elif len(solution) == 3:
+            settings.append((solution[0], solution[1], 0))
+            if solution[2] != solution[1]:
+                settings.append((solution[0], solution[2], 0))
+        else:
+            settings.append((solution[0], solution[1], solution[2]))
+    
+    logLow = math.log10(min(downstreamCurve[0][0], upstreamCurve[0][0]))
+    logHigh = math.log10(coordMaxAmps)
+    pointCount = marginReportPoints if logHigh > logLow else 0
+    currents = [math.pow(10, logLow + (logHigh - logLow) * k / 
+                                      max(pointCount - 1, 1))
+                for k in range(pointCount)]
+    
+    if np is not None:
+        down, up = getMarginMatrices(coordCurves, settings, 
+                                     np.array(currents))
+    else:
+        down, up = getMarginRows(coordCurves, settings, currents)
+    
+    report = {'currents': currents, 'settings': settings, 
+              'down': down, 'up': up}
+    for name, margins in (('Down', down), ('Up', up)):
+        if np is not None and len(currents):
+            #nan never wins the argmin, and rows of nothing but nan are put
+            #back to nan afterwards
+            missing = np.isnan(margins)
+            columns = np.argmin(np.where(missing, np.inf, margins), axis=1)
+            found = ~missing.all(axis=1)
+            worst = np.where(found, margins[np.arange(len(margins)), columns],
+                             np.nan).tolist()
+            worstAmps = np.where(found, np.array(currents)[columns], 
+                                 np.nan).tolist()
+        else:
+            worst = []
+            worstAmps = []
+            for row in margins:
+                found = [(margin, current) for margin, current 
+                         in zip(row, currents) if not math.isnan(margin)]
+                margin, current = min(found) if found else (math.nan, 
+                                                            math.nan)
+                worst.append(margin)
+                worstAmps.append(current)
+        report['worst' + name] = worst
+        report['worst' + name + 'Amps'] = worstAmps
+    
+    return report
+
+#down and up margin arrays for getMarginReport(). every chunk of settings is
+#one array operation: the recloser curves are packed once, repeated out to a
+#row per setting, and looked up at every current shifted by its pickup
+def getMarginMatrices(coordCurves, settings, currents):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    down = np.full((len(settings), len(currents)), np.nan)
+    up = np.full((len(settings), len(currents)), np.nan)
+    if not settings or not len(currents): return down, up
+    
+    curveNumbers = np.array([setting[0] for setting in settings])
+    pickups = np.array([setting[1] for setting in settings], dtype=float)
+    adders = np.array([setting[2] for setting in settings], dtype=float)
+    
+    usedCurves = np.unique(curveNumbers)
+    packed = packCurves([recloserCurves[n] for n in usedCurves])
+    curveRows = np.searchsorted(usedCurves, curveNumbers)
+    
+    #the fixed curves only depend on the current
+    downCurve = packCurves([downstreamCurve])
+    upCurve = packCurves([upstreamCurve])
+    with np.errstate(invalid='ignore'):
+        downTimes = np.where((currents >= downstreamCurve[0][0]) & 
+                             (currents <= downstreamCurve[-1][0]),
+                             interpolateFixed(downCurve, currents), np.nan)
+        upTimes = np.where((currents >= upstreamCurve[0][0]) & 
+                           (currents <= upstreamCurve[-1][0]),
+                           interpolateFixed(upCurve, currents), np.nan)
+    logCurrents = np.log10(currents)
+    
+    chunk = max(1, marginGridCells // len(currents))
+    for start in range(0, len(settings), chunk):
+        rows = curveRows[start:start+chunk]
+        rowCurves = {key: value[rows] for key, value in packed.items()}
+        rowPickups = pickups[start:start+chunk, None]
+        
+        lowAmps = rowCurves['currents'][:, 0, None] * rowPickups
+        highAmps = (rowCurves['currents'][np.arange(len(rows)), 
+                                          rowCurves['lengths'] - 1, None] * 
+                    rowPickups)
+        queries = logCurrents - np.log10(rowPickups)
+        recTimes = (interpolateRows(rowCurves, queries) + 
+                    adders[start:start+chunk, None])
+        recTimes = np.where((currents >= lowAmps) & (currents <= highAmps),
+                            recTimes, np.nan)
+        
+        down[start:start+chunk] = recTimes - downTimes
+        up[start:start+chunk] = upTimes - recTimes
+    
+    if useProfile:
+        profileCounters['interpolations'] += down.size + 2 * len(currents)
+    
+    return down, up
+
+#getMarginMatrices() without numpy, as lists of rows
+def getMarginRows(coordCurves, settings, currents):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    
+    def timeAt(curve, current):
+        if curve[0][0] <= current <= curve[-1][0]:
+            return curve.interpolate(current)
+        return math.nan
+    
+    downTimes = [timeAt(downstreamCurve, current) for current in currents]
+    upTimes = [timeAt(upstreamCurve, current) for current in currents]
+    
+    down = []
+    up = []
+    for n, pickupCurrent, adder in settings:
+        testCurve = recloserCurves[n].scaled(pickupCurrent)
+        recTimes = [timeAt(testCurve, current) + adder for current in currents]
+        down.append([recTime - downTime 
+                     for recTime, downTime in zip(recTimes, downTimes)])
+        up.append([upTime - recTime 
+                   for recTime, upTime in zip(recTimes, upTimes)])
+    
+    return down, up
+
+#write a margin report. a .npz path gets one compressed numpy file holding
+#every array in the report. anything else is written as CSV: a summary of each
+#setting's worst margins at reportPath, plus the down and up margin matrices
+#next to it, with a row per setting and a column per fault current
+def writeMarginReport(reportPath, report, recloserList):
+    curveNames = [recloserList[n] for n, pickupCurrent, adder 
+                  in report['settings']]
+    pickups = [pickupCurrent for n, pickupCurrent, adder in report['settings']]
+    adders = [adder for n, pickupCurrent, adder in report['settings']]
+    
+    if reportPath.lower().endswith('.npz'):
+        if np is None: raise ValueError("numpy is needed to write .npz reports")
+        np.savez_compressed(reportPath, 
+                            currents=np.array(report['currents']),
+                            curves=np.array(curveNames, dtype=str),
+                            pickups=np.array(pickups, dtype=float),
+                            adders=np.array(adders, dtype=float),
+                            down=np.asarray(report['down'], dtype=np.float32),
+                            up=np.asarray(report['up'], dtype=np.float32),
+                            **{name: np.array(report[name]) for name in 
+                               ('worstDown', 'worstDownAmps', 
+                                'worstUp', 'worstUpAmps')})
+        return
+    
+    #nan is the only value that isn't equal to itself
+    def cells(values):
+        return ["{0:.6g}".format(value) if value == value else '' 
+                for value in values]
+    
+    with open(reportPath, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['curve', 'pickup', 'adder', 'worstDown', 
+                         'worstDownAmps', 'worstUp', 'worstUpAmps'])
+        for k, curveName in enumerate(curveNames):
+            writer.writerow([curveName, pickups[k], adders[k]] + 
+                            cells([report[name][k] for name in 
+                                   ('worstDown', 'worstDownAmps', 
+                                    'worstUp', 'worstUpAmps')]))
+    
+    stem = os.path.splitext(reportPath)[0]
+    for name in ('down', 'up'):
+        with open("{0}_{1}.csv".format(stem, name), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['curve', 'pickup', 'adder'] + 
+                            ["{0:.6g}".format(current) 
+                             for current in report['currents']])
+            for k, row in enumerate(report[name]):
+                if np is not None: row = np.asarray(row).tolist()
+                writer.writerow([curveNames[k], pickups[k], adders[k]] + 
+                                cells(row))
+
+#chance of miscoordination of every setting in a solution set, when the curves
+#are off from their data by a manufacturing or timing tolerance (see
+#curveTolerances). every setting is checked at the curve data points, like
+#testCoord(), in each of toleranceSamples samples. settings are taken from the
+#solutions as in getMarginReport(), except that a setting with an adder range
+#is checked at every adder in it, and the adder that miscoordinates least often
+#is kept (the one nearest the middle of the range, on a tie). returns a dict of:
+#   samples         -> number of samples
+#   settings        -> (curve, pickup, adder) rows
+#   probability     -> each setting's share of samples that don't coordinate
+#   downProbability -> the share that don't coordinate downstream
+#   upProbability   -> the share that don't coordinate upstream
+#chunks of settings are checked in every sample as one array operation, and
+#spread over a worker pool when workerCount asks for one. numpy is needed
+def getToleranceReport(coordCurves, solutionSet, coordMaxAmps, minCoordTime):
+    if np is None: raise ValueError("numpy is needed for tolerance reports")
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    
+    #settings here are (curve, pickup, lowest adder, highest adder)
+    settings = []
+    for solution in solutionSet:
+        if len(solution) == 2:
+            settings.append((solution[0], solution[1], 0, 0))
+        elif len(solution) == 3:
+            settings.append((solution[0], solution[1], 0, 0))
+            if solution[2] != solution[1]:
+                settings.append((solution[0], solution[2], 0, 0))
+        else:
+            settings.append(tuple(solution))
+    
+    samples = getToleranceSamples(toleranceSamples)
+    chunk = max(1, marginGridCells // max(toleranceSamples, 1))
+    chunks = [settings[start:start+chunk] 
+              for start in range(0, len(settings), chunk)]
+    
+    rows = []
+    if getWorkerCount() > 1 and len(chunks) > 1:
+        workers = min(getWorkerCount(), len(chunks))
+        tasks = [(downstreamCurve, upstreamCurve, chunkSettings, samples, 
+                  coordMaxAmps, minCoordTime) for chunkSettings in chunks]
+        with startWorkerPool(recloserCurves, workers) as pool:
+            for chunkRows, chunkProfile in pool.map(toleranceChunk, tasks):
+                rows.extend(chunkRows)
+                addProfile(chunkProfile)
+    else:
+        for chunkSettings in chunks:
+            rows.extend(getToleranceRows(coordCurves, chunkSettings, samples,
+                                         coordMaxAmps, minCoordTime))
+    
+    return {'samples': toleranceSamples,
+            'settings': [row[0] for row in rows],
+            'probability': [row[1] for row in rows],
+            'downProbability': [row[2] for row in rows],
+            'upProbability': [row[3] for row in rows]}
+
+#sampleCount random current and time factors for each curve, drawn as set in
+#curveTolerances. returns {'downstream': (current factors, time factors),
+#'upstream': ..., 'recloser': ...}
+def getToleranceSamples(sampleCount):
+    random = np.random.default_rng(toleranceSeed)
+    samples = {}
+    for curveName in ('downstream', 'upstream', 'recloser'):
+        factors = []
+        for quantity in ('current', 'time'):
+            tolerance = curveTolerances[curveName].get(quantity)
+            if tolerance is None:
+                x = np.zeros(sampleCount)
+            elif tolerance[0] == 'normal':
+                x = random.normal(0, tolerance[1], sampleCount)
+            elif tolerance[0] == 'uniform':
+                x = random.uniform(-tolerance[1], tolerance[1], sampleCount)
+            else:
+                raise ValueError("unknown tolerance distribution '{0}'".format(
+                        tolerance[0]))
+            #a curve is never scaled down to nothing, however wide the spread
+            factors.append(np.maximum(1 + x, 0.01))
+        samples[curveName] = tuple(factors)
+    return samples
+
+#worker task: getToleranceRows() for a chunk of settings, against the shared
+#recloser curves. the worker's profile comes back with the rows
+def toleranceChunk(task):
+    (downstreamCurve, upstreamCurve, settings, samples, maxAmps, 
+     minCoordTime) = task
+    coordCurves = (downstreamCurve, upstreamCurve, 
+                   workerState['recloserCurves'])
+    resetProfile()
+    rows = getToleranceRows(coordCurves, settings, samples, maxAmps, 
+                            minCoordTime)
+    return rows, getProfileState()
+
+#((curve, pickup, adder), probability, down probability, up probability) for
+#each of a chunk of (curve, pickup, lowest adder, highest adder) settings
+def getToleranceRows(coordCurves, settings, samples, maxAmps, minCoordTime):
+    pickups = np.array([setting[1] for setting in settings], dtype=float)
+    adderMins = np.array([setting[2] for setting in settings], dtype=float)
+    adderMaxs = np.array([setting[3] for setting in settings], dtype=float)
+    
+    #an adder only moves the recloser curve up, so the margins are worked out
+    #once without it. they only have to be right where some adder could fail
+    down, up = getSampleMargins(coordCurves, 
+                                [setting[0] for setting in settings], pickups,
+                                samples, maxAmps, minCoordTime - adderMins,
+                                minCoordTime + adderMaxs)
+    
+    #fewest failures first, then the adder nearest the middle of the range.
+    #settings that can't fail at any adder in their range keep the middle one
+    steps = np.floor((adderMaxs - adderMins) / adderStep + 1e-9)
+    adders = adderMins + np.floor(steps / 2) * adderStep
+    risky = np.nonzero((steps > 0) & 
+                       ((down.min(axis=1) < minCoordTime - adderMins) | 
+                        (up.min(axis=1) < minCoordTime + adderMaxs)))[0]
+    bestScores = np.full(len(settings), np.inf)
+    for step in range(int(steps[risky].max(initial=0)) + 1):
+        rows = risky[steps[risky] >= step]
+        stepAdders = adderMins[rows] + step * adderStep
+        failures = np.count_nonzero((down[rows] + stepAdders[:, None] < 
+                                     minCoordTime) |
+                                    (up[rows] - stepAdders[:, None] < 
+                                     minCoordTime), axis=1)
+        scores = failures + abs(step - steps[rows] / 2) / (steps[rows] + 1)
+        better = scores < bestScores[rows]
+        bestScores[rows[better]] = scores[better]
+        adders[rows[better]] = stepAdders[better]
+    
+    downFails = down + adders[:, None] < minCoordTime
+    upFails = up - adders[:, None] < minCoordTime
+    sampleCount = down.shape[1]
+    probability = np.count_nonzero(downFails | upFails, axis=1) / sampleCount
+    downProbability = np.count_nonzero(downFails, axis=1) / sampleCount
+    upProbability = np.count_nonzero(upFails, axis=1) / sampleCount
+    
+    return [((setting[0], setting[1], float(adders[k])), float(probability[k]),
+             float(downProbability[k]), float(upProbability[k]))
+            for k, setting in enumerate(settings)]
+
+#worst down and up margin, without adders, of every setting in every sample,
+#as two (settings x samples) arrays. inf where the curves never overlap. to
+#save work, a margin is only exact where it's under that setting's downLimit
+#(upLimit). anywhere else it's somewhere at or over the limit
+def getSampleMargins(coordCurves, curveNumbers, pickups, samples, maxAmps,
+                     downLimits, upLimits):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    usedCurves = np.unique(curveNumbers)
+    recCurves = packCurves([recloserCurves[n] for n in usedCurves])
+    curveRows = np.searchsorted(usedCurves, curveNumbers)
+    recAmps, recScales = samples['recloser']
+    
+    #every recloser point, scaled by its setting's pickup
+    recLengths = recCurves['lengths'][curveRows]
+    recLogs = recCurves['logCurrents'][curveRows] + np.log10(pickups)[:, None]
+    recTimes = recCurves['times'][curveRows]
+    recPoints = np.arange(recLogs.shape[1]) < recLengths[:, None]
+    
+    margins = []
+    for fixedCurve, side, sign, limits in (
+            (downstreamCurve, 'downstream', 1, downLimits),
+            (upstreamCurve, 'upstream', -1, upLimits)):
+        fixedCurve = packCurves([fixedCurve])
+        fixedAmps, fixedScales = samples[side]
+        length = fixedCurve['lengths'][0]
+        fixedLogs = np.broadcast_to(fixedCurve['logCurrents'][0, :length], 
+                                    (len(pickups), length))
+        fixedTimes = np.broadcast_to(fixedCurve['times'][0, :length],
+                                     fixedLogs.shape)
+        worst = np.full((len(pickups), len(recAmps)), np.inf)
+        
+        #fixed points against the recloser curves (dvr or uvr). the pickup
+        #and both curves' current factors only shift the fixed points along
+        #the unscaled recloser curve
+        foldSampleMargins(worst, recCurves, curveRows, fixedLogs, 
+                          fixedLogs - np.log10(pickups)[:, None], fixedTimes, 
+                          np.ones(fixedLogs.shape, dtype=bool),
+                          np.log10(fixedAmps) - np.log10(recAmps),
+                          (recScales, fixedScales, fixedAmps), maxAmps, sign,
+                          limits)
+        
+        #recloser points against the fixed curve (rvd or rvu)
+        foldSampleMargins(worst, fixedCurve, np.zeros_like(curveRows), 
+                          recLogs, recLogs, recTimes, recPoints,
+                          np.log10(recAmps) - np.log10(fixedAmps),
+                          (fixedScales, recScales, recAmps), maxAmps, -sign,
+                          limits)
+        margins.append(worst)
+    
+    return margins
+
+#fold the margins in every sample at a set of points against a packed curve
+#into worst, a (settings x samples) array. each setting's points (one row of
+#pointLogs, queries, pointTimes and valid) are looked up on packed curve
+#curveRows[setting] at their query plus each sample's shift. factors are the
+#(curve time, point time, point current) factors of each sample. the margin is
+#sign * (curve time - point time): 1 when the curve is the slower one
+def foldSampleMargins(worst, packedCurves, curveRows, pointLogs, queries, 
+                      pointTimes, valid, shifts, factors, maxAmps, sign, 
+                      limits):
+    curveScales, pointScales, pointAmps = factors
+    lengths = packedCurves['lengths'][curveRows]
+    lowLogs = packedCurves['logCurrents'][curveRows, 0][:, None]
+    highLogs = packedCurves['logCurrents'][curveRows, lengths - 1][:, None]
+    falling = (np.diff(packedCurves['times'], axis=1) <= 0).all(axis=1)
+    logMaxAmps = math.log10(maxAmps)
+    
+    #points that are never inside the curve's range, or always over maxAmps,
+    #can't fail, same as in testCoord()
+    settingRows, points = np.nonzero(valid & 
+                                     (queries + shifts.max() >= lowLogs) & 
+                                     (queries + shifts.min() <= highLogs) &
+                                     (pointLogs + np.log10(pointAmps.min()) <= 
+                                      logMaxAmps))
+    
+    #the curves fall as current rises, so inside the curve, a point's curve
+    #time is at least its time at the highest shift (at most at the lowest,
+    #for sign -1). with the worst time factors, that bounds the margin in
+    #every sample, and points that can't get under the limit are dropped
+    rowCurves = curveRows[settingRows]
+    rowQueries = queries[settingRows, points]
+    rowTimes = pointTimes[settingRows, points]
+    if sign > 0:
+        edges = rowQueries + shifts.max()
+        scales = curveScales.min(), pointScales.max()
+    else:
+        edges = rowQueries + shifts.min()
+        scales = curveScales.max(), pointScales.min()
+    edgeTimes = interpolateAt(packedCurves, rowCurves, 
+                              np.clip(edges, lowLogs[settingRows, 0], 
+                                      highLogs[settingRows, 0]))
+    edgeTimes[~falling[rowCurves]] = 0 if sign > 0 else np.inf
+    kept = sign * (scales[0] * edgeTimes - scales[1] * rowTimes) < \
+        limits[settingRows]
+    settingRows = settingRows[kept]
+    points = points[kept]
+    if useProfile: profileCounters['interpolations'] += len(edges)
+    
+    #the same, bucket by bucket, for the points that are left: samples are
+    #sorted by shift and split into toleranceBuckets
+    order = np.argsort(shifts, kind='stable')
+    shifts = shifts[order]
+    curveScales = curveScales[order]
+    pointScales = pointScales[order]
+    pointAmps = np.log10(pointAmps[order])
+    bucketSize = -(-len(shifts) // toleranceBuckets)
+    bucketStarts = np.arange(0, len(shifts), bucketSize)
+    if sign > 0:
+        bucketShifts = np.maximum.reduceat(shifts, bucketStarts)
+        bucketScales = (np.minimum.reduceat(curveScales, bucketStarts),
+                        np.maximum.reduceat(pointScales, bucketStarts))
+    else:
+        bucketShifts = np.minimum.reduceat(shifts, bucketStarts)
+        bucketScales = (np.maximum.reduceat(curveScales, bucketStarts),
+                        np.minimum.reduceat(pointScales, bucketStarts))
+    
+    batch = max(1, marginGridCells // len(bucketStarts))
+    for start in range(0, len(points), batch):
+        rows = settingRows[start:start+batch]
+        rowPoints = points[start:start+batch]
+        rowQueries = queries[rows, rowPoints]
+        rowTimes = pointTimes[rows, rowPoints]
+        rowCurves = curveRows[rows]
+        
+        edges = np.clip(rowQueries[:, None] + bucketShifts, lowLogs[rows], 
+                        highLogs[rows])
+        edgeTimes = interpolateAt(packedCurves, 
+                                  np.repeat(rowCurves, len(bucketStarts)),
+                                  edges.ravel()).reshape(edges.shape)
+        edgeTimes[~falling[rowCurves]] = 0 if sign > 0 else np.inf
+        bounds = sign * (bucketScales[0] * edgeTimes - 
+                         bucketScales[1] * rowTimes[:, None])
+        
+        #then sample by sample, in the buckets that could get under the
+        #limit. only samples that still could are worked out exactly. the
+        #last bucket may be short, and repeats the last sample to fill it
+        pairs, buckets = np.nonzero(bounds < limits[rows][:, None])
+        sampleIndex = np.minimum(buckets[:, None] * bucketSize + 
+                                 np.arange(bucketSize), len(shifts) - 1)
+        bounds = sign * (curveScales[sampleIndex] * 
+                         edgeTimes[pairs, buckets][:, None] - 
+                         pointScales[sampleIndex] * rowTimes[pairs][:, None])
+        blocks, columns = np.nonzero(bounds < limits[rows[pairs]][:, None])
+        pairs = pairs[blocks]
+        sampleIndex = sampleIndex[blocks, columns]
+        
+        sampleQueries = rowQueries[pairs] + shifts[sampleIndex]
+        curveTimes = interpolateAt(packedCurves, rowCurves[pairs], 
+                                   sampleQueries)
+        coordTimes = sign * (curveScales[sampleIndex] * curveTimes - 
+                             pointScales[sampleIndex] * rowTimes[pairs])
+        
+        #points outside of the curve or over maxAmps can't fail
+        settings = rows[pairs]
+        inside = ((sampleQueries >= lowLogs[settings, 0]) & 
+                  (sampleQueries <= highLogs[settings, 0]) &
+                  (pointLogs[settings, rowPoints[pairs]] + 
+                   pointAmps[sampleIndex] <= logMaxAmps))
+        np.minimum.at(worst.reshape(-1), 
+                      settings * worst.shape[1] + order[sampleIndex],
+                      np.where(inside, coordTimes, np.inf))
+        if useProfile: 
+            profileCounters['interpolations'] += edges.size + len(pairs)
+
+#log interpolation of packed curves at log currents, one curve row and one
+#query at a time: curve rows[i] is looked up at queries[i]. matches
+#interpolateRows()
+def interpolateAt(packedCurves, rows, queries):
+    logCurrents = packedCurves['logCurrents']
+    logTimes = packedCurves['logTimes']
+    rowCount, rowLength = logCurrents.shape
+    
+    #every row in its own band, so one searchsorted call finds them all
+    finite = logCurrents[np.isfinite(logCurrents)]
+    band = (finite.max() - finite.min()) + 1.0
+    flatCurrents = (logCurrents + (np.arange(rowCount) * band)[:, None]).ravel()
+    index = np.searchsorted(flatCurrents, 
+                            np.clip(queries, finite.min() - 0.5, 
+                                    finite.max() + 0.5) + rows * band,
+                            side='left') - rows * rowLength
+    index = np.clip(index, 1, packedCurves['lengths'][rows] - 1)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return interpolateSegments(logCurrents[rows, index-1], 
+                                   logCurrents[rows, index],
+                                   logTimes[rows, index-1],
+                                   logTimes[rows, index], queries)
+
+#write a tolerance report as CSV, with a row per setting giving its chance of
+#miscoordination, overall and downstream or upstream
+def writeToleranceReport(reportPath, report, recloserList):
+    with open(reportPath, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['curve', 'pickup', 'adder', 'probability',
+                         'downProbability', 'upProbability'])
+        for k, (n, pickupCurrent, adder) in enumerate(report['settings']):
+            writer.writerow([recloserList[n], pickupCurrent, 
+                             "{0:g}".format(adder)] + 
+                            ["{0:.6g}".format(report[name][k]) for name in 
+                             ('probability', 'downProbability', 
+                              'upProbability')])
+
+def printSolutions(solutionSet, recloserList):
+    solutionOut = []
+    
+    if not solutionSet:
+        solutionOut.append("[no solutions found]")
+    
+    for n, rangeMin, rangeMax, *adders in getSolutionRanges(solutionSet):
+        solutionOut.append("Curve: {0}".format(recloserList[n]))
+        solutionOut.append("Pickup Min (A): {0}".format(formatAmps(rangeMin, 'min')))
+        if adders:
+            solutionOut.append("Pickup Max (A): {0}".format(formatAmps(rangeMax, 'max')))
+            solutionOut.append("Time Adder (cyc): {0} to {1}\n".format(*adders))
+        else:
+            solutionOut.append("Pickup Max (A): {0}\n".format(formatAmps(rangeMax, 'max')))
+    
+    printSolutionOut("Possible Curve Settings:", solutionOut)
+        
+#the ranked solutions of getRankedSolutions(), best first
+def printRankedSolutions(ranked, recloserList, score=None):
+    if score is None: score = rankScore
+    solutionOut = []
+    
+    if not ranked:
+        solutionOut.append("[no solutions found]")
+    
+    unit = "cyc" if score == 'margin' else "A"
+    for rank, row in enumerate(ranked):
+        rankRow = getRankedRow(rank, row, recloserList)
+        solutionOut.append("{0}. Curve: {1}".format(rank + 1, 
+                                                    rankRow['curve']))
+        solutionOut.append("Pickup (A): {0}".format(rankRow['pickupMin']))
+        if 'adderMin' in rankRow:
+            solutionOut.append("Time Adder (cyc): {0}".format(
+                    rankRow['adderMin']))
+        solutionOut.append("{0} ({1}): {2}\n".format(
+                score.capitalize(), unit, 
+                "{0:g}".format(row[-1]) if rankRow['score'] is not None 
+                else "no overlap"))
+    
+    printSolutionOut("Best {0} Curve Settings by {1}:".format(
+            len(ranked), score.capitalize()), solutionOut)
+
+#print solution lines under a title banner, and offer to write them all to
+#solutions.txt
+def printSolutionOut(title, solutionLines):
+    solutionOut = []
+    
+    solutionOut.append("========================")
+    solutionOut.append(title)
+    solutionOut.append("========================\n")
+    solutionOut.extend(solutionLines)
+    
+    for line in solutionOut:
+        print(line)
+        
+    writeSol = input("\nWrite solutions to file? [y/n]\n")
+    
+    if (writeSol.lower() == 'y'):
+        with open('solutions.txt', 'w') as f:
+            for line in solutionOut:
+                f.write(line)
+                f.write('\n')
+
+#a ranked solution as a result row, like getRangeRow() with a one pickup
+#range, plus its rank and score. a margin of inf (the curves never overlap)
+#has no score
+def getRankedRow(rank, solution, recloserList):
+    row = {'rank': rank + 1,
+           'curve': recloserList[solution[0]],
+           'pickupMin': solution[1],
+           'pickupMax': solution[1]}
+    if len(solution) == 4:
+        row['adderMin'] = row['adderMax'] = solution[2]
+    row['score'] = solution[-1] if math.isfinite(solution[-1]) else None
+    return row
+
+#turn a solution set into [curve number, pickup min, pickup max] ranges
+def getSolutionRanges(solutionSet):
+    return list(encodeRanges(solutionSet))
+
+#run-length encode solutions into ranges, one at a time.
+#[curve, pickup] solutions from the stepped engines become a range for every
+#run of pickups ampStep apart, so a gap in the pickups starts a new range.
+#[curve, pickup, adder min, adder max] solutions from an adder sweep become
+#[curve, pickup min, pickup max, adder min, adder max] for runs that allow the
+#same adders. [curve, min, max] intervals from the exact engine are already
+#ranges
+def encodeRanges(solutions):
+    run = None
+    
+    for solution in solutions:
+        if len(solution) == 3:
+            if run: yield run
+            run = None
+            yield list(solution)
+            continue
+        
+        curveNumber, pickupCurrent, *adders = solution
+        if (run and run[0] == curveNumber and 
+            run[2] + ampStep == pickupCurrent and run[3:] == adders):
+            run[2] = pickupCurrent
+        else:
+            if run: yield run
+            run = [curveNumber, pickupCurrent, pickupCurrent] + adders
+    
+    if run: yield run
+
+#a solution range as a result row, with the recloser curve's file name
+def getRangeRow(solutionRange, recloserList):
+    row = {'curve': recloserList[solutionRange[0]],
+           'pickupMin': solutionRange[1],
+           'pickupMax': solutionRange[2]}
+    if len(solutionRange) == 5:
+        row['adderMin'], row['adderMax'] = solutionRange[3:]
+    return row
+
+#result rows written to a CSV or JSON Lines file one at a time, flushed as
+#they go, so the file can be read while a sweep is still running
+class ResultStream:
+    columns = ['name', 'rank', 'curve', 'pickupMin', 'pickupMax', 'adderMin', 
+               'adderMax', 'score', 'error']
+    
+    def __init__(self, resultPath):
+        self.file = open(resultPath, 'w', newline='')
+        self.writer = None
+        if resultPath.lower().endswith('.csv'):
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(self.columns)
+    
+    def write(self, row):
+        if self.writer:
+            self.writer.writerow([row.get(column, '') 
+                                  for column in self.columns])
+        else:
+            self.file.write(json.dumps(row) + '\n')
+        self.file.flush()
+    
+    def close(self):
+        self.file.close()
+
+#whole amps print as they are. exact interval ends are rounded inwards to a
+#tenth of an amp so the printed range never leaves the feasible interval
+def formatAmps(amps, end):
+    if isinstance(amps, int): return "{0}".format(amps)
+    if end == 'min': amps = math.ceil(round(amps * 10, 6)) / 10
+    else: amps = math.floor(round(amps * 10, 6)) / 10
+    return "{0:.1f}".format(amps)
+        
+#set the candidate that following trace() records belong to. curve number
+#and pickup are None for records that aren't about a candidate
+def setTraceCandidate(curveNumber, pickupCurrent, direction):
+    traceState.candidate = (curveNumber, pickupCurrent, direction)
+
+#add a record to the trace. callers check traceLevel first, so that nothing
+#is done at all when tracing is off
+def trace(event, current, value):
+    candidate = getattr(traceState, 'candidate', (None, None, None))
+    if (traceFilter is not None and candidate[0] is not None and
+        (candidate[0], candidate[1]) != tuple(traceFilter)):
+        return
+    traceBuffer.append(candidate + (current, value))
+
+#trace the pass/fail and margin of every candidate in a margin grid
+#from the numpy engine, as 'down' and 'up' checks
+def traceMarginGrid(downMargin, upMargin, pickups, minCoordTime):
+    for n in range(downMargin.shape[0]):
+        for k, pickupCurrent in enumerate(pickups):
+            for direction, margin in (('down', downMargin[n, k]),
+                                      ('up', upMargin[n, k])):
+                setTraceCandidate(n, int(pickupCurrent), direction)
+                trace('pass' if margin >= minCoordTime else 'fail', 
+                      None, float(margin))
+
+#start a new trace, dropping anything recorded so far
+def startTrace(level, bufferSize=None, candidate=None):
+    global traceLevel, traceFilter, traceBufferSize, traceBuffer
+    traceLevel = level
+    traceFilter = candidate
+    if bufferSize: traceBufferSize = bufferSize
+    traceBuffer = collections.deque(maxlen=traceBufferSize)
+
+#write the trace out as CSV. candidate narrows it down further to a single
+#(curve number, pickup), on top of whatever traceFilter already did
+def writeTrace(path, candidate=None):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['event', 'curve', 'pickup', 'direction', 
+                         'current', 'value'])
+        for record in traceBuffer:
+            if candidate and record[1] is not None and \
+                (record[1], record[2]) != tuple(candidate):
+                continue
+            writer.writerow(['' if field is None else field 
+                             for field in record])
+  
+#run every study in a CSV or JSON file in one go, with no prompts.
+#the curve library is loaded and the recloser curves compiled only once.
+#each study needs these fields (see runStudy() for the optional ones):
+#   name, downstream, upstream, pickupMin, pickupMax, coordMaxAmps, minCoordTime
+#results go to a JSON file, or a CSV file if resultPath ends in .csv.
+#studies run against library, or the curves under startDir if it's None.
+#with profilePath, the summed profile of the batch is written there as JSON
+def runBatch(studyPath, resultPath, library=None, profilePath=None):
+    resetProfile()
+    if library is None: library = CurveLibrary(startDir)
+    loadProfile = getProfileReport()
+    coordinator = Coordinator(library)
+    
+    studies = readStudies(studyPath)
+    
+    #CSV and JSON Lines results are written as they come in
+    stream = None
+    if resultPath.lower().endswith(('.csv', '.jsonl')):
+        stream = ResultStream(resultPath)
+    
+    #with a worker pool, each study is a task. otherwise every study runs
+    #here, and getSolutions() can still use workers for its own sweep
+    results = []
+    try:
+        if getWorkerCount() > 1 and len(studies) > 1:
+            workers = min(getWorkerCount(), len(studies))
+            with startWorkerPool(library.recloserCurves, workers, 
+                                 library.getState(False)) as pool:
+                for result in pool.imap(runStudyTask, enumerate(studies)):
+                    if stream: writeStudyRows(stream, result)
+                    results.append(result)
+        else:
+            #streamed studies hand their ranges over as they're found
+            for n, study in enumerate(studies):
+                results.append(coordinator.runStudy(study, n, stream, True))
+    finally:
+        if stream: stream.close()
+    
+    if not stream: writeResults(resultPath, results)
+    if traceLevel: writeTrace(traceFile)
+    
+    failed = [result for result in results if result['error']]
+    print("{0} studies run, {1} failed. Results written to {2}".format(
+            len(results), len(failed), resultPath))
+    for result in failed:
+        print("!! {0}: {1}".format(result['name'], result['error']))
+    if useMarginCache and sum(marginCacheStats.values()):
+        print("Margin cache: {0} hits, {1} misses".format(
+                marginCacheStats['hits'], marginCacheStats['misses']))
+    tableStats = {name: sum(result['coordTable'][name] for result in results)
+                  for name in coordTableStats}
+    if useCoordTable and sum(tableStats.values()):
+        print("Coordination table: {0} hits, {1} misses".format(
+                tableStats['hits'], tableStats['misses']))
+    if useResultCache:
+        printResultCacheStats({name: sum(result['resultCache'][name] 
+                                         for result in results)
+                               for name in resultCacheStats})
+    if useProfile:
+        profile = mergeProfileReports([loadProfile] + 
+                                      [result['profile'] for result in results
+                                       if result['profile']])
+        profile['studies'] = len(results)
+        printProfileDigest(profile)
+        if profilePath:
+            with open(profilePath, 'w') as f:
+                json.dump(profile, f, indent=2)
+    
+    return results
+
+#read a list of studies from a CSV file with a header row, or a JSON file
+#holding a list of objects. either way, each study should be a dict of
+#fields. runStudy() reports any that aren't
+def readStudies(studyPath):
+    with open(studyPath, newline='') as f:
+        if studyPath.lower().endswith('.csv'):
+            return list(csv.DictReader(f))
+        studies = json.load(f)
+    if not isinstance(studies, list):
+        raise ValueError("{0} must hold a JSON list of studies".format(
+                studyPath))
+    return studies
+
+#run a single batch study. optional fields are:
+#   downstreamPickup, downstreamTimeAdder -> if the downstream curve is a recloser
+#   upstreamPickup, upstreamTimeAdder     -> if the upstream curve is a recloser
+#   oldCTRatio (default 1), ctRatio        -> if the breaker CT ratio needs fixing
+#   adderMax, adderMin (default 0)        -> to sweep the new recloser's adder
+#   marginReport                          -> path to write a margin report to
+#   toleranceReport                       -> path to write a tolerance report to
+#   rank (default rankCount), rankBy      -> to keep only the best candidates,
+#                                            with a row for each (see
+#                                            getRankedSolutions())
+#returns a result dict. any problem with the study is reported in 'error'.
+#with a ResultStream, rows are written to it as the sweep finds them and the
+#result's solutions are left empty. the report paths are only allowed with
+#allowFiles=True, as batch mode passes: a study from anywhere else (the
+#server) can't write files
+def runStudy(study, n, library, stream=None, allowFiles=False):
+    #a JSON list can hold anything, and only objects are studies
+    isStudy = isinstance(study, dict)
+    result = {'name': isStudy and study.get('name') or "study {0}".format(n+1),
+              'solutions': [],
+              'pruneStats': None,
+              'resultCache': dict.fromkeys(resultCacheStats, 0),
+              'coordTable': dict.fromkeys(coordTableStats, 0),
+              'profile': None,
+              'error': None}
+    cacheStats = dict(resultCacheStats)
+    tableStats = dict(coordTableStats)
+    resetProfile()
+    
+    try:
+        if not isStudy:
+            raise ValueError("a study must be an object, not {0}".format(
+                    json.dumps(study)))
+        coordAmps = studyPickups(study) + (
+                studyNumber(study, 'coordMaxAmps', int, minimum=1),)
+        minCoordTime = studyNumber(study, 'minCoordTime', float)
+        
+        coordCurves = (getStudyCurve(study, 'downstream', 'd', library),
+                       getStudyCurve(study, 'upstream', 'u', library),
+                       library.recloserCurves)
+        
+        adderRange = None
+        if study.get('adderMax') not in (None, ''):
+            adderRange = (studyNumber(study, 'adderMin', float, 0),
+                          studyNumber(study, 'adderMax', float))
+        marginReport = studyReportPath(study, 'marginReport', allowFiles)
+        toleranceReport = studyReportPath(study, 'toleranceReport', allowFiles)
+        
+        #a streamed study is swept here too when it needs a report, and the
+        #stream below then comes from that sweep. a ranked study only has
+        #its best candidates, for the rows and the reports
+        ranked = None
+        solutionSet = None
+        count = studyNumber(study, 'rank', int, rankCount)
+        if count:
+            ranked = getRankedSolutions(coordCurves, coordAmps, minCoordTime,
+                                        adderRange, count, 
+                                        study.get('rankBy') or rankScore)
+            solutionSet = getRankedSet(ranked)
+        elif stream is None or marginReport or toleranceReport:
+            solutionSet = getSolutions(coordCurves, coordAmps, minCoordTime,
+                                       adderRange, library=library)
+        if stream is None and ranked is None:
+            solutionRanges = getSolutionRanges(solutionSet)
+        if marginReport:
+            writeMarginReport(marginReport,
+                              getMarginReport(coordCurves, solutionSet, 
+                                              coordAmps[2]),
+                              library.curveFileLists[2])
+        if toleranceReport:
+            writeToleranceReport(toleranceReport,
+                                 getToleranceReport(coordCurves, solutionSet,
+                                                    coordAmps[2], minCoordTime),
+                                 library.curveFileLists[2])
+        
+        #a streamed sweep can still fail part way, after some of its rows
+        #have gone out. the error then gets a row of its own
+        if stream is not None and ranked is None:
+            if solutionSet is not None:
+                solutionRanges = getSolutionRanges(solutionSet)
+            else:
+                solutionRanges = iterSolutionRanges(coordCurves, coordAmps, 
+                                                    minCoordTime, adderRange,
+                                                    library)
+            rowCount = 0
+            for solutionRange in solutionRanges:
+                stream.write(dict(name=result['name'], 
+                                  **getRangeRow(solutionRange, 
+                                                library.curveFileLists[2])))
+                rowCount += 1
+            if not rowCount: writeStudyRows(stream, result)
+    except (KeyError, ValueError, OSError) as e:
+        result['error'] = str(e)
+        if stream: writeStudyRows(stream, result)
+        return result
+    
+    if ranked is not None:
+        for rank, solution in enumerate(ranked):
+            result['solutions'].append(getRankedRow(rank, solution,
+                                                    library.curveFileLists[2]))
+        if stream: writeStudyRows(stream, result)
+    elif stream is None:
+        for solutionRange in solutionRanges:
+            result['solutions'].append(getRangeRow(solutionRange, 
+                                            library.curveFileLists[2]))
+    
+    result['pruneStats'] = dict(pruneStats)
+    if useProfile: result['profile'] = getProfileReport(library.curveFileLists[2])
+    for name in resultCacheStats:
+        result['resultCache'][name] = resultCacheStats[name] - cacheStats[name]
+    for name in coordTableStats:
+        result['coordTable'][name] = coordTableStats[name] - tableStats[name]
+    
+    return result
+
+#worker task: run one batch study against the shared recloser curves.
+#the worker's library is rebuilt once, from the state passed to the pool
+def runStudyTask(task):
+    n, study = task
+    if 'library' not in workerState:
+        (curvePaths, curveFileLists, curveData, _, resultCachePath,
+            coordTablePath) = workerState['extra']
+        workerState['library'] = CurveLibrary(loaded=(
+                curvePaths, curveFileLists, curveData, 
+                workerState['recloserCurves'], resultCachePath, 
+                coordTablePath))
+    return runStudy(study, n, workerState['library'], allowFiles=True)
+
+#a batch study's report path, or None if it doesn't ask for that report
+def studyReportPath(study, field, allowFiles):
+    reportPath = study.get(field)
+    if reportPath in (None, ''): return None
+    if not allowFiles:
+        raise ValueError("field '{0}' is only allowed in batch "
+                         "mode".format(field))
+    if not isinstance(reportPath, str):
+        raise ValueError("field '{0}' must be a path".format(field))
+    return reportPath
+
+#get a compiled downstream or upstream curve for a batch study, by file name
+def getStudyCurve(study, side, curveOrder, library):
+    curveName = study.get(side)
+    curveType = library.getCurveType(curveName)
+    if curveType is None:
+        raise ValueError("unknown {0} curve '{1}'".format(side, curveName))
+    
+    recInfo = None
+    ctRatios = None
+    if curveType == 'recloser':
+        recInfo = (studyNumber(study, side + 'Pickup', float),
+                   studyNumber(study, side + 'TimeAdder', float, 0))
+    if curveType == 'breaker' and study.get('ctRatio'):
+        ctRatios = (studyNumber(study, 'oldCTRatio', float, 1),
+                    studyNumber(study, 'ctRatio', float))
+    
+    return library.getCurve(curveName, curveOrder, recInfo, ctRatios)
+
+#get a number from a study. blank fields use the default, if there is one.
+#numbers under minimum, if it's given, are refused
+def studyNumber(study, field, cast, default=None, minimum=None):
+    value = study.get(field)
+    if value is None or value == '':
+        if default is None:
+            raise ValueError("missing field '{0}'".format(field))
+        return default
+    
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("field '{0}' is not a number: {1}".format(field, value))
+    if minimum is not None and number < minimum:
+        raise ValueError("field '{0}' must be at least {1}".format(field, 
+                                                                   minimum))
+    if cast is int:
+        if number != int(number):
+            raise ValueError("field '{0}' must be a whole number".format(field))
+        return int(number)
+    return number
+
+#(pickupMin, pickupMax) of a study. a pickup of 0 can't be scaled in log
+#current, and a range that ends before it starts has nothing in it
+def studyPickups(study):
+    pickupMin = studyNumber(study, 'pickupMin', int, minimum=1)
+    return pickupMin, studyNumber(study, 'pickupMax', int, minimum=pickupMin)
+
+#write batch results as JSON, or as CSV or JSON Lines with one row per
+#solution range
+def writeResults(resultPath, results):
+    if resultPath.lower().endswith(('.csv', '.jsonl')):
+        stream = ResultStream(resultPath)
+        for result in results:
+            writeStudyRows(stream, result)
+        stream.close()
+    else:
+        with open(resultPath, 'w') as f:
+            json.dump(results, f, indent=2)
+
+#one row per solution of a study, or a single row with just the name (and
+#error, if there was one) when there aren't any
+def writeStudyRows(stream, result):
+    for solution in result['solutions']:
+        stream.write(dict(name=result['name'], **solution))
+    if not result['solutions']:
+        row = {'name': result['name']}
+        if result['error']: row['error'] = result['error']
+        stream.write(row)
+
+#run a feeder study from a JSON file (see readFeeder()) with no prompts, and
+#write its result to resultPath as JSON. the feeder runs against library, or
+#the curves under startDir if it's None
+def runFeederFile(feederPath, resultPath, library=None):
+    if library is None: library = CurveLibrary(startDir)
+    result = runFeeder(readFeeder(feederPath), library)
+    
+    with open(resultPath, 'w') as f:
+        json.dump(result, f, indent=2)
+    printFeederResult(result)
+    print("Results written to {0}".format(resultPath))
+    if useProfile and result['profile']: printProfileDigest(result['profile'])
+    
+    return result
+
+#a feeder is a JSON object with name, minCoordTime, coordMaxAmps and a list of
+#devices. every device has a name and, except for the breaker (or whatever
+#sits at the top), the name of its parent, the next device upstream. then:
+#   curve                      -> a fixed device, with its curve file name
+#   pickup, timeAdder          -> if that curve is a recloser
+#   oldCTRatio, ctRatio        -> if a breaker's CT ratio needs fixing
+#   pickupMin, pickupMax       -> an open recloser, to find settings for
+#   curves                     -> recloser curves it may use (default: all)
+#   adderMax, adderMin         -> to search its time adder too
+#   coordMaxAmps               -> the most fault current through the device,
+#                                 if it's less than the feeder's
+def readFeeder(feederPath):
+    with open(feederPath) as f:
+        feeder = json.load(f)
+    if not isinstance(feeder, dict):
+        raise ValueError("{0} must hold a JSON object".format(feederPath))
+    return feeder
+
+#one device on a feeder. a fixed device has its compiled curve. an open
+#recloser has candidates instead: each recloser curve it may use (by curve
+#number) at each stepped pickup, plus the adders it's allowed
+class FeederDevice:
+    def __init__(self, name, parentName, coordMaxAmps):
+        self.name = name
+        self.parentName = parentName
+        self.coordMaxAmps = coordMaxAmps
+        self.parent = None
+        self.children = []
+        self.curve = None
+        self.curveNumbers = None
+        self.pickups = None
+        self.adderRange = None
+    
+    def isOpen(self):
+        return self.curve is None
+
+#the devices of a feeder, parents before children (depth first from the top)
+def getFeederDevices(feeder, library):
+    coordMaxAmps = studyNumber(feeder, 'coordMaxAmps', int, minimum=1)
+    recloserList = library.curveFileLists[2]
+    
+    devices = collections.OrderedDict()
+    for entry in feeder.get('devices') or ():
+        if not isinstance(entry, dict):
+            raise ValueError("a device must be an object, not {0}".format(
+                    json.dumps(entry)))
+        name = entry.get('name')
+        if not name or name in devices:
+            raise ValueError("every device needs its own name, "
+                             "'{0}' is missing or repeated".format(name))
+        
+        try:
+            device = FeederDevice(name, entry.get('parent'), 
+                                  studyNumber(entry, 'coordMaxAmps', int, 
+                                              coordMaxAmps, minimum=1))
+            if entry.get('curve'):
+                device.curve = getDeviceCurve(entry, library)
+            else:
+                curveNames = entry.get('curves') or recloserList
+                if isinstance(curveNames, str): 
+                    curveNames = curveNames.split(',')
+                device.curveNumbers = []
+                for curveName in curveNames:
+                    if (not isinstance(curveName, str) or 
+                            curveName.strip() not in recloserList):
+                        raise ValueError("unknown recloser curve "
+                                         "'{0}'".format(curveName))
+                    device.curveNumbers.append(
+                            recloserList.index(curveName.strip()))
+                pickupMin, pickupMax = studyPickups(entry)
+                device.pickups = list(range(pickupMin, pickupMax + 1, 
+                                            ampStep))
+                device.adderRange = (0, 0)
+                if entry.get('adderMax') not in (None, ''):
+                    device.adderRange = (
+                            studyNumber(entry, 'adderMin', float, 0),
+                            studyNumber(entry, 'adderMax', float))
+        except ValueError as e:
+            raise ValueError("device '{0}': {1}".format(name, e))
+        devices[name] = device
+    
+    tops = []
+    for device in devices.values():
+        if device.parentName is None:
+            tops.append(device)
+        elif device.parentName not in devices:
+            raise ValueError("device '{0}' has an unknown parent '{1}'".format(
+                    device.name, device.parentName))
+        else:
+            device.parent = devices[device.parentName]
+            device.parent.children.append(device)
+    if len(tops) != 1:
+        raise ValueError("a feeder needs exactly one device with no parent")
+    
+    #anything in a loop of parents is never reached from the top
+    ordered = []
+    stack = tops
+    while stack:
+        device = stack.pop()
+        ordered.append(device)
+        stack.extend(reversed(device.children))
+    if len(ordered) != len(devices):
+        raise ValueError("feeder devices must form a tree")
+    
+    return ordered
+
+#compiled curve of a fixed feeder device, like getStudyCurve()
+def getDeviceCurve(entry, library):
+    curveName = entry['curve']
+    curveType = library.getCurveType(curveName)
+    if curveType is None:
+        raise ValueError("unknown curve '{0}'".format(curveName))
+    
+    recInfo = None
+    ctRatios = None
+    if curveType == 'recloser':
+        recInfo = (studyNumber(entry, 'pickup', float),
+                   studyNumber(entry, 'timeAdder', float, 0))
+    if curveType == 'breaker' and entry.get('ctRatio'):
+        ctRatios = (studyNumber(entry, 'oldCTRatio', float, 1),
+                    studyNumber(entry, 'ctRatio', float))
+    
+    return library.getCurve(curveName, 'd', recInfo, ctRatios)
+
+#worst margin of a slower curve over a faster one, up to maxAmps. the same
+#margins the sweep checks for the pair, following marginCheck
+def getPairMargin(slowCurve, fastCurve, maxAmps):
+    if marginCheck == 'exact':
+        return getMinMargin(slowCurve, fastCurve, maxAmps)[0]
+    return min(getPointMargin(fastCurve, slowCurve, 'd', maxAmps),
+               getPointMargin(slowCurve, fastCurve, 'u', maxAmps))
+
+#True where margins are worked out as a numpy grid, not candidate by candidate
+def usesMarginGrid():
+    return coordEngine != 'loop' and np is not None and marginCheck == 'points'
+
+#margins of recloser curves at every pickup against one fixed curve, as
+#lists of rows (curves x pickups). side is where the fixed curve sits: 'd'
+#for downstream (recloser time - fixed time) or 'u' for upstream (fixed 
+#time - recloser time)
+def getCandidateMargins(fixedCurve, side, recloserCurves, pickups, maxAmps):
+    if usesMarginGrid():
+        recCurves = packCurves(recloserCurves)
+        fixed = packCurves([fixedCurve])
+        pickups = np.array(pickups, dtype=float)
+        margins = np.empty((len(recloserCurves), len(pickups)))
+        
+        maxPoints = max(recCurves['currents'].shape[1],
+                        fixed['currents'].shape[1])
+        chunk = max(1, marginGridCells // (len(recloserCurves) * maxPoints))
+        for start in range(0, len(pickups), chunk):
+            pickupChunk = pickups[start:start+chunk]
+            margins[:, start:start+chunk] = np.minimum(
+                    fixedVsRecloserMargins(fixed, recCurves, pickupChunk,
+                                           maxAmps, side),
+                    recloserVsFixedMargins(recCurves, fixed, pickupChunk,
+                                           maxAmps, side))
+        return margins.tolist()
+    
+    margins = []
+    for recloserCurve in recloserCurves:
+        row = []
+        for pickupCurrent in pickups:
+            testCurve = recloserCurve.scaled(pickupCurrent)
+            if side == 'd':
+                row.append(getPairMargin(testCurve, fixedCurve, maxAmps))
+            else:
+                row.append(getPairMargin(fixedCurve, testCurve, maxAmps))
+        margins.append(row)
+    return margins
+
+#joint search for settings of every open recloser on a feeder. a device only
+#has to coordinate with its parent and its children, so once a device's
+#setting is picked, each of its open children can be solved on its own.
+#the search goes depth first from the top: each open recloser tries its
+#candidates (those that coordinate with its fixed neighbours) in turn, and
+#keeps the first one all of its open children can be solved under.
+#
+#pair margins between a parent's setting and a device's candidates are
+#memoized for the whole search. they're worked out feederProbeCount
+#candidates at a time, in the order the candidates are tried, so a parent
+#that fits early doesn't pay for the rest. with numpy, candidates whose time
+#at a few of their own points proves they can't fit under the parent are
+#skipped first, all at once. a device's subtree is only solved once per
+#parent setting, and one that failed is never tried under a lower adder on
+#the same parent curve and pickup, since that's the same parent, only faster.
+#
+#adders shift a whole curve, so they come straight off the margins. a device
+#with open children takes the highest adder, and tries first the settings
+#leaving the most room over the fixed devices further down, once every open
+#recloser in between has had its minCoordTime. a device with only fixed
+#children tries its fastest settings first, since they're the likeliest to
+#fit under the parent. once everything is found, it's moved to the setting
+#with the most margin either side, with the adder in the middle of its range
+class FeederSearch:
+    def __init__(self, devices, recloserCurves, minCoordTime):
+        self.devices = devices
+        self.recloserCurves = recloserCurves
+        self.minCoordTime = minCoordTime
+        self.pairMargins = {}
+        self.bounds = {}
+        self.solved = {}
+        self.failedAdders = {}
+        self.stats = dict.fromkeys(('candidates', 'pairMargins', 
+                                    'pairMarginsReused', 'boundSkips', 
+                                    'subtreesReused'), 0)
+        
+        #bottom up, so each device's candidates are known before its parent
+        #looks at the fixed devices under them
+        for device in reversed(devices):
+            if device.isOpen(): self.setCandidates(device)
+    
+    #an open device's candidates: the (curve index, pickup index) of every
+    #curve and pickup that coordinates with its fixed children and fixed
+    #parent with some adder. their worst margins against those are kept in
+    #downMargins and upMargins (inf where there's no such device)
+    def setCandidates(self, device):
+        curves = [self.recloserCurves[n] for n in device.curveNumbers]
+        emptyRows = lambda: [[math.inf] * len(device.pickups) 
+                             for curve in curves]
+        device.downMargins = emptyRows()
+        device.upMargins = emptyRows()
+        roomMargins = emptyRows()
+        
+        #fixed devices further down, under open reclosers only, as (curve,
+        #maxAmps, open reclosers in between)
+        floors = []
+        stack = [(child, 0) for child in device.children]
+        while stack:
+            child, depth = stack.pop()
+            if child.isOpen():
+                stack.extend((grandchild, depth + 1) 
+                             for grandchild in child.children)
+            else:
+                floors.append((child.curve, child.coordMaxAmps, depth))
+        
+        neighbours = [(curve, 'd', maxAmps, depth, 
+                       device.downMargins if depth == 0 else roomMargins)
+                      for curve, maxAmps, depth in floors]
+        if device.parent is not None and not device.parent.isOpen():
+            neighbours.append((device.parent.curve, 'u', device.coordMaxAmps,
+                               0, device.upMargins))
+        for curve, side, maxAmps, depth, worst in neighbours:
+            margins = getCandidateMargins(curve, side, curves, device.pickups,
+                                          maxAmps)
+            shift = depth * self.minCoordTime
+            for worstRow, row in zip(worst, margins):
+                worstRow[:] = [min(worstMargin, margin - shift) 
+                               for worstMargin, margin in zip(worstRow, row)]
+        
+        device.openChildren = any(child.isOpen() for child in device.children)
+        device.candidates = []
+        device.lowestAdders = []
+        order = []
+        for i, curve in enumerate(curves):
+            top = curve.currents[-1]
+            for k, pickupCurrent in enumerate(device.pickups):
+                adders = getAdderRange(device.downMargins[i][k],
+                                       device.upMargins[i][k],
+                                       self.minCoordTime, device.adderRange)
+                if adders is None: continue
+                
+                #how slow the candidate is at the most current it sees
+                slowness = curve.scaled(pickupCurrent).interpolate(
+                        min(device.coordMaxAmps, top * pickupCurrent))
+                if device.openChildren:
+                    order.append((-(roomMargins[i][k] + adders[1]), 
+                                  -(slowness + adders[1]), 
+                                  len(device.candidates)))
+                else:
+                    order.append((slowness + adders[0], 0, 
+                                  len(device.candidates)))
+                device.candidates.append((i, k))
+                device.lowestAdders.append(adders[0])
+        device.order = [c for room, slowness, c in sorted(order)]
+        
+        #feederBoundPoints of each candidate's points, spread over its curve,
+        #for the bounds in getBounds()
+        device.boundPoints = None
+        if np is not None and device.candidates:
+            unitCurrents = np.empty((len(curves), feederBoundPoints))
+            unitTimes = np.empty((len(curves), feederBoundPoints))
+            for i, curve in enumerate(curves):
+                picks = np.linspace(0, len(curve) - 1, 
+                                    feederBoundPoints).round().astype(int)
+                unitCurrents[i] = np.array(curve.currents)[picks]
+                unitTimes[i] = np.array(curve.times)[picks]
+            rows, columns = np.array(device.candidates).T
+            pickups = np.array(device.pickups, dtype=float)
+            device.boundPoints = (unitCurrents[rows] * pickups[columns, None],
+                                  unitTimes[rows])
+    
+    #settings of every open recloser, as {device name: (curve number, pickup,
+    #adder)}. raises a ValueError if they can't all coordinate
+    def run(self):
+        settings = {}
+        for device in self.devices:
+            if not device.isOpen(): continue
+            if device.parent is not None and device.parent.isOpen(): continue
+            found = self.solve(device)
+            if found is None:
+                raise ValueError("no settings coordinate for '{0}' and the "
+                                 "open reclosers below it".format(device.name))
+            settings.update(found)
+        
+        for device in self.devices:
+            if device.isOpen() and not device.openChildren:
+                parentSetting = None
+                if device.parent is not None and device.parent.isOpen():
+                    parentSetting = settings[device.parent.name]
+                settings[device.name] = self.getBestSetting(device, 
+                                                            parentSetting)
+        return settings
+    
+    #settings of a device and the open reclosers below it, under its open
+    #parent's setting (curve number, pickup, adder), or None if there aren't
+    #any. the parent setting is None when the parent is fixed or missing
+    def solve(self, device, parentSetting=None):
+        key = (device.name, parentSetting)
+        if key in self.solved:
+            self.stats['subtreesReused'] += 1
+            return self.solved[key]
+        if parentSetting is not None:
+            failedKey = (device.name,) + parentSetting[:2]
+            if parentSetting[2] <= self.failedAdders.get(failedKey, -math.inf):
+                self.stats['subtreesReused'] += 1
+                return None
+        
+        found = None
+        for setting, upMargin in self.iterCandidates(device, parentSetting):
+            self.stats['candidates'] += 1
+            if self.stats['candidates'] > feederSearchLimit:
+                raise ValueError("no settings found in the first {0} "
+                                 "candidates (see feederSearchLimit)".format(
+                                         feederSearchLimit))
+            settings = {device.name: setting}
+            for child in device.children:
+                if not child.isOpen(): continue
+                childSettings = self.solve(child, setting)
+                if childSettings is None:
+                    settings = None
+                    break
+                settings.update(childSettings)
+            if settings is not None:
+                found = settings
+                break
+        
+        self.solved[key] = found
+        if found is None and parentSetting is not None:
+            self.failedAdders[failedKey] = max(
+                    parentSetting[2], self.failedAdders.get(failedKey, 
+                                                            -math.inf))
+        return found
+    
+    #(setting, upstream margin) of every candidate that coordinates with the
+    #devices around it, in the order they're tried (see FeederSearch). the
+    #setting is (curve number, pickup, adder). margins are worked out
+    #chunkSize (default feederProbeCount) candidates at a time
+    def iterCandidates(self, device, parentSetting, chunkSize=None):
+        chunkSize = max(1, chunkSize or feederProbeCount)
+        order = device.order
+        if parentSetting is not None:
+            n, pickupCurrent, parentAdder = parentSetting
+            parentCurve = self.recloserCurves[n].scaled(pickupCurrent)
+            margins = self.pairMargins.setdefault(
+                    (device.name, n, pickupCurrent), {})
+            
+            #even the lowest adder the fixed children allow has to leave
+            #minCoordTime under the parent
+            bounds = self.getBounds(device, parentCurve)
+            if bounds is not None:
+                fits = (bounds + parentAdder >= self.minCoordTime + 
+                        np.array(device.lowestAdders) - 1e-9)
+                order = [c for c in order if fits[c]]
+                self.stats['boundSkips'] += len(device.order) - len(order)
+        
+        for start in range(0, len(order), chunkSize):
+            chunk = order[start:start+chunkSize]
+            if parentSetting is not None:
+                self.addPairMargins(device, parentCurve, margins, chunk)
+            
+            for c in chunk:
+                i, k = device.candidates[c]
+                upMargin = device.upMargins[i][k]
+                if parentSetting is not None:
+                    upMargin = min(upMargin, margins[c] + parentAdder)
+                adders = getAdderRange(device.downMargins[i][k], upMargin, 
+                                       self.minCoordTime, device.adderRange)
+                if adders is None: continue
+                adder = adders[1] if device.openChildren else adders[0]
+                yield ((device.curveNumbers[i], device.pickups[k], adder), 
+                       upMargin)
+    
+    #the setting of a device with no open children that has the most margin
+    #over its children and under its parent, with its adder centred. every
+    #candidate is looked at, so their margins are worked out all at once
+    def getBestSetting(self, device, parentSetting):
+        best = None
+        for (n, pickupCurrent, adder), upMargin in self.iterCandidates(
+                device, parentSetting, len(device.candidates)):
+            i = device.curveNumbers.index(n)
+            k = device.pickups.index(pickupCurrent)
+            downMargin = device.downMargins[i][k]
+            low, high = getAdderRange(downMargin, upMargin, self.minCoordTime,
+                                      device.adderRange)
+            adder = low + adderStep * math.floor((high - low) / adderStep / 2)
+            slack = min(downMargin + adder, upMargin - adder)
+            if best is None or slack > best[0]:
+                best = (slack, (n, pickupCurrent, adder))
+        return best[1]
+    
+    #fill in margins (by candidate) of a parent curve over a chunk of a
+    #device's candidates, without adders. with numpy, the missing ones are
+    #one grid over their curves and pickups
+    def addPairMargins(self, device, parentCurve, margins, chunk):
+        missing = [c for c in chunk if c not in margins]
+        self.stats['pairMarginsReused'] += len(chunk) - len(missing)
+        self.stats['pairMargins'] += len(missing)
+        if not missing: return
+        
+        if usesMarginGrid():
+            curveIndexes = sorted(set(device.candidates[c][0] 
+                                      for c in missing))
+            pickupIndexes = sorted(set(device.candidates[c][1] 
+                                       for c in missing))
+            grid = getCandidateMargins(
+                    parentCurve, 'u', 
+                    [self.recloserCurves[device.curveNumbers[i]] 
+                     for i in curveIndexes],
+                    [device.pickups[k] for k in pickupIndexes],
+                    device.coordMaxAmps)
+            rows = dict(zip(curveIndexes, grid))
+            columns = {k: j for j, k in enumerate(pickupIndexes)}
+            for c in missing:
+                i, k = device.candidates[c]
+                margins[c] = rows[i][columns[k]]
+        else:
+            for c in missing:
+                i, k = device.candidates[c]
+                testCurve = self.recloserCurves[
+                        device.curveNumbers[i]].scaled(device.pickups[k])
+                margins[c] = getPairMargin(parentCurve, testCurve, 
+                                           device.coordMaxAmps)
+    
+    #an upper bound on each candidate's margin under a parent curve, without
+    #adders: the margin at the candidate's bound points that are inside the
+    #parent curve and under coordMaxAmps. those are points the margin check
+    #looks at too, so the real margin can't be any higher. None without numpy
+    def getBounds(self, device, parentCurve):
+        if device.boundPoints is None: return None
+        key = (device.name, parentCurve.curve, parentCurve.pickupCurrent)
+        if key not in self.bounds:
+            currents, times = device.boundPoints
+            inside = ((currents >= parentCurve[0][0]) & 
+                      (currents <= min(parentCurve[-1][0], 
+                                       device.coordMaxAmps)))
+            margins = interpolateFixed(packCurves([parentCurve]), 
+                                       currents) - times
+            self.bounds[key] = np.where(inside, margins, np.inf).min(axis=1)
+        return self.bounds[key]
+
+#search for settings of every open recloser on a feeder at once (see
+#readFeeder() for the layout and FeederSearch for how). returns a result dict:
+#   settings -> device, curve, pickup and adder of every open recloser
+#   margins  -> worst margin between every device and its parent
+#   search   -> candidates tried, margin grids worked out and reused, and
+#               subtree searches reused
+#any problem with the feeder, or no settings coordinating, is in 'error'
+def runFeeder(feeder, library):
+    result = {'name': feeder.get('name') or 'feeder',
+              'settings': [],
+              'margins': [],
+              'search': None,
+              'profile': None,
+              'error': None}
+    resetProfile()
+    
+    try:
+        minCoordTime = studyNumber(feeder, 'minCoordTime', float)
+        devices = getFeederDevices(feeder, library)
+        
+        #nothing can be searched around two fixed devices that don't
+        #coordinate with each other
+        for device in devices:
+            if device.isOpen() or device.parent is None: continue
+            if device.parent.isOpen(): continue
+            margin = getPairMargin(device.parent.curve, device.curve,
+                                   device.coordMaxAmps)
+            if margin < minCoordTime:
+                raise ValueError("fixed devices '{0}' and '{1}' don't "
+                                 "coordinate, worst margin {2:.2f}".format(
+                                         device.parent.name, device.name, 
+                                         margin))
+        
+        with profilePhase('sweep'):
+            search = FeederSearch(devices, library.recloserCurves, 
+                                  minCoordTime)
+            try:
+                settings = search.run()
+            finally:
+                result['search'] = dict(search.stats)
+    except (KeyError, ValueError) as e:
+        result['error'] = str(e)
+        return result
+    
+    curves = {}
+    for device in devices:
+        if device.isOpen():
+            n, pickupCurrent, adder = settings[device.name]
+            curves[device.name] = (
+                    library.recloserCurves[n].scaled(pickupCurrent), adder)
+            result['settings'].append({'device': device.name,
+                                       'curve': library.curveFileLists[2][n],
+                                       'pickup': pickupCurrent,
+                                       'adder': adder})
+        else:
+            curves[device.name] = (device.curve, 0)
+    
+    for device in devices:
+        if device.parent is None: continue
+        parentCurve, parentAdder = curves[device.parent.name]
+        curve, adder = curves[device.name]
+        margin = getPairMargin(parentCurve, curve, device.coordMaxAmps)
+        result['margins'].append({'device': device.name,
+                                  'parent': device.parent.name,
+                                  'margin': margin + parentAdder - adder})
+    
+    if useProfile: result['profile'] = getProfileReport(library.curveFileLists[2])
+    return result
+
+def printFeederResult(result):
+    if result['error']:
+        print("!! {0}: {1}".format(result['name'], result['error']))
+        return
+    
+    print("{0}:".format(result['name']))
+    for setting in result['settings']:
+        print("{0}: {1} at {2}A, adder {3}".format(
+                setting['device'], setting['curve'], setting['pickup'], 
+                setting['adder']))
+    for margin in result['margins']:
+        print("  {0} under {1}: worst margin {2:.2f}".format(
+                margin['device'], margin['parent'], margin['margin']))
+
+#run the reclose sequence in a JSON file (see readSequence) and write every
+#setting that coordinates to resultPath as JSON
+def runSequenceFile(sequencePath, resultPath, library=None):
+    if library is None: library = CurveLibrary(startDir)
+    result = runSequence(readSequence(sequencePath), library)
+    
+    with open(resultPath, 'w') as f:
+        json.dump(result, f, indent=2)
+    printSequenceResult(result)
+    print("Results written to {0}".format(resultPath))
+    if useProfile and result['profile']: printProfileDigest(result['profile'])
+    
+    return result
+
+#a reclose sequence is a JSON object with name, minCoordTime, coordMaxAmps,
+#pickupMin, pickupMax and:
+#   downstream -> the fuse, either of its _MM or _TC curve file names. the
+#                 minimum melt curve heats the fuse and the total clearing
+#                 curve adds the arcing time, so the library needs both
+#   pattern    -> shots in Form 4 notation, such as 2A2B: two shots on curve
+#                 A, then two on curve B. the shots on the first curve are
+#                 the fast shots, if the pattern has more than one curve
+#   curves     -> the recloser curve (or a list of curves to try, or * for
+#                 all of them) for each letter of the pattern
+#   adders     -> time adder of each letter in cycles (default: 0)
+#   intervals  -> reclose interval after each shot but the last in cycles,
+#                 or one interval for all of them
+def readSequence(sequencePath):
+    with open(sequencePath) as f:
+        sequence = json.load(f)
+    if not isinstance(sequence, dict):
+        raise ValueError("{0} must hold a JSON object".format(sequencePath))
+    return sequence
+
+#a sequence read into the shots and curves it simulates
+class ReclosingSequence:
+    def __init__(self, sequence, library):
+        recloserList = library.curveFileLists[2]
+        
+        pattern = str(sequence.get('pattern') or '').upper()
+        if not re.fullmatch(r'(\d*[A-Z])+', pattern):
+            raise ValueError("pattern '{0}' isn't like 2A2B".format(pattern))
+        self.pattern = pattern
+        self.letters = []
+        self.shots = []
+        for count, letter in re.findall(r'(\d*)([A-Z])', pattern):
+            if letter not in self.letters: self.letters.append(letter)
+            self.shots.extend([self.letters.index(letter)] * int(count or 1))
+        if not self.shots:
+            raise ValueError("pattern '{0}' has no shots".format(pattern))
+        
+        #the fuse is saved by the fast shots and clears during the next one.
+        #with no shot on any other curve, every shot is a slow one
+        self.fastShots = 0
+        while (self.fastShots < len(self.shots) and 
+                self.shots[self.fastShots] == 0):
+            self.fastShots += 1
+        if self.fastShots == len(self.shots): self.fastShots = 0
+        
+        curves = sequence.get('curves') or {}
+        adders = sequence.get('adders') or {}
+        self.curveNumbers = []
+        self.adders = []
+        for letter in self.letters:
+            curveNames = curves.get(letter)
+            if not curveNames:
+                raise ValueError("no recloser curve for {0}".format(letter))
+            if curveNames == '*': curveNames = recloserList
+            if isinstance(curveNames, str): curveNames = curveNames.split(',')
+            numbers = []
+            for curveName in curveNames:
+                if (not isinstance(curveName, str) or 
+                        curveName.strip() not in recloserList):
+                    raise ValueError("unknown recloser curve "
+                                     "'{0}'".format(curveName))
+                numbers.append(recloserList.index(curveName.strip()))
+            self.curveNumbers.append(numbers)
+            self.adders.append(studyNumber(adders, letter, float, 0))
+        
+        intervals = sequence.get('intervals')
+        if not isinstance(intervals, list):
+            intervals = [intervals] * (len(self.shots) - 1)
+        if len(intervals) != len(self.shots) - 1:
+            raise ValueError("{0} shots need {1} reclose intervals".format(
+                    len(self.shots), len(self.shots) - 1))
+        self.intervals = [studyNumber({'intervals': interval}, 'intervals', 
+                                      float, minimum=0) 
+                          for interval in intervals]
+        
+        self.meltCurve, self.clearCurve = getSequenceFuse(sequence, library)
+        pickupMin, pickupMax = studyPickups(sequence)
+        self.pickups = list(range(pickupMin, pickupMax + 1, ampStep))
+        self.coordMaxAmps = studyNumber(sequence, 'coordMaxAmps', int, 
+                                        minimum=1)
+        self.minCoordTime = studyNumber(sequence, 'minCoordTime', float)
+
+#compiled minimum melt and total clearing curves of a sequence's fuse
+def getSequenceFuse(sequence, library):
+    fuseName = sequence.get('downstream') or ''
+    if library.getCurveType(fuseName) != 'fuse':
+        raise ValueError("unknown fuse curve '{0}'".format(fuseName))
+    if not fuseName.upper().endswith(('_MM', '_TC')):
+        raise ValueError("fuse curve '{0}' isn't named _MM or _TC".format(
+                fuseName))
+    
+    fuseCurves = []
+    for suffix in ('_MM', '_TC'):
+        curveName = fuseName[:-3] + suffix
+        if library.getCurveType(curveName) != 'fuse':
+            raise ValueError("fuse curve '{0}' is missing".format(curveName))
+        fuseCurves.append(library.getCurve(curveName, 'd'))
+    return fuseCurves
+
+#simulate a reclose sequence for every combination of its curves at every
+#stepped pickup, and keep the settings that coordinate. see 
+#getSequenceOutcomes() for how the fuse is checked
+def runSequence(sequence, library):
+    result = {'name': sequence.get('name') or 'sequence',
+              'pattern': None,
+              'fastShots': None,
+              'candidates': 0,
+              'saved': 0,
+              'settings': [],
+              'profile': None,
+              'error': None}
+    resetProfile()
+    
+    try:
+        if np is None:
+            raise ValueError("numpy is needed for sequence simulation")
+        reclosing = ReclosingSequence(sequence, library)
+    except (KeyError, ValueError) as e:
+        result['error'] = str(e)
+        return result
+    result['pattern'] = reclosing.pattern
+    result['fastShots'] = reclosing.fastShots
+    recloserList = library.curveFileLists[2]
+    
+    meltCurve = packCurves([reclosing.meltCurve])
+    clearCurve = packCurves([reclosing.clearCurve])
+    letterCurves = [packCurves([library.recloserCurves[n] for n in numbers])
+                    for numbers in reclosing.curveNumbers]
+    optionCounts = [len(numbers) for numbers in reclosing.curveNumbers]
+    
+    #fault currents from where both fuse curves start
+    lowAmps = max(reclosing.meltCurve.currents[0], 
+                  reclosing.clearCurve.currents[0])
+    currents = np.geomspace(lowAmps, max(lowAmps, reclosing.coordMaxAmps), 
+                            sequencePoints)
+    
+    #a chunk of pickups at a time, with every combination of curves
+    chunk = max(1, marginGridCells // (int(np.prod(optionCounts)) * 
+                                       len(currents)))
+    with profilePhase('sweep'):
+        for start in range(0, len(reclosing.pickups), chunk):
+            pickups = np.array(reclosing.pickups[start:start+chunk], 
+                               dtype=float)
+            worstMargin, peakHeat, saved, saveAmps = getSequenceOutcomes(
+                    reclosing, meltCurve, clearCurve, letterCurves, pickups,
+                    currents)
+            
+            coordinated = worstMargin >= reclosing.minCoordTime
+            result['candidates'] += coordinated.size
+            countCandidates(coordinated.size, 
+                            int(np.count_nonzero(coordinated)))
+            for index in zip(*np.nonzero(coordinated)):
+                *options, k = index
+                setting = {'curves': {letter: recloserList[numbers[option]]
+                                      for letter, numbers, option in zip(
+                                              reclosing.letters, 
+                                              reclosing.curveNumbers, 
+                                              options)},
+                           'pickup': int(pickups[k]),
+                           'worstMargin': float(worstMargin[index]),
+                           'saved': None,
+                           'saveAmps': None,
+                           'peakHeat': None}
+                if math.isinf(setting['worstMargin']):
+                    setting['worstMargin'] = None
+                if reclosing.fastShots:
+                    setting['saved'] = bool(saved[index])
+                    setting['saveAmps'] = float(saveAmps[index])
+                    setting['peakHeat'] = float(peakHeat[index])
+                    result['saved'] += setting['saved']
+                result['settings'].append(setting)
+    
+    if useProfile: result['profile'] = getProfileReport(recloserList)
+    return result
+
+#simulate a sequence at every fault current for a chunk of pickups, with
+#every combination of its curves. the fuse heats by each shot's time over
+#its minimum melt time at that current, and keeps exp(-interval /
+#fuseCoolingTime) of its heat over each reclose interval. it's saved at a
+#current if its heat stays under fuseDamageFactor through the fast shots.
+#it then has to clear, in the rest of its melt time plus its arcing time
+#(total clearing minus minimum melt), at least minCoordTime before the
+#first slow shot trips. only currents where the fuse and every curve in
+#the sequence have points are checked, like testCoord().
+#returns (curve options... x pickups) arrays of the worst margin of the
+#first slow shot, the peak heat over the fast shots, whether the fuse is
+#saved at every current, and the highest current it's saved up to
+def getSequenceOutcomes(reclosing, meltCurve, clearCurve, letterCurves, 
+                        pickups, currents):
+    meltTimes = interpolateFixed(meltCurve, currents)
+    clearTimes = interpolateFixed(clearCurve, currents)
+    valid = ((currents <= meltCurve['currents'][0, -1]) & 
+             (currents <= clearCurve['currents'][0, -1]))
+    
+    #each letter's trip times, on an axis of their own so the curves of 
+    #every letter combine by broadcasting
+    letterTimes = []
+    for i, packedCurves in enumerate(letterCurves):
+        rowCount = len(packedCurves['lengths'])
+        queries = np.log10(currents) - np.log10(pickups)[:, None]
+        queries = np.broadcast_to(queries, (rowCount,) + queries.shape)
+        times = interpolateRows(packedCurves, queries) + reclosing.adders[i]
+        if useProfile: profileCounters['interpolations'] += queries.size
+        
+        lastIndex = packedCurves['lengths'] - 1
+        firstAmps = packedCurves['currents'][:, 0, None] * pickups
+        lastAmps = (packedCurves['currents'][np.arange(rowCount), lastIndex, 
+                                             None] * pickups)
+        inRange = ((currents >= firstAmps[:, :, None]) & 
+                   (currents <= lastAmps[:, :, None]))
+        
+        shape = [1] * len(letterCurves) + [len(pickups), len(currents)]
+        shape[i] = rowCount
+        letterTimes.append(times.reshape(shape))
+        valid = valid & inRange.reshape(shape)
+    
+    heat = 0.0
+    peakHeat = 0.0
+    for n in range(reclosing.fastShots):
+        heat = heat + letterTimes[reclosing.shots[n]] / meltTimes
+        peakHeat = np.maximum(peakHeat, heat)
+        if fuseCoolingTime:
+            heat = heat * math.exp(-reclosing.intervals[n] / fuseCoolingTime)
+    
+    slowTimes = letterTimes[reclosing.shots[reclosing.fastShots]]
+    clearing = np.maximum(1 - heat, 0) * meltTimes + (clearTimes - meltTimes)
+    margins = np.where(valid, slowTimes - clearing, np.inf)
+    worstMargin = margins.min(axis=-1)
+    
+    #saved up to the current just under the first one it isn't saved at
+    failed = valid & (peakHeat >= fuseDamageFactor)
+    saved = ~failed.any(axis=-1)
+    belowAmps = np.concatenate([[0.0], currents[:-1]])
+    saveAmps = np.where(saved, currents[-1], belowAmps[failed.argmax(axis=-1)])
+    peakHeat = np.where(valid, peakHeat, 0).max(axis=-1)
+    
+    return worstMargin, peakHeat, saved, saveAmps
+
+def printSequenceResult(result):
+    if result['error']:
+        print("!! {0}: {1}".format(result['name'], result['error']))
+        return
+    
+    print("{0}: {1}, {2} of {3} settings coordinate".format(
+            result['name'], result['pattern'], len(result['settings']), 
+            result['candidates']))
+    if not result['fastShots']: return
+    
+    print("{0} save the fuse up to the maximum current. saving the fuse to "
+          "the highest current:".format(result['saved']))
+    best = sorted(result['settings'], key=lambda setting: 
+                  (-setting['saveAmps'], 
+                   -math.inf if setting['worstMargin'] is None 
+                   else -setting['worstMargin']))
+    for setting in best[:10]:
+        print("  {0} at {1}A: saved to {2:.0f}A, peak heat {3:.2f}, "
+              "margin {4}".format(
+                ", ".join("{0} {1}".format(letter, curveName) for letter, 
+                          curveName in setting['curves'].items()),
+                setting['pickup'], setting['saveAmps'], setting['peakHeat'],
+                "{0:.2f}".format(setting['worstMargin']) 
+                if setting['worstMargin'] is not None else "-"))
+
+#serve coordination studies over localhost HTTP until interrupted, so the
+#curves are only loaded once. requests and responses are JSON:
+#   POST /solutions -> one study, with the same fields as a batch study
+#                      except the report paths, which would let a client
+#                      write files. answers with runStudy()'s result, plus
+#                      'seconds'
+#   GET /curves     -> the curve file names of each curve type
+#   GET /stats      -> request count, latency percentiles and reloads
+#requests are handled concurrently, each in its own thread
+def runServer(port=serverPort, rootDir=None):
+    server = CoordinationServer(rootDir or startDir, port)
+    watcher = threading.Thread(target=server.watchLibrary, daemon=True)
+    watcher.start()
+    print("Serving on http://127.0.0.1:{0}, press Ctrl+C to stop".format(
+            server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stopped.set()
+        server.server_close()
+
+#size and modification time of every curve and export file, to spot changed
+#libraries. the export folder doesn't have to exist
+def getLibrarySignature(curvePaths, exportPath=None):
+    folders = [(curveType, curvePaths[curveType]) for curveType in curveTypes]
+    if exportPath and os.path.isdir(exportPath):
+        folders.append(('export', exportPath))
+    
+    signature = []
+    for folderType, folderPath in folders:
+        with os.scandir(folderPath) as entries:
+            for entry in entries:
+                fileStat = entry.stat()
+                signature.append((folderType, entry.name, 
+                                  fileStat.st_mtime_ns, fileStat.st_size))
+    return sorted(signature)
+
+class CoordinationServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    
+    def __init__(self, rootDir, port):
+        self.rootDir = rootDir
+        self.curvePaths = getCurvePaths(rootDir)
+        self.exportPath = os.path.join(rootDir, exportFolder)
+        self.signature = getLibrarySignature(self.curvePaths, self.exportPath)
+        start = time.perf_counter()
+        self.coordinator = Coordinator(CurveLibrary(rootDir))
+        self.loadSeconds = time.perf_counter() - start
+        self.reloads = 0
+        self.stopped = threading.Event()
+        
+        self.statsLock = threading.Lock()
+        self.requestCount = 0
+        self.latencies = collections.deque(maxlen=latencyWindow)
+        
+        super().__init__(('127.0.0.1', port), CoordinationHandler)
+    
+    #reload the library whenever a curve file is added, removed or changed.
+    #requests already running finish against the library they started with.
+    #a library that fails to load (say, a file caught half written) is tried
+    #again on the next check, and the old one is kept until then
+    def watchLibrary(self):
+        while not self.stopped.wait(reloadInterval):
+            try:
+                signature = getLibrarySignature(self.curvePaths, 
+                                                self.exportPath)
+                if signature == self.signature: continue
+                start = time.perf_counter()
+                coordinator = Coordinator(CurveLibrary(self.rootDir))
+            except Exception as e:
+                print("!! Curve library reload failed: {0}".format(e))
+                continue
+            self.coordinator = coordinator
+            self.signature = signature
+            self.loadSeconds = time.perf_counter() - start
+            self.reloads += 1
+            print("Curve library reloaded in {0:.3f} s".format(
+                    self.loadSeconds))
+    
+    def addLatency(self, seconds):
+        with self.statsLock:
+            self.requestCount += 1
+            self.latencies.append(seconds)
+    
+    def getStats(self):
+        with self.statsLock:
+            latencies = sorted(self.latencies)
+            requestCount = self.requestCount
+        stats = {'requests': requestCount, 
+                 'reloads': self.reloads,
+                 'loadSeconds': self.loadSeconds,
+                 'curves': [len(curveList) for curveList in 
+                            self.coordinator.library.curveFileLists]}
+        if latencies:
+            stats['latency'] = {
+                'mean': sum(latencies) / len(latencies),
+                'p50': latencies[len(latencies) // 2],
+                'p95': latencies[min(len(latencies) - 1, 
+                                     int(len(latencies) * 0.95))],
+                'max': latencies[-1]}
+        return stats
+
+#routes go by the path alone, so a query string doesn't turn a request into
+#a 404
+class CoordinationHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        start = time.perf_counter()
+        path = urllib.parse.urlsplit(self.path).path
+        if path == '/curves':
+            library = self.server.coordinator.library
+            self.sendJson(200, dict(zip(curveTypes, library.curveFileLists)),
+                          start)
+        elif path == '/stats':
+            self.sendJson(200, self.server.getStats(), start)
+        else:
+            self.sendJson(404, {'error': "no such path"}, start)
+    
+    def do_POST(self):
+        start = time.perf_counter()
+        if urllib.parse.urlsplit(self.path).path != '/solutions':
+            self.sendJson(404, {'error': "no such path"}, start)
+            return
+        
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            study = json.loads(self.rfile.read(length))
+            if not isinstance(study, dict):
+                raise ValueError("a study must be a JSON object")
+        except ValueError as e:
+            self.sendJson(400, {'error': "bad request: {0}".format(e)}, start)
+            return
+        
+        #runStudy() reports a bad study in its result. anything else it
+        #raises is a bug, answered with a 500 so the client isn't left
+        #hanging
+        try:
+            result = self.server.coordinator.runStudy(study)
+        except Exception as e:
+            traceback.print_exc()
+            self.sendJson(500, {'error': "internal error: {0}".format(e)}, 
+                          start)
+            return
+        self.sendJson(400 if result['error'] else 200, result, start)
+    
+    #send a JSON body with the time spent on the request, then log it
+    def sendJson(self, status, body, start):
+        seconds = time.perf_counter() - start
+        body['seconds'] = seconds
+        data = json.dumps(body).encode()
+        
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        
+        self.server.addLatency(seconds)
+        self.log_message('"%s" %d %.1f ms', self.requestline, status, 
+                         1000*seconds)
+    
+    #requests are logged by sendJson(), with their latency
+    def log_request(self, code='-', size='-'):
+        pass
+
+#command line options. with none, the program runs interactively
+def parseArgs(args):
+    parser = argparse.ArgumentParser(description="CAPE Recloser Setting "
+                                                 "Coordination Aide")
+    parser.add_argument('--batch', metavar='STUDIES',
+                        help="run every study in a CSV or JSON file")
+    parser.add_argument('--out', metavar='RESULTS', default='results.json',
+                        help="batch results file, .json, .csv or .jsonl. "
+                             "CSV and JSON Lines are written as studies run "
+                             "(default: results.json)")
+    parser.add_argument('--feeder', metavar='FEEDER',
+                        help="find settings for every open recloser on the "
+                             "feeder in a JSON file, written to --out")
+    parser.add_argument('--sequence', metavar='SEQUENCE',
+                        help="simulate the reclose sequence in a JSON file "
+                             "at every setting, written to --out")
+    parser.add_argument('--workers', metavar='N', type=int, nargs='?', const=0,
+                        default=1,
+                        help="number of worker processes, or one per CPU "
+                             "core if N is left out (default: 1)")
+    parser.add_argument('--serve', metavar='PORT', type=int, nargs='?', 
+                        const=serverPort,
+                        help="answer studies over localhost HTTP, on PORT "
+                             "(default: {0})".format(serverPort))
+    parser.add_argument('--rank', metavar='K', type=int, nargs='?', const=10,
+                        default=0,
+                        help="only list the K best settings (default: 10)")
+    parser.add_argument('--rank-by', choices=('margin', 'headroom'), 
+                        default=rankScore,
+                        help="what the best settings are ranked by "
+                             "(default: {0})".format(rankScore))
+    parser.add_argument('--no-cache', action='store_true',
+                        help="don't read or store results in the result cache")
+    parser.add_argument('--precompute', action='store_true',
+                        help="build the coordination table for every fuse and "
+                             "breaker pair and exit")
+    parser.add_argument('--no-table', action='store_true',
+                        help="don't look studies up in the coordination table")
+    parser.add_argument('--cache-stats', action='store_true',
+                        help="print result cache stats for every run so far "
+                             "and exit")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="write the batch's counters and phase times to "
+                             "PATH as JSON")
+    parser.add_argument('--no-profile', action='store_true',
+                        help="don't count or time anything")
+    parser.add_argument('--trace', metavar='LEVEL', type=int, default=0,
+                        help="trace level, 1 (curves) to 3 (every point)")
+    parser.add_argument('--trace-filter', metavar='CURVE,PICKUP',
+                        help="only trace one recloser curve number and pickup")
+    parser.add_argument('--trace-file', metavar='PATH', default=traceFile,
+                        help="where the trace is written "
+                             "(default: {0})".format(traceFile))
+    return parser.parse_args(args)
+
+if __name__ == '__main__':
+    options = parseArgs(sys.argv[1:])
+    workerCount = options.workers
+    rankCount = options.rank
+    rankScore = options.rank_by
+    traceFile = options.trace_file
+    if options.no_cache: useResultCache = False
+    if options.no_table: useCoordTable = False
+    if options.no_profile: useProfile = False
+    if options.cache_stats:
+        cachePath = os.path.join(startDir, resultCacheName)
+        stats = readResultCacheStats(cachePath)
+        printResultCacheStats(stats)
+        print("{0} of {1} results stored in {2}".format(
+                stats['results'], stats['limit'], cachePath))
+        sys.exit()
+    if options.precompute:
+        start = time.perf_counter()
+        library = CurveLibrary(startDir)
+        pairs = buildCoordTable(library)
+        print("Coordination table for {0} fuse/breaker pairs written to {1} "
+              "in {2:.1f}s".format(len(pairs), library.coordTablePath, 
+                                   time.perf_counter() - start))
+        sys.exit()
+    if options.trace:
+        candidate = None
+        if options.trace_filter:
+            curveNumber, pickupCurrent = options.trace_filter.split(',')
+            candidate = (int(curveNumber), int(pickupCurrent))
+        startTrace(options.trace, candidate=candidate)
+    
+    if options.batch:
+        runBatch(options.batch, options.out, profilePath=options.profile)
+        sys.exit()
+    
+    if options.feeder:
+        runFeederFile(options.feeder, options.out)
+        sys.exit()
+    
+    if options.sequence:
+        runSequenceFile(options.sequence, options.out)
+        sys.exit()
+    
+    if options.serve is not None:
+        runServer(options.serve)
+        sys.exit()
     
-    if (writeSol.lower() == 'y'):
-        with open('solutions.txt', 'w') as f:
-            for line in solutionOut:
-                f.write(line)
-                f.write('\n')
-        
-def printDevLog():
-    with open('logFile', 'w') as f:
-        for entry in devLog:
-            f.write(entry)
-            f.write('\n')
-  
-if __name__ == '__main__':
     try:
         main()
     except OSError as e:
@@ -0,0 +1,734 @@
+"""
+CAPE Recloser Setting Coordination Aide - checks
+
+The numpy, loop and exact coordination engines have to agree on the shipped
+    curves, and the server has to answer studies over HTTP. Run with:
+    python -m pytest test_RecloserCoordinator.py
+
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import threading
+import urllib.request
+import urllib.error
+import importlib.util
+
+import pytest
+
+#the coordinator lives in a file with a version number in its name, so it
+#can't be imported the usual way
+coordinatorPath = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'RecloserCoordinator_v0.2.py')
+
+def loadCoordinator():
+    spec = importlib.util.spec_from_file_location('RecloserCoordinator',
+                                                  coordinatorPath)
+    rc = importlib.util.module_from_spec(spec)
+    sys.modules['RecloserCoordinator'] = rc
+    spec.loader.exec_module(rc)
+    return rc
+
+rc = loadCoordinator()
+
+#nothing is read from or written to the caches next to the curves
+rc.useCurveCache = False
+rc.useResultCache = False
+rc.useCoordTable = False
+rc.workerCount = 1
+
+#fuse and breaker pairs from the shipped curves, at a few coordination times
+studies = [('SM-4_100E_TC', 'EX-INV_P3-T6-C160', (50, 600, 10000), 12),
+           ('POSI_65K_TC', 'EX-INV_P3-T6-C160', (50, 600, 5000), 20),
+           ('SMU20_40E_TC', 'EX-INV_P3-T6-C160', (25, 400, 12000), 6)]
+
+#a few of the shipped curves, enough for the first study to coordinate
+smallLibrary = {'breakerCurves': ['EX-INV_P3-T6-C160'],
+                'fuseCurves': ['SM-4_100E_TC', 'SM-4_100E_MM', 'POSI_65K_TC'],
+                'recloserCurves': ['kyle134', 'kyle119', 'kyle151', 'kyle101']}
+
+@pytest.fixture(scope='module')
+def library():
+    return rc.CurveLibrary(os.path.dirname(coordinatorPath))
+
+#a copy of smallLibrary in its own folder, free to change
+@pytest.fixture
+def libraryDir(tmp_path):
+    for folder, curveNames in smallLibrary.items():
+        os.mkdir(tmp_path / folder)
+        for curveName in curveNames:
+            shutil.copy(os.path.join(os.path.dirname(coordinatorPath), 
+                                     folder, curveName), 
+                        tmp_path / folder / curveName)
+    return tmp_path
+
+def getSolutions(library, engine, study, marginCache=False):
+    downstream, upstream, coordAmps, minCoordTime = study
+    rc.coordEngine = engine
+    rc.useMarginCache = marginCache
+    try:
+        return rc.Coordinator(library).getSolutions(downstream, upstream,
+                                                    coordAmps, minCoordTime)
+    finally:
+        rc.coordEngine = 'numpy'
+        rc.useMarginCache = False
+
+@pytest.mark.skipif(rc.np is None, reason="numpy is not installed")
+@pytest.mark.parametrize('study', studies)
+def test_numpyMatchesLoop(library, study):
+    loopSolutions = getSolutions(library, 'loop', study)
+    assert loopSolutions
+    assert getSolutions(library, 'numpy', study) == loopSolutions
+    assert getSolutions(library, 'numpy', study, True) == loopSolutions
+
+#every stepped pickup the loop engine accepts is inside one of the exact
+#engine's intervals for the same curve, and every one it rejects is outside.
+#pickups right at the end of an interval could go either way on rounding
+@pytest.mark.parametrize('study', studies)
+def test_exactMatchesLoop(library, study):
+    pickupMin, pickupMax = study[2][:2]
+    loopSolutions = {tuple(solution)
+                     for solution in getSolutions(library, 'loop', study)}
+    intervals = getSolutions(library, 'exact', study)
+
+    for n in range(len(library.recloserCurves)):
+        curveIntervals = [(low, high) for m, low, high in intervals if m == n]
+        for pickup in range(pickupMin, pickupMax+1, rc.ampStep):
+            if any(abs(pickup - end) < 1e-6 * pickup
+                   for interval in curveIntervals for end in interval):
+                continue
+            inside = any(low <= pickup <= high for low, high in curveIntervals)
+            assert inside == ((n, pickup) in loopSolutions), (n, pickup)
+
+#a server on a free port for smallLibrary, with the library watcher running
+@pytest.fixture
+def server(libraryDir, monkeypatch):
+    monkeypatch.setattr(rc, 'reloadInterval', 0.05)
+    server = rc.CoordinationServer(str(libraryDir), 0)
+    for target in (server.serve_forever, server.watchLibrary):
+        threading.Thread(target=target, daemon=True).start()
+    yield server
+    server.stopped.set()
+    server.shutdown()
+    server.server_close()
+
+#status and JSON body of a request to the server. body is sent as is if it's
+#bytes, or as JSON
+def request(server, path, body=None):
+    if body is not None and not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+    url = 'http://127.0.0.1:{0}{1}'.format(server.server_port, path)
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, body)) as f:
+            return f.status, json.load(f)
+    except urllib.error.HTTPError as e:
+        with e:
+            return e.code, json.load(e)
+
+serverStudy = {'downstream': 'SM-4_100E_TC', 'upstream': 'EX-INV_P3-T6-C160',
+               'pickupMin': 50, 'pickupMax': 600, 'coordMaxAmps': 10000,
+               'minCoordTime': 12}
+
+def test_serverSolutions(server, library):
+    status, body = request(server, '/solutions', serverStudy)
+    assert status == 200
+    assert body['error'] is None
+    assert body['seconds'] >= 0
+    
+    #the small library has the shipped curves that coordinate
+    recloserCurves = {row['curve'] for row in body['solutions']}
+    expected = rc.Coordinator(library).getSolutionRanges(
+            'SM-4_100E_TC', 'EX-INV_P3-T6-C160', (50, 600, 10000), 12)
+    assert recloserCurves == {row['curve'] for row in expected}
+    assert recloserCurves <= set(smallLibrary['recloserCurves'])
+
+def test_serverRoutes(server):
+    #a query string doesn't change the route
+    status, body = request(server, '/curves?x=1')
+    assert status == 200
+    assert {curveType: sorted(curveNames) 
+            for curveType, curveNames in body.items() 
+            if curveType != 'seconds'} == {
+            'breaker': sorted(smallLibrary['breakerCurves']),
+            'fuse': sorted(smallLibrary['fuseCurves']),
+            'recloser': sorted(smallLibrary['recloserCurves'])}
+    assert request(server, '/solutions?x=1', serverStudy)[0] == 200
+    
+    status, body = request(server, '/stats')
+    assert status == 200
+    assert body['requests'] == 2
+    assert body['curves'] == [1, 3, 4]
+    
+    assert request(server, '/nowhere')[0] == 404
+    assert request(server, '/nowhere', serverStudy)[0] == 404
+
+@pytest.mark.parametrize('body, message', [
+        (b'{not json', "bad request"),
+        ([serverStudy], "bad request: a study must be a JSON object"),
+        (dict(serverStudy, downstream='nothing'), "unknown downstream curve"),
+        (dict(serverStudy, marginReport='report.csv'), "only allowed in batch")])
+def test_serverBadStudy(server, libraryDir, body, message):
+    status, result = request(server, '/solutions', body)
+    assert status == 400
+    assert message in result['error']
+    assert not os.path.exists(libraryDir / 'report.csv')
+
+def test_serverFailure(server, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("broken")
+    monkeypatch.setattr(rc, 'runStudy', fail)
+    assert request(server, '/solutions', serverStudy) == (500, {
+            'error': "internal error: broken", 
+            'seconds': pytest.approx(0, abs=1)})
+    
+    #the server is still up
+    assert request(server, '/stats')[0] == 200
+
+def test_serverReload(server, libraryDir):
+    shutil.copy(libraryDir / 'recloserCurves' / 'kyle101', 
+                libraryDir / 'recloserCurves' / 'kyle999')
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        status, body = request(server, '/curves')
+        if 'kyle999' in body['recloser']: break
+        time.sleep(0.05)
+    assert 'kyle999' in body['recloser']
+    assert request(server, '/stats')[1]['reloads'] == 1
+
+#a breaker over two open reclosers, one under the other, with a fuse under
+#each
+def getFeeder(**changes):
+    feeder = {'name': 'feeder', 'minCoordTime': 12, 'coordMaxAmps': 8000,
+              'devices': [{'name': 'breaker', 'curve': 'EX-INV_P3-T6-C160'},
+                          {'name': 'main', 'parent': 'breaker',
+                           'pickupMin': 200, 'pickupMax': 600},
+                          {'name': 'branch', 'parent': 'main',
+                           'pickupMin': 50, 'pickupMax': 400, 'adderMax': 10,
+                           'coordMaxAmps': 5000},
+                          {'name': 'tap', 'parent': 'branch', 
+                           'curve': 'SM-4_10E_TC', 'coordMaxAmps': 3000},
+                          {'name': 'lateral', 'parent': 'main', 
+                           'curve': 'SM-4_40E_TC', 'coordMaxAmps': 4000}]}
+    feeder.update(changes)
+    return feeder
+
+@pytest.mark.parametrize('engine', ['numpy', 'loop'])
+def test_feederMargins(library, engine, monkeypatch):
+    monkeypatch.setattr(rc, 'coordEngine', engine)
+    feeder = getFeeder()
+    result = rc.runFeeder(feeder, library)
+    assert result['error'] is None
+    
+    devices = {device['name']: device for device in feeder['devices']}
+    assert {setting['device'] for setting in result['settings']} == {
+            'main', 'branch'}
+    for setting in result['settings']:
+        device = devices[setting['device']]
+        assert device['pickupMin'] <= setting['pickup'] <= device['pickupMax']
+        assert 0 <= setting['adder'] <= device.get('adderMax', 0)
+    
+    assert len(result['margins']) == len(devices) - 1
+    for margin in result['margins']:
+        assert margin['margin'] >= feeder['minCoordTime']
+
+@pytest.mark.parametrize('devices, message', [
+        ([5], "a device must be an object, not 5"),
+        ([{'curve': 'EX-INV_P3-T6-C160'}], "'None' is missing or repeated"),
+        ([{'name': 'a', 'curve': 'EX-INV_P3-T6-C160'}, 
+          {'name': 'a', 'parent': 'a', 'curve': 'SM-4_10E_TC'}], 
+         "'a' is missing or repeated"),
+        ([{'name': 'a', 'curve': 'EX-INV_P3-T6-C160'},
+          {'name': 'b', 'parent': 'c', 'curve': 'SM-4_10E_TC'}],
+         "device 'b' has an unknown parent 'c'"),
+        ([{'name': 'a', 'curve': 'EX-INV_P3-T6-C160'},
+          {'name': 'b', 'curve': 'SM-4_10E_TC'}],
+         "exactly one device with no parent"),
+        ([{'name': 'a', 'curve': 'EX-INV_P3-T6-C160'},
+          {'name': 'b', 'parent': 'c', 'curve': 'SM-4_10E_TC'},
+          {'name': 'c', 'parent': 'b', 'curve': 'SM-4_10E_TC'}],
+         "must form a tree"),
+        ([{'name': 'a', 'curve': 'nothing'}], "device 'a': unknown curve"),
+        ([{'name': 'a', 'curve': 'EX-INV_P3-T6-C160'},
+          {'name': 'b', 'parent': 'a', 'curves': ['nothing'], 
+           'pickupMin': 50, 'pickupMax': 400}],
+         "device 'b': unknown recloser curve 'nothing'"),
+        ([{'name': 'a', 'curve': 'EX-INV_P3-T6-C160'},
+          {'name': 'b', 'parent': 'a', 'curves': [5], 
+           'pickupMin': 50, 'pickupMax': 400}],
+         "device 'b': unknown recloser curve '5'"),
+        ([{'name': 'a', 'curve': 'EX-INV_P3-T6-C160'},
+          {'name': 'b', 'parent': 'a', 'pickupMin': 0, 'pickupMax': 400}],
+         "device 'b': field 'pickupMin' must be at least 1"),
+        ([{'name': 'a', 'curve': 'SM-4_10E_TC'},
+          {'name': 'b', 'parent': 'a', 'curve': 'EX-INV_P3-T6-C160'}],
+         "fixed devices 'a' and 'b' don't coordinate")])
+def test_feederBadDevices(library, devices, message):
+    result = rc.runFeeder(getFeeder(devices=devices), library)
+    assert message in result['error']
+    assert result['settings'] == []
+
+def test_feederNoSettings(library):
+    result = rc.runFeeder(getFeeder(minCoordTime=200), library)
+    assert "no settings coordinate for 'main'" in result['error']
+
+#the curve cache is only a shortcut, so a cache that can't be written (here,
+#a folder in the way of the file) leaves the curves loaded and no temporary
+#file behind
+def test_curveCacheNotWritable(libraryDir):
+    cachePath = libraryDir / 'curveCache.bin'
+    os.mkdir(cachePath)
+    loaded = rc.CurveLibrary(str(libraryDir), cachePath=str(cachePath))
+    assert loaded.curveData == rc.CurveLibrary(str(libraryDir)).curveData
+    assert sorted(os.listdir(libraryDir)) == sorted(
+            list(smallLibrary) + ['curveCache.bin'])
+    
+    missingPath = libraryDir / 'missing' / 'curveCache.bin'
+    loaded = rc.CurveLibrary(str(libraryDir), cachePath=str(missingPath))
+    assert loaded.curveFileLists == rc.CurveLibrary(
+            str(libraryDir)).curveFileLists
+
+#a coordination table for smallLibrary on a small grid, with the table turned
+#on. returns the library it was built from
+@pytest.fixture
+def tableLibrary(libraryDir, monkeypatch):
+    monkeypatch.setattr(rc, 'coordTableTimes', (6, 12, 20))
+    monkeypatch.setattr(rc, 'coordTableAmps', (5000, 10000))
+    monkeypatch.setattr(rc, 'coordTablePickups', (25, 1000))
+    monkeypatch.setattr(rc, 'useCoordTable', True)
+    library = rc.CurveLibrary(str(libraryDir))
+    pairs = rc.buildCoordTable(library)
+    assert sorted(pairs) == sorted(
+            (fuseName, 'EX-INV_P3-T6-C160') 
+            for fuseName in smallLibrary['fuseCurves'])
+    return library
+
+def getTableSolutions(library, downstream, coordAmps, minCoordTime, 
+                      adderRange=None):
+    coordCurves = rc.Coordinator(library).getCoordCurves(downstream, 
+                                                         'EX-INV_P3-T6-C160')
+    return rc.getTableSolutions(coordCurves, coordAmps, minCoordTime, 
+                                adderRange, library.coordTablePath)
+
+def sweepSolutions(library, downstream, coordAmps, minCoordTime):
+    coordCurves = rc.Coordinator(library).getCoordCurves(downstream, 
+                                                         'EX-INV_P3-T6-C160')
+    return rc.sweepSolutions(coordCurves, coordAmps, minCoordTime)
+
+@pytest.mark.skipif(rc.np is None, reason="numpy is not installed")
+def test_coordTableMatchesSweep(tableLibrary):
+    lookups = 0
+    for downstream in smallLibrary['fuseCurves']:
+        for minCoordTime in rc.coordTableTimes:
+            for coordMaxAmps in rc.coordTableAmps:
+                for pickupMin, pickupMax in ((25, 1000), (50, 600), 
+                                             (300, 302), (995, 1000)):
+                    coordAmps = (pickupMin, pickupMax, coordMaxAmps)
+                    solutionSet = getTableSolutions(tableLibrary, downstream,
+                                                    coordAmps, minCoordTime)
+                    assert solutionSet == sweepSolutions(
+                            tableLibrary, downstream, coordAmps, minCoordTime)
+                    lookups += 1
+    assert lookups == 3 * 3 * 2 * 4
+    
+    #and the coordinator answers from the table
+    hits = rc.coordTableStats['hits']
+    rc.Coordinator(tableLibrary).getSolutions(
+            'SM-4_100E_TC', 'EX-INV_P3-T6-C160', (50, 600, 10000), 12)
+    assert rc.coordTableStats['hits'] == hits + 1
+
+#studies off the table's grid aren't answered from it, and are swept instead
+@pytest.mark.skipif(rc.np is None, reason="numpy is not installed")
+@pytest.mark.parametrize('coordAmps, minCoordTime, adderRange', [
+        ((50, 600, 10000), 13, None),
+        ((50, 600, 7000), 12, None),
+        ((52, 600, 10000), 12, None),
+        ((20, 600, 10000), 12, None),
+        ((50, 1005, 10000), 12, None),
+        ((50, 600, 10000), 12, (0, 10))])
+def test_coordTableOffGrid(tableLibrary, coordAmps, minCoordTime, adderRange):
+    assert getTableSolutions(tableLibrary, 'SM-4_100E_TC', coordAmps, 
+                             minCoordTime, adderRange) is None
+    if adderRange is None:
+        assert rc.Coordinator(tableLibrary).getSolutions(
+                'SM-4_100E_TC', 'EX-INV_P3-T6-C160', coordAmps, 
+                minCoordTime) == sweepSolutions(tableLibrary, 'SM-4_100E_TC',
+                                                coordAmps, minCoordTime)
+
+#a table built from other curves or settings, or one that can't be read, is
+#never used
+@pytest.mark.skipif(rc.np is None, reason="numpy is not installed")
+@pytest.mark.parametrize('change', ['recloser', 'fuse', 'ampStep', 'garbage'])
+def test_coordTableStale(tableLibrary, libraryDir, monkeypatch, change):
+    coordAmps = (50, 600, 10000)
+    assert getTableSolutions(tableLibrary, 'SM-4_100E_TC', coordAmps, 
+                             12) is not None
+    
+    if change == 'ampStep':
+        monkeypatch.setattr(rc, 'ampStep', 10)
+    elif change == 'garbage':
+        with open(tableLibrary.coordTablePath, 'wb') as f:
+            f.write(b'not a table')
+    else:
+        curvePath = (libraryDir / 'recloserCurves' / 'kyle134' 
+                     if change == 'recloser' else
+                     libraryDir / 'fuseCurves' / 'SM-4_100E_TC')
+        with open(curvePath, newline='') as f:
+            lines = f.read().split('\r\n')
+        #one time a little slower
+        for i, line in enumerate(lines):
+            fields = line.split()
+            if len(fields) == 2 and fields[0][0].isdigit():
+                lines[i] = line.replace(fields[1], 
+                                        "{0:g}".format(float(fields[1]) * 1.1))
+                break
+        else:
+            pytest.fail("no curve point in {0}".format(curvePath))
+        with open(curvePath, 'w', newline='') as f:
+            f.write('\r\n'.join(lines))
+    
+    library = rc.CurveLibrary(str(libraryDir))
+    assert getTableSolutions(library, 'SM-4_100E_TC', coordAmps, 12) is None
+    assert rc.Coordinator(library).getSolutions(
+            'SM-4_100E_TC', 'EX-INV_P3-T6-C160', coordAmps, 12) == \
+            sweepSolutions(library, 'SM-4_100E_TC', coordAmps, 12)
+
+#a fast curve A and a slow curve B over SM-4_100E. the fuse is saved by the
+#fast shots up to about 3100A
+def getSequence(**changes):
+    sequence = {'name': 'sequence', 'downstream': 'SM-4_100E_TC', 
+                'pattern': '1A1B', 'curves': {'A': 'kyle101', 'B': 'kyle134'},
+                'intervals': 30, 'pickupMin': 200, 'pickupMax': 600, 
+                'coordMaxAmps': 3000, 'minCoordTime': 12}
+    sequence.update(changes)
+    return sequence
+
+#the sequence at one pickup, one fault current at a time. returns the peak
+#heat over the fast shots, whether the fuse is saved and the worst margin of
+#the first slow shot, over the currents every curve covers
+def simulateSequence(library, sequence, pickupCurrent):
+    reclosing = rc.ReclosingSequence(sequence, library)
+    meltCurve, clearCurve = reclosing.meltCurve, reclosing.clearCurve
+    shotCurves = [library.recloserCurves[reclosing.curveNumbers[letter][0]]
+                  .scaled(pickupCurrent) for letter in reclosing.shots]
+    
+    lowAmps = max(meltCurve.currents[0], clearCurve.currents[0])
+    ratio = max(lowAmps, reclosing.coordMaxAmps) / lowAmps
+    peakHeat = 0.0
+    saved = True
+    worstMargin = math.inf
+    for k in range(rc.sequencePoints):
+        current = lowAmps * ratio ** (k / (rc.sequencePoints - 1))
+        if any(not curve[0][0] <= current <= curve[len(curve)-1][0] 
+               for curve in shotCurves + [meltCurve, clearCurve]):
+            continue
+        meltTime = meltCurve.interpolate(current)
+        
+        heat = 0.0
+        for n in range(reclosing.fastShots):
+            heat += shotCurves[n].interpolate(current) / meltTime
+            peakHeat = max(peakHeat, heat)
+            saved = saved and heat < rc.fuseDamageFactor
+            heat *= math.exp(-reclosing.intervals[n] / rc.fuseCoolingTime)
+        
+        clearing = (max(1 - heat, 0) * meltTime + 
+                    clearCurve.interpolate(current) - meltTime)
+        slowTime = shotCurves[reclosing.fastShots].interpolate(current)
+        worstMargin = min(worstMargin, slowTime - clearing)
+    
+    return peakHeat, saved, worstMargin
+
+@pytest.mark.skipif(rc.np is None, reason="numpy is not installed")
+@pytest.mark.parametrize('changes, savedAll', [
+        ({}, True),
+        ({'coordMaxAmps': 4000}, False),
+        ({'pattern': '2A2B', 'intervals': [30, 60, 60]}, None),
+        ({'pattern': '2A2B', 'intervals': 600}, None)])
+def test_sequenceHeat(library, changes, savedAll):
+    sequence = getSequence(**changes)
+    result = rc.runSequence(sequence, library)
+    assert result['error'] is None
+    assert result['fastShots'] == int(sequence['pattern'][0])
+    
+    settings = {setting['pickup']: setting for setting in result['settings']}
+    assert settings
+    for pickupCurrent in range(sequence['pickupMin'], 
+                               sequence['pickupMax'] + 1, rc.ampStep):
+        peakHeat, saved, worstMargin = simulateSequence(library, sequence, 
+                                                        pickupCurrent)
+        if abs(worstMargin - sequence['minCoordTime']) < 1e-6: continue
+        assert (pickupCurrent in settings) == (
+                worstMargin >= sequence['minCoordTime'])
+        if pickupCurrent not in settings: continue
+        
+        setting = settings[pickupCurrent]
+        assert setting['peakHeat'] == pytest.approx(peakHeat, rel=1e-9)
+        assert setting['worstMargin'] == pytest.approx(worstMargin, rel=1e-9)
+        assert setting['saved'] == saved
+        if savedAll is not None: assert saved == savedAll
+    
+    assert result['saved'] == sum(setting['saved'] 
+                                  for setting in result['settings'])
+
+#two shots on A heat the fuse more than one, and cool off between them
+@pytest.mark.skipif(rc.np is None, reason="numpy is not installed")
+def test_sequenceHeatAdds(library):
+    one = rc.runSequence(getSequence(), library)['settings']
+    two = rc.runSequence(getSequence(pattern='2A1B', intervals=30), 
+                         library)['settings']
+    cold = rc.runSequence(getSequence(pattern='2A1B', intervals=[1e6, 30]), 
+                          library)['settings']
+    oneHeat = {setting['pickup']: setting['peakHeat'] for setting in one}
+    for setting in two:
+        assert setting['peakHeat'] > oneHeat[setting['pickup']]
+    for setting in cold:
+        assert setting['peakHeat'] == pytest.approx(oneHeat[setting['pickup']])
+
+@pytest.mark.parametrize('pattern, letters, shots, fastShots', [
+        ('2A2B', ['A', 'B'], [0, 0, 1, 1], 2),
+        ('0A1B', ['A', 'B'], [1], 0),
+        ('1a2b1a', ['A', 'B'], [0, 1, 1, 0], 1),
+        ('3A', ['A'], [0, 0, 0], 0),
+        ('2A0B', ['A', 'B'], [0, 0], 0),
+        ('A2B', ['A', 'B'], [0, 1, 1], 1)])
+def test_sequencePattern(library, pattern, letters, shots, fastShots):
+    reclosing = rc.ReclosingSequence(getSequence(
+            pattern=pattern, intervals=30, 
+            curves={'A': 'kyle101', 'B': 'kyle134'}), library)
+    assert reclosing.letters == letters
+    assert reclosing.shots == shots
+    assert reclosing.fastShots == fastShots
+    assert reclosing.intervals == [30] * (len(shots) - 1)
+
+@pytest.mark.parametrize('changes, message', [
+        ({'pattern': ''}, "pattern '' isn't like 2A2B"),
+        ({'pattern': 'A2'}, "pattern 'A2' isn't like 2A2B"),
+        ({'pattern': '2A-2B'}, "pattern '2A-2B' isn't like 2A2B"),
+        ({'pattern': '0A'}, "pattern '0A' has no shots"),
+        ({'pattern': '1A1C'}, "no recloser curve for C"),
+        ({'curves': {'A': 'kyle101', 'B': 'nothing'}}, 
+         "unknown recloser curve 'nothing'"),
+        ({'curves': {'A': 'kyle101', 'B': [5]}}, "unknown recloser curve '5'"),
+        ({'intervals': [30, 30]}, "2 shots need 1 reclose intervals"),
+        ({'pattern': '2A2B', 'intervals': [30]}, 
+         "4 shots need 3 reclose intervals"),
+        ({'intervals': None}, "missing field 'intervals'"),
+        ({'intervals': 'soon'}, "field 'intervals' is not a number: soon"),
+        ({'intervals': -5}, "field 'intervals' must be at least 0"),
+        ({'downstream': 'SM-4_100E'}, "unknown fuse curve 'SM-4_100E'"),
+        ({'downstream': 'kyle101'}, "unknown fuse curve 'kyle101'"),
+        ({'pickupMin': 0}, "field 'pickupMin' must be at least 1")])
+def test_sequenceBadSequence(library, changes, message):
+    result = rc.runSequence(getSequence(**changes), library)
+    assert result['error'] == message
+    assert result['settings'] == []
+
+def test_sequenceMissingFuseCurve(libraryDir):
+    result = rc.runSequence(getSequence(downstream='POSI_65K_TC'), 
+                            rc.CurveLibrary(str(libraryDir)))
+    assert result['error'] == "fuse curve 'POSI_65K_MM' is missing"
+
+#studies that can't be run are reported in the result, with what's wrong
+@pytest.mark.parametrize('changes, message', [
+        (['not a study'], 'a study must be an object, not ["not a study"]'),
+        ({'coordMaxAmps': 0}, "field 'coordMaxAmps' must be at least 1"),
+        ({'coordMaxAmps': -100}, "field 'coordMaxAmps' must be at least 1"),
+        ({'pickupMin': 0}, "field 'pickupMin' must be at least 1"),
+        ({'pickupMin': 600, 'pickupMax': 50}, 
+         "field 'pickupMax' must be at least 600"),
+        ({'pickupMax': 'lots'}, "field 'pickupMax' is not a number: lots"),
+        ({'minCoordTime': None}, "missing field 'minCoordTime'"),
+        ({'upstream': 'nothing'}, "unknown upstream curve 'nothing'")])
+def test_studyErrors(library, changes, message):
+    if isinstance(changes, dict): study = dict(serverStudy, **changes)
+    else: study = changes
+    result = rc.Coordinator(library).runStudy(study)
+    assert result['error'] == message
+    assert result['solutions'] == []
+
+#a single pickup is still a range
+def test_studyOnePickup(library):
+    result = rc.Coordinator(library).runStudy(
+            dict(serverStudy, pickupMin=300, pickupMax=300))
+    assert result['error'] is None
+    assert result['solutions'] == [
+            dict(row, pickupMin=300, pickupMax=300) 
+            for row in rc.Coordinator(library).runStudy(serverStudy)[
+                    'solutions'] if row['pickupMin'] <= 300 <= row['pickupMax']]
+
+#a streamed study with a report is swept once, for the report, and its rows
+#come from that sweep even with the result cache off
+def test_streamedReportSweepsOnce(library, tmp_path, monkeypatch):
+    coordinator = rc.Coordinator(library)
+    expected = coordinator.runStudy(serverStudy)
+    
+    sweeps = []
+    sweepSolutions = rc.sweepSolutions
+    def countSweeps(*args):
+        sweeps.append(args)
+        return sweepSolutions(*args)
+    def noStream(*args):
+        raise AssertionError("the study was swept again for its rows")
+    monkeypatch.setattr(rc, 'sweepSolutions', countSweeps)
+    monkeypatch.setattr(rc, 'iterSolutionRanges', noStream)
+    
+    stream = rc.ResultStream(str(tmp_path / 'rows.jsonl'))
+    try:
+        result = coordinator.runStudy(
+                dict(serverStudy, marginReport=str(tmp_path / 'margins.csv')),
+                stream=stream, allowFiles=True)
+    finally:
+        stream.close()
+    assert result['error'] is None
+    assert len(sweeps) == 1
+    assert os.path.exists(tmp_path / 'margins.csv')
+    
+    with open(tmp_path / 'rows.jsonl') as f:
+        rows = [json.loads(line) for line in f]
+    assert rows == [dict(name=expected['name'], **row) 
+                    for row in expected['solutions']]
+
+#one sample of a setting by hand: every curve is copied with that sample's
+#current and time factors, and checked at its data points like testCoord().
+#returns whether it fails downstream and upstream
+def sampleFailures(coordCurves, setting, factors, maxAmps, minCoordTime):
+    downstreamCurve, upstreamCurve, recloserCurves = coordCurves
+    n, pickupCurrent, adder = setting
+    def scale(curve, ampFactor, timeFactor, pickup=1):
+        return rc.CompiledCurve([[current * pickup * ampFactor, 
+                                  time * timeFactor] 
+                                 for current, time in curve])
+    downCurve = scale(downstreamCurve, *factors['downstream'])
+    upCurve = scale(upstreamCurve, *factors['upstream'])
+    recCurve = scale(recloserCurves[n], *factors['recloser'], 
+                     pickup=pickupCurrent)
+    down = min(rc.getPointMargin(downCurve, recCurve, 'd', maxAmps),
+               rc.getPointMargin(recCurve, downCurve, 'u', maxAmps))
+    up = min(rc.getPointMargin(upCurve, recCurve, 'u', maxAmps),
+             rc.getPointMargin(recCurve, upCurve, 'd', maxAmps))
+    return down + adder < minCoordTime, up - adder < minCoordTime
+
+#the bucketed bounds only skip samples that can't fail, so every setting's
+#probabilities match a sample by sample check. 7 buckets leaves a short one
+@pytest.mark.skipif(rc.np is None, reason="numpy is not installed")
+@pytest.mark.parametrize('buckets', [1, 7, 64])
+@pytest.mark.parametrize('adderRange, every', [(None, 8), ((0, 30), 40)])
+def test_toleranceMatchesSamples(library, monkeypatch, buckets, adderRange,
+                                 every):
+    monkeypatch.setattr(rc, 'toleranceSamples', 40)
+    monkeypatch.setattr(rc, 'toleranceBuckets', buckets)
+    coordCurves = rc.Coordinator(library).getCoordCurves('SM-4_100E_TC', 
+                                                         'EX-INV_P3-T6-C160')
+    solutionSet = rc.sweepSolutions(coordCurves, (50, 600, 10000), 12, 
+                                    adderRange)[::every]
+    report = rc.getToleranceReport(coordCurves, solutionSet, 10000, 12)
+    assert report['samples'] == 40
+    assert [setting[:2] for setting in report['settings']] == [
+            tuple(solution[:2]) for solution in solutionSet]
+    
+    samples = rc.getToleranceSamples(40)
+    failing = 0
+    for k, setting in enumerate(report['settings']):
+        if adderRange is not None:
+            assert solutionSet[k][2] <= setting[2] <= solutionSet[k][3]
+        fails = [sampleFailures(coordCurves, setting, 
+                                {curveName: (ampFactors[s], timeFactors[s])
+                                 for curveName, (ampFactors, timeFactors) 
+                                 in samples.items()}, 10000, 12)
+                 for s in range(40)]
+        assert report['probability'][k] == sum(
+                down or up for down, up in fails) / 40
+        assert report['downProbability'][k] == sum(
+                down for down, up in fails) / 40
+        assert report['upProbability'][k] == sum(
+                up for down, up in fails) / 40
+        failing += report['probability'][k] > 0
+    #the check means nothing unless some settings do fail
+    assert failing > 0
+
+#with no tolerance every sample is the curves themselves, so settings that
+#coordinate never fail, and an adder range keeps its middle adder
+@pytest.mark.skipif(rc.np is None, reason="numpy is not installed")
+@pytest.mark.parametrize('adderRange', [None, (0, 30)])
+def test_toleranceZero(library, monkeypatch, adderRange):
+    monkeypatch.setattr(rc, 'toleranceSamples', 40)
+    monkeypatch.setattr(rc, 'curveTolerances', 
+                        {curveName: {'current': None, 'time': None}
+                         for curveName in rc.curveTolerances})
+    coordCurves = rc.Coordinator(library).getCoordCurves('SM-4_100E_TC', 
+                                                         'EX-INV_P3-T6-C160')
+    solutionSet = rc.sweepSolutions(coordCurves, (50, 600, 10000), 12, 
+                                    adderRange)
+    report = rc.getToleranceReport(coordCurves, solutionSet, 10000, 12)
+    assert len(report['settings']) == len(solutionSet) > 0
+    assert report['probability'] == [0.0] * len(solutionSet)
+    assert report['downProbability'] == [0.0] * len(solutionSet)
+    assert report['upProbability'] == [0.0] * len(solutionSet)
+    if adderRange is not None:
+        assert [setting[2] for setting in report['settings']] == [
+                solution[2] + (solution[3] - solution[2]) // 2 
+                for solution in solutionSet]
+
+#shipped curve files run together into one CAPE export, with a name above
+#the breaker table and other text between blocks. each is (curve type, file,
+#name the export parser should give it)
+exportCurves = [('fuse', 'SM-4_100E_TC', 'SM-4 7.2-14.4 kV Standard 100E_TC'),
+                ('recloser', 'kyle101', 
+                 'DEVICE: Cooper Form 4C RECLOSER CURVE ID: 101'),
+                ('breaker', 'EX-INV_P3-T6-C160', 'FEEDER 12 RELAY'),
+                ('fuse', 'POSI_65K_TC', 'Positrol K Speed 65K_TC'),
+                ('recloser', 'kyle134', 
+                 'DEVICE: Cooper Form 4C RECLOSER CURVE ID: 134'),
+                ('fuse', 'SM-4_100E_TC', 
+                 'SM-4 7.2-14.4 kV Standard 100E_TC (2)')]
+
+def writeExport(exportPath, curves):
+    with open(exportPath, 'wb') as export:
+        for curveType, fileName, curveName in curves:
+            export.write(b"* next curve\r\n\r\n")
+            if curveType == 'breaker':
+                export.write("'{0}'\r\n".format(curveName).encode())
+            with open(os.path.join(os.path.dirname(coordinatorPath), 
+                                   curveType + 'Curves', fileName), 'rb') as f:
+                export.write(f.read())
+        export.write(b"* end of export\r\n")
+
+def parseShippedCurve(curveType, fileName):
+    with open(os.path.join(os.path.dirname(coordinatorPath), 
+                           curveType + 'Curves', fileName)) as f:
+        return rc.parseCurveFile([curveType] + list(f))
+
+#every block of an export parses to the same points as its own curve file
+def test_exportMatchesCurveFiles(tmp_path):
+    writeExport(tmp_path / 'export.txt', exportCurves)
+    exported = list(rc.iterExportCurves(str(tmp_path / 'export.txt')))
+    assert exported == [(curveType, curveName, 
+                         parseShippedCurve(curveType, fileName))
+                        for curveType, fileName, curveName in exportCurves]
+    assert all(len(curveData) > 10 for _, _, curveData in exported)
+
+#export curves join the library next to its curve files, and a name that's
+#already taken is left out
+def test_exportLibrary(libraryDir):
+    os.mkdir(libraryDir / rc.exportFolder)
+    exportPath = libraryDir / rc.exportFolder / 'export.txt'
+    writeExport(exportPath, exportCurves)
+    with open(exportPath, 'ab') as export:
+        export.write(b"'EX-INV_P3-T6-C160'\r\n"
+                     b"No. CURRENT(P.AMPS) TIME   (CYCLES)\r\n"
+                     b" 1         600.000         100.000\r\n"
+                     b" 2        6000.000          10.000\r\n")
+    library = rc.CurveLibrary(str(libraryDir))
+    
+    for curveType, fileName, curveName in exportCurves:
+        assert library.getCurveType(curveName) == curveType
+        assert library.curveData[curveType][curveName] == parseShippedCurve(
+                curveType, fileName)
+    assert library.curveFileLists[0].count('EX-INV_P3-T6-C160') == 1
+    assert library.curveData['breaker']['EX-INV_P3-T6-C160'] == \
+        parseShippedCurve('breaker', 'EX-INV_P3-T6-C160')
+    assert len(library.recloserCurves) == \
+        len(smallLibrary['recloserCurves']) + 2